@@ -12,6 +12,11 @@ import eventlet.wsgi
 import uuid
 import sqlite3
 import json # Added for audit logging
+import hashlib # ETags
+import time
+import base64 # Keyset pagination cursors
+import csv # Catalog export
+import io
 from flask import send_file, after_this_request
 import re
 from database import init_db
@@ -20,7 +25,7 @@ import math # Added for math.ceil
 import secrets # Added for secure token generation
 import shutil
 import click # For CLI arguments
-from functools import wraps
+from functools import wraps, lru_cache
 # import cProfile # Removed
 # import pstats # Removed
 # import io # Removed
@@ -33,7 +38,7 @@ import zipfile
 import tempfile
 import pytz # Added for IST
 from datetime import datetime, timedelta, timezone # Ensured all are here
-from flask import Flask, request, g, jsonify, send_from_directory, has_request_context
+from flask import Flask, request, g, jsonify, send_from_directory, has_request_context, stream_with_context
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 import flask_jwt_extended
@@ -51,6 +56,9 @@ from flask import current_app # For JWT_IDENTITY_CLAIM
 from werkzeug.utils import secure_filename
 from tempfile import NamedTemporaryFile
 import database # Your database.py helper
+from json_provider import FastJSONProvider
+import postgres_backend
+import schema_migrations # Versioned migrations from migrations/
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 # from waitress import serve # Removed Waitress
@@ -148,6 +156,7 @@ INLINE_PRONE_EXTENSIONS = {
 app = Flask(__name__, 
             instance_relative_config=True,
             static_folder=STATIC_FOLDER)
+app.json = FastJSONProvider(app) # orjson-backed jsonify(), same output as Flask's default provider
 
 CORS(app, resources={
     r"/api/*": {
@@ -256,6 +265,25 @@ app.config['CHAT_UPLOAD_FOLDER'] = CHAT_UPLOAD_FOLDER # Added for chat
 app.config['INSTANCE_FOLDER_PATH'] = INSTANCE_FOLDER_PATH # Added for DB backup
 app.config['TMP_LARGE_UPLOADS_FOLDER'] = TMP_LARGE_UPLOADS_FOLDER # For large file chunks
 app.config['MESSAGE_RETENTION_DAYS'] = 180 # Default retention period in days
+app.config['SQL_INSTRUMENTATION'] = True # Per-request query count/time in a Server-Timing header and the debug log
+app.config['SQL_REPEATED_QUERY_THRESHOLD'] = 10 # Same statement this often in one request is logged as a likely N+1
+app.config['SLOW_QUERY_THRESHOLD_MS'] = 100 # Statements at least this slow go to the slow query log (with EXPLAIN QUERY PLAN)
+app.config['SLOW_QUERY_LOG_MAX_ENTRIES'] = 200 # Distinct normalized statements kept by the slow query log
+app.config['DATABASE_POOL_SIZE'] = 8 # Max idle SQLite connections kept for reuse by get_db()
+app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL') # postgresql://... switches get_db() to the experimental PostgreSQL backend
+app.config['LISTING_COUNT_CACHE_SIZE'] = 512 # Listing totals (per filter combination) kept until one of their tables changes
+app.config['LISTING_COUNT_CACHE_TTL'] = 60 # Seconds; backstop for writes made outside this process (e.g. another worker)
+app.config['PERMISSION_DENY_CACHE_SIZE'] = 1024 # Users whose file_permissions denies are kept in memory
+app.config['PERMISSION_DENY_CACHE_TTL'] = 300 # Seconds; backstop for permission changes made by another process
+app.config['CATALOG_CACHE_TTL'] = 300 # Seconds the software/versions snapshot is trusted at most; backstop for writes made by another process
+app.config['HTTP_ETAG_TTL'] = 300 # Seconds an ETag from versioned_response() stays valid at most; backstop for writes made outside this process
+app.config['RESPONSE_CACHE_SIZE'] = 256 # Catalog/lookup response bodies kept by versioned_response()
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024 # Total size bound for those bodies
+app.config['RESPONSE_CACHE_MAX_ENTRY_BYTES'] = 1024 * 1024 # Larger responses (e.g. per_page=1000) are not cached
+app.config['RESPONSE_CACHE_TTL'] = 60 # Seconds; backstop for writes made outside this process
+app.config['SYNC_MAX_CHANGES'] = 1000 # item_changes entries read per /api/sync call; clients follow has_more for the rest
+app.config['ITEM_CHANGE_RETENTION_DAYS'] = 30 # Older item_changes are pruned daily; clients with older tokens reload
+app.config['EXPORT_BATCH_SIZE'] = 500 # Rows fetched and written out per step by /api/admin/export
 
 # --- Scheduler Initialization ---
 # Ensure DATABASE_PATH is set in config, default if not.
@@ -277,6 +305,7 @@ def shutdown_scheduler():
         print("Scheduler shut down.")
 
 atexit.register(shutdown_scheduler)
+atexit.register(database.stop_writers) # Flush queued audit/download/notification writes
 
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
@@ -337,7 +366,8 @@ def _perform_database_backup():
         timestamp = datetime.now(IST).strftime('%Y%m%d_%H%M%S') # Changed to IST
         backup_filename = f"software_dashboard_{timestamp}.db"
         backup_file_path = os.path.join(backup_dir, backup_filename)
-        shutil.copy2(source_db_path, backup_file_path)
+        # Online backup instead of a file copy: with WAL, recent commits may still live in the -wal file.
+        database.backup_database(source_db_path, backup_file_path)
         return True, backup_file_path
     except Exception as e:
         app.logger.error(f"Database backup helper failed: {e}", exc_info=True)
@@ -355,15 +385,341 @@ def update_site_setting(key: str, value: str) -> None:
     """Updates or inserts a setting in the site_settings table."""
     db = get_db()
     db.execute(
-        "INSERT OR REPLACE INTO site_settings (setting_key, setting_value) VALUES (?, ?)",
+        # ON CONFLICT rather than INSERT OR REPLACE, which PostgreSQL doesn't have
+        "INSERT INTO site_settings (setting_key, setting_value) VALUES (?, ?) "
+        "ON CONFLICT (setting_key) DO UPDATE SET setting_value = excluded.setting_value",
         (key, value)
     )
     db.commit()
 
+slow_query_log = database.SlowQueryLog(
+    threshold_ms=app.config['SLOW_QUERY_THRESHOLD_MS'],
+    max_entries=app.config['SLOW_QUERY_LOG_MAX_ENTRIES'],
+    log=app.logger.warning,
+)
+
+# Version key for users.username, the only users column the listings read. Their caches and
+# ETags depend on it instead of on 'users', which every login and socket connect writes
+# (is_online, last_seen); it is bumped where a username changes or a user is deleted.
+USERNAMES = ('users', 'username')
+
+listing_count_cache = database.VersionedCache(
+    max_entries=app.config['LISTING_COUNT_CACHE_SIZE'],
+    ttl=app.config['LISTING_COUNT_CACHE_TTL'],
+)
+
+def cached_count(db, count_query: str, params, tables: list) -> int:
+    """
+    Runs a listing's COUNT query, reusing the last result for the same query and params
+    while none of `tables` (every table the query reads) has been written to since.
+    """
+    if db.db_path is None: # PostgreSQL: writes are not tracked by database.table_versions
+        return db.execute(count_query, tuple(params)).fetchone()[0]
+    key = (count_query, tuple(params))
+    versions = database.table_versions.snapshot(tables) # Taken before the query, so a racing write invalidates it
+    total = listing_count_cache.get(key, versions)
+    if total is None:
+        total = db.execute(count_query, tuple(params)).fetchone()[0]
+        listing_count_cache.put(key, versions, total)
+    return total
+
+def _as_id(value):
+    # Ids reach the catalog from JSON, form fields and rows; SQL compared them numerically.
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _sort_desc_nulls_last(rows, key):
+    # ORDER BY key DESC as SQLite does it: NULLs last
+    rows.sort(key=lambda row: (row[key] is not None, row[key]), reverse=True)
+
+class Catalog:
+    """
+    Read-only snapshot of the software and versions tables. Both are tiny and read by almost
+    every handler, so ids and names are resolved from get_catalog() instead of with a query
+    each. Rows are plain dicts shared between requests; don't modify them.
+    """
+
+    def __init__(self, software_rows: list, version_rows: list):
+        self.software = {row['id']: row for row in software_rows}
+        self.software_by_name = {row['name']: row for row in software_rows}
+        self.software_list = sorted(software_rows, key=lambda row: row['name']) # ORDER BY name
+        self.versions = {row['id']: row for row in version_rows}
+        self.versions_by_software = {}
+        self._version_ids = {}
+        for row in version_rows: # By id, so a duplicated version_number resolves to the oldest row
+            self.versions_by_software.setdefault(row['software_id'], []).append(row)
+            self._version_ids.setdefault((row['software_id'], row['version_number']), row['id'])
+        for rows in self.versions_by_software.values():
+            # ORDER BY release_date DESC, version_number DESC
+            _sort_desc_nulls_last(rows, 'version_number')
+            _sort_desc_nulls_last(rows, 'release_date')
+
+    def get_software(self, software_id):
+        return self.software.get(_as_id(software_id))
+
+    def find_software(self, name: str):
+        return self.software_by_name.get(name)
+
+    def get_version(self, version_id, software_id=None):
+        """The version row, or None if it doesn't exist (or doesn't belong to software_id, if given)."""
+        version = self.versions.get(_as_id(version_id))
+        if version is None or (software_id is not None and version['software_id'] != _as_id(software_id)):
+            return None
+        return version
+
+    def find_version_id(self, software_id, version_number: str):
+        return self._version_ids.get((_as_id(software_id), version_number))
+
+    def versions_for(self, software_id) -> list:
+        return self.versions_by_software.get(_as_id(software_id), [])
+
+CATALOG_TABLES = ['software', 'versions']
+
+catalog_cache = database.VersionedCache(max_entries=1, ttl=app.config['CATALOG_CACHE_TTL'])
+
+def load_catalog(db) -> Catalog:
+    return Catalog(
+        database.fetch_dicts(db.execute("SELECT id, name, description FROM software ORDER BY id")),
+        database.fetch_dicts(db.execute("SELECT id, software_id, version_number, release_date FROM versions ORDER BY id")),
+    )
+
+def get_catalog(db) -> Catalog:
+    """
+    The shared Catalog, rebuilt once software or versions have changed. A connection with
+    uncommitted writes to either table gets a private snapshot that includes them.
+    """
+    if db.db_path is None: # PostgreSQL: writes are not tracked by database.table_versions
+        return load_catalog(db)
+    if db.pending_write_tables and not db.pending_write_tables.isdisjoint(CATALOG_TABLES):
+        return load_catalog(db)
+    versions = database.table_versions.snapshot(CATALOG_TABLES)
+    catalog = catalog_cache.get('catalog', versions)
+    if catalog is None:
+        catalog = load_catalog(db)
+        catalog_cache.put('catalog', versions, catalog)
+    return catalog
+
+permission_deny_cache = database.VersionedCache(
+    max_entries=app.config['PERMISSION_DENY_CACHE_SIZE'],
+    ttl=app.config['PERMISSION_DENY_CACHE_TTL'],
+)
+
+class FileDenies:
+    """
+    One user's file_permissions rows, {(file_type, file_id): (can_view, can_download)}.
+    Permissions are default-allow with explicit deny, so these are usually few; the ids a
+    listing has to hide or mark as not downloadable are passed to SQL as one JSON array
+    parameter per file type, instead of joining file_permissions for every row.
+    """
+
+    def __init__(self, entries: dict):
+        self.entries = entries
+        hidden, undownloadable = {}, {}
+        for (file_type, file_id), (can_view, can_download) in entries.items():
+            if can_view != 1:
+                hidden.setdefault(file_type, []).append(file_id)
+            if can_download == 0:
+                undownloadable.setdefault(file_type, []).append(file_id)
+        self._hidden_json = {file_type: json.dumps(sorted(ids)) for file_type, ids in hidden.items()}
+        self._undownloadable_json = {file_type: json.dumps(sorted(ids)) for file_type, ids in undownloadable.items()}
+        # Same for any two users whose listings are filtered the same way (used in ETags)
+        self.fingerprint = hashlib.sha1(json.dumps([self._hidden_json, self._undownloadable_json], sort_keys=True).encode()).hexdigest()
+
+    def can_view(self, file_type: str, file_id: int) -> bool:
+        entry = self.entries.get((file_type, file_id))
+        return entry is None or entry[0] == 1
+
+    def can_download(self, file_type: str, file_id: int) -> bool:
+        entry = self.entries.get((file_type, file_id))
+        return entry is None or entry[1] != 0
+
+    def view_condition(self, file_type: str, id_column: str):
+        """(sql, params) for a WHERE condition dropping hidden rows, or None if none are hidden."""
+        ids = self._hidden_json.get(file_type)
+        if ids is None:
+            return None
+        return f"{id_column} NOT IN (SELECT value FROM json_each(?))", [ids]
+
+    def hidden_ids_json(self, file_type: str):
+        """The hidden ids of file_type as one JSON array parameter, or None if none are hidden."""
+        return self._hidden_json.get(file_type)
+
+    def downloadable_column(self, file_type: str, id_column: str):
+        """(sql, params) for the is_downloadable select column."""
+        ids = self._undownloadable_json.get(file_type)
+        if ids is None:
+            return "1", []
+        return f"(CASE WHEN {id_column} IN (SELECT value FROM json_each(?)) THEN 0 ELSE 1 END)", [ids]
+
+NO_FILE_DENIES = FileDenies({}) # Anonymous users: nothing is denied
+
+# Everything a user's effective permissions are resolved from (users.role is handled by
+# discarding the user's entry when their role changes).
+PERMISSION_TABLES = ['file_permissions', 'group_file_permissions', 'role_file_permissions', 'permission_group_members']
+
+# The user's own rows (from_rule = 0), then the rules of their groups and of their role.
+EFFECTIVE_PERMISSIONS_SQL = """
+    SELECT file_type, file_id, can_view, can_download, 0 AS from_rule FROM file_permissions WHERE user_id = ?
+    UNION ALL
+    SELECT gfp.file_type, gfp.file_id, gfp.can_view, gfp.can_download, 1
+    FROM permission_group_members pgm JOIN group_file_permissions gfp ON gfp.group_id = pgm.group_id
+    WHERE pgm.user_id = ?
+    UNION ALL
+    SELECT rfp.file_type, rfp.file_id, rfp.can_view, rfp.can_download, 1
+    FROM users u JOIN role_file_permissions rfp ON rfp.role = u.role
+    WHERE u.id = ?
+"""
+
+def resolve_file_permissions(rows) -> dict:
+    """
+    Merges EFFECTIVE_PERMISSIONS_SQL rows into {(file_type, file_id): (can_view, can_download)}:
+    a user's own row wins, otherwise the most restrictive of their group/role rules applies.
+    """
+    entries, rules = {}, {}
+    for file_type, file_id, can_view, can_download, from_rule in rows:
+        key = (file_type, file_id)
+        if not from_rule:
+            entries[key] = (can_view, can_download)
+        elif key in rules:
+            rules[key] = (min(rules[key][0], can_view), min(rules[key][1], can_download))
+        else:
+            rules[key] = (can_view, can_download)
+    for key, rule in rules.items():
+        entries.setdefault(key, rule)
+    return entries
+
+def get_file_denies(db, user_id) -> FileDenies:
+    """The user's FileDenies (own rows plus group/role rules), cached until any of them change."""
+    if not user_id:
+        return NO_FILE_DENIES
+    versions = database.table_versions.snapshot(PERMISSION_TABLES)
+    denies = permission_deny_cache.get(user_id, versions) if db.db_path is not None else None
+    if denies is None:
+        rows = db.execute(EFFECTIVE_PERMISSIONS_SQL, (user_id, user_id, user_id)).fetchall()
+        denies = FileDenies(resolve_file_permissions(rows))
+        if db.db_path is not None: # PostgreSQL: writes are not tracked by database.table_versions
+            permission_deny_cache.put(user_id, versions, denies)
+    return denies
+
+favorites_fingerprint_cache = database.VersionedCache(
+    max_entries=app.config['PERMISSION_DENY_CACHE_SIZE'],
+    ttl=app.config['PERMISSION_DENY_CACHE_TTL'],
+)
+
+def get_favorites_fingerprint(db, user_id) -> str:
+    """
+    Digest of the user's user_favorites rows (listings return their ids as favorite_id); the
+    same for every user without favorites. Cached until the user's favorites change.
+    """
+    if not user_id:
+        return ''
+    versions = database.table_versions.snapshot([('user_favorites', user_id)])
+    fingerprint = favorites_fingerprint_cache.get(user_id, versions)
+    if fingerprint is None:
+        rows = db.execute("SELECT id, item_type, item_id FROM user_favorites WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        fingerprint = hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest() if rows else ''
+        favorites_fingerprint_cache.put(user_id, versions, fingerprint)
+    return fingerprint
+
+response_cache = database.VersionedCache(
+    max_entries=app.config['RESPONSE_CACHE_SIZE'],
+    ttl=app.config['RESPONSE_CACHE_TTL'],
+    max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES'],
+)
+
+def versioned_response(tables: list, per_user: bool = False):
+    """
+    ETags and a shared response cache for a read-only view, both keyed by the view, its
+    arguments and query string and (with per_user) the caller's permission and favorites
+    fingerprints, and valid while database.table_versions of `tables` (every table the view
+    reads) are unchanged. A request whose If-None-Match carries the current ETag gets a 304;
+    otherwise a cached 200 body is reused if there is one. Either way the view doesn't run.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            db = get_db()
+            if db.db_path is None: # PostgreSQL: writes are not tracked by database.table_versions
+                return fn(*args, **kwargs)
+            versions = database.table_versions.snapshot(tables) # Taken before the view runs, so a racing write invalidates
+            key = [request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True)))]
+            if per_user:
+                user_id = None
+                try:
+                    verify_jwt_in_request(optional=True)
+                    identity = get_jwt_identity()
+                    user_id = int(identity) if identity else None
+                except Exception:
+                    pass # Invalid or expired token: the view treats the caller as anonymous too
+                # Users who would see the same rows share the entry (e.g. everyone without denies or favorites).
+                key += [get_file_denies(db, user_id).fingerprint, get_favorites_fingerprint(db, user_id)]
+            key = tuple(key)
+            # The process id because table versions restart at 0; the time bucket as a backstop
+            # for writes made outside this process.
+            etag = hashlib.sha1(repr((database.table_versions.instance_id, int(time.time() // app.config['HTTP_ETAG_TTL']),
+                                      key, versions)).encode()).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                cached = response_cache.get(key, versions)
+                if cached is not None:
+                    response = app.response_class(cached[0], mimetype=cached[1])
+                else:
+                    response = app.make_response(fn(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    if len(body) <= app.config['RESPONSE_CACHE_MAX_ENTRY_BYTES']:
+                        response_cache.put(key, versions, (body, response.mimetype), size=len(body))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+            if per_user:
+                response.vary.add('Authorization')
+            return response
+        return wrapper
+    return decorator
+
+def readonly_db(fn):
+    """
+    Marks a GET view as safe for the read-only connection lane: get_db() will then hand
+    it (and the auth decorators wrapping it) a query_only connection from a separate pool.
+    Only use on views that never write through get_db(); queued writes such as
+    log_audit_action() still go through the writer and are unaffected.
+    """
+    fn.readonly_db = True
+    return fn
+
+def _wants_readonly_db():
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    view = app.view_functions.get(request.endpoint)
+    return getattr(view, 'readonly_db', False)
+
 def get_db():
     if 'db' not in g:
-        g.db = database.get_db_connection(app.config['DATABASE']) # Pass DB path
+        # Borrow a preconfigured (WAL, synchronous=NORMAL, ...) connection from the pool.
+        # It is handed back in close_db() at the end of the app context.
+        db_path = app.config['DATABASE']
+        pool_size = app.config['DATABASE_POOL_SIZE']
+        conn = None
+        if postgres_backend.is_postgres_url(app.config['DATABASE_URL']):
+            conn = postgres_backend.get_pool(app.config['DATABASE_URL'], max_idle=pool_size).acquire()
+        elif _wants_readonly_db():
+            try:
+                conn = database.get_pool(db_path, max_idle=pool_size, readonly=True).acquire()
+            except sqlite3.Error as e:
+                app.logger.warning(f"Read-only connection unavailable, using read-write pool: {e}")
+        if conn is None:
+            conn = database.get_pool(db_path, max_idle=pool_size).acquire()
+        g.db = conn
         g.db.row_factory = sqlite3.Row
+        if app.config['SQL_INSTRUMENTATION'] and has_request_context():
+            if 'query_stats' not in g:
+                g.query_stats = database.QueryStats(label=f"{request.method} {request.path}", slow_query_log=slow_query_log)
+            g.db.query_stats = g.query_stats
     return g.db
 
 # --- Audit Log Helper ---
@@ -418,11 +774,11 @@ def log_audit_action(action_type: str, target_table: str = None, target_id: int
 
     try:
         db = get_db()
-        db.execute("""
+        # Queued on the single writer and committed in a batch with other pending writes.
+        database.execute_write(db, """
             INSERT INTO audit_logs (user_id, username, action_type, target_table, target_id, details, timestamp)
             VALUES (?, ?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
         """, (final_user_id, final_username, action_type, target_table, target_id, details_json))
-        db.commit()
     except sqlite3.Error as e_db:
         app.logger.error(f"Audit log: Database error logging action '{action_type}': {e_db}")
         # Depending on policy, you might want to rollback if part of a larger transaction elsewhere,
@@ -480,12 +836,11 @@ def _log_download_activity(filename_to_serve: str, item_type: str, current_db: s
 
         ip_address = request.remote_addr
 
-        # Insert into download_log
-        current_db.execute("""
+        # Insert into download_log (queued on the single writer)
+        database.execute_write(current_db, """
             INSERT INTO download_log (file_id, file_type, user_id, ip_address, download_timestamp)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
         """, (item_id, item_type, user_id_for_log, ip_address))
-        current_db.commit()
         app.logger.info(f"Download logged: File '{filename_to_serve}', Type '{item_type}', UserID '{user_id_for_log}', IP '{ip_address}'")
 
     except sqlite3.Error as e_db:
@@ -605,6 +960,39 @@ def initialize_scheduler_and_backups(current_app):
     except Exception as e:
         current_app.logger.error(f"Error starting background scheduler: {e}", exc_info=True)
 
+# --- Stored Timestamp -> ISO 8601 ---
+# Timestamps are stored as 'YYYY-MM-DD HH:MM:SS' text: IST for most tables, UTC for chat
+# tables and users.last_seen (CURRENT_TIMESTAMP). The same values repeat across rows and
+# across requests for the same page, so these conversions are memoized on the raw string.
+# The canonical form is converted by slicing (IST is a fixed +05:30 offset); strptime is
+# only used for anything else, such as values with fractional seconds.
+_DB_TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+def _parse_db_timestamp(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+@lru_cache(maxsize=65536)
+def ist_db_timestamp_to_iso(value: str) -> str:
+    """IST-stored timestamp -> ISO 8601 with +05:30. Raises ValueError if unparseable."""
+    if _DB_TIMESTAMP_RE.match(value):
+        return f"{value[:10]}T{value[11:]}+05:30"
+    return IST.localize(_parse_db_timestamp(value)).isoformat()
+
+@lru_cache(maxsize=65536)
+def utc_db_timestamp_to_iso(value: str) -> str:
+    """UTC-stored timestamp -> ISO 8601 with +00:00. Raises ValueError if unparseable."""
+    if _DB_TIMESTAMP_RE.match(value):
+        return f"{value[:10]}T{value[11:]}+00:00"
+    return UTC.localize(_parse_db_timestamp(value)).isoformat()
+
+@lru_cache(maxsize=65536)
+def utc_db_timestamp_to_ist_iso(value: str) -> str:
+    """UTC-stored timestamp (chat tables) -> IST ISO 8601 with +05:30. Raises ValueError if unparseable."""
+    return UTC.localize(_parse_db_timestamp(value)).astimezone(IST).isoformat()
+
 # Helper function to convert specific timestamp fields in a dictionary to IST ISO format
 def convert_timestamps_to_ist_iso(row_dict, timestamp_keys):
     if not row_dict:
@@ -613,15 +1001,7 @@ def convert_timestamps_to_ist_iso(row_dict, timestamp_keys):
         original_value_str = row_dict.get(key)
         if isinstance(original_value_str, str) and original_value_str:
             try:
-                # Try parsing with microseconds first, then without
-                try:
-                    naive_dt = datetime.strptime(original_value_str, '%Y-%m-%d %H:%M:%S.%f')
-                except ValueError:
-                    naive_dt = datetime.strptime(original_value_str, '%Y-%m-%d %H:%M:%S')
-
-                # Localize the naive datetime (assumed to be stored as IST representation) to IST
-                ist_aware_dt = IST.localize(naive_dt)
-                row_dict[key] = ist_aware_dt.isoformat()
+                row_dict[key] = ist_db_timestamp_to_iso(original_value_str)
             except ValueError as e:
                 app.logger.warning(f"Timestamp conversion: Could not parse timestamp string '{original_value_str}' for key '{key}'. Error: {e}. Leaving original.")
             except Exception as e_global: # Catch any other unexpected error during conversion
@@ -640,6 +1020,78 @@ def convert_timestamps_to_ist_iso(row_dict, timestamp_keys):
 
     return row_dict
 
+# --- Date Range Helpers ---
+# Timestamps are stored as IST 'YYYY-MM-DD HH:MM:SS' text, which sorts chronologically.
+# Day filters are therefore written as half-open ranges on the bare column
+# (col >= day_range_start(from) AND col < day_range_end(to)) so SQLite can use an index
+# range scan; wrapping the column in date() forces it to evaluate every row.
+def day_range_start(date_str: str) -> str:
+    """Validates a YYYY-MM-DD string and returns it as an inclusive lower bound."""
+    return datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+def day_range_end(date_str: str) -> str:
+    """Exclusive upper bound covering all of YYYY-MM-DD, i.e. the following day."""
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+# --- Keyset (Cursor) Pagination ---
+# Catalog listings accept an opt-in `cursor` parameter (the `next_cursor` of the previous
+# page) as an alternative to `page`. It carries the last row's sort value and id, so the
+# next page starts with an index seek on (sort column, id) instead of reading and discarding
+# OFFSET rows, and no COUNT query is run. Both modes order by (sort column, id) so they
+# agree. SQLite puts NULLs first when ascending and last when descending; the seek follows that.
+def encode_page_cursor(sort_by: str, sort_order: str, sort_value, row_id: int) -> str:
+    payload = json.dumps([sort_by, sort_order, sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """Returns (sort_value, row_id). Raises ValueError if malformed or issued for another sort."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort_by, cursor_sort_order, sort_value, row_id = json.loads(payload)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order) or not isinstance(row_id, int):
+        raise ValueError("Cursor does not match sort_by/sort_order.")
+    return sort_value, row_id
+
+def keyset_conditions(sort_column: str, id_column: str, sort_order: str, sort_value, row_id: int) -> list:
+    """
+    Returns the (sql, params) conditions that together select the rows after
+    (sort_value, row_id) in ORDER BY sort_column <sort_order>, id_column <sort_order>.
+    They cover consecutive parts of that order and are meant to be run one after another
+    (see fetch_keyset_rows): a single OR'ed condition such as "... OR col IS NULL" would
+    stop SQLite from seeking in the index and make it scan instead.
+    """
+    if sort_column == id_column:
+        return [(f"{id_column} > ?" if sort_order == 'asc' else f"{id_column} < ?", [row_id])]
+    if sort_order == 'asc':
+        if sort_value is None:
+            return [(f"{sort_column} IS NULL AND {id_column} > ?", [row_id]), (f"{sort_column} IS NOT NULL", [])]
+        return [(f"{sort_column} >= ? AND ({sort_column} > ? OR {id_column} > ?)", [sort_value, sort_value, row_id])]
+    if sort_value is None:
+        return [(f"{sort_column} IS NULL AND {id_column} < ?", [row_id])]
+    return [(f"{sort_column} <= ? AND ({sort_column} < ? OR {id_column} < ?)", [sort_value, sort_value, row_id]), (f"{sort_column} IS NULL", [])]
+
+def next_page_cursor(rows: list, has_more: bool, sort_by: str, sort_order: str):
+    """Cursor for the page after `rows` (raw DB values, before timestamp conversion), or None."""
+    if not has_more or not rows:
+        return None
+    return encode_page_cursor(sort_by, sort_order, rows[-1][sort_by], rows[-1]['id'])
+
+def fetch_keyset_rows(db, query_template: str, params: list, conditions: list, limit: int) -> list:
+    """
+    Runs query_template (which has a {keyset} marker in its WHERE/HAVING clause and ends
+    with LIMIT ?) once per keyset condition, in order, until `limit` rows are collected.
+    Each condition's params go after `params`, followed by the remaining LIMIT.
+    """
+    rows = []
+    for condition_sql, condition_params in conditions:
+        query = query_template.replace('{keyset}', f"({condition_sql})")
+        rows.extend(database.fetch_dicts(db.execute(query, (*params, *condition_params, limit - len(rows)))))
+        if len(rows) >= limit:
+            break
+    return rows
+
 # --- Configuration Notes for Large File Uploads ---
 # Flask's MAX_CONTENT_LENGTH:
 # Set in Flask app config, e.g., app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024 # 1 GB
@@ -744,11 +1196,26 @@ def is_maintenance_mode_active():
         app.logger.error(f"Unexpected error checking maintenance mode: {e}. Defaulting to False.")
         return False
 
+@app.after_request
+def report_query_stats(response):
+    """Adds a Server-Timing entry for this request's SQL and logs the slowest statements."""
+    stats = g.get('query_stats')
+    if stats is None or stats.count == 0:
+        return response
+    response.headers.add('Server-Timing', f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"')
+    app.logger.debug(
+        f"SQL: {request.method} {request.path} ran {stats.count} queries in {stats.total_ms:.1f} ms; slowest: "
+        + "; ".join(f"{ms:.1f} ms {sql[:200]}" for ms, sql in stats.slowest)
+    )
+    for sql, times in stats.repeated_statements(app.config['SQL_REPEATED_QUERY_THRESHOLD']):
+        app.logger.warning(f"SQL: {request.method} {request.path} ran the same statement {times} times (possible N+1): {sql[:200]}")
+    return response
+
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        database.release_db_connection(db)
 
 def find_user_by_id(user_id):
     return get_db().execute("SELECT id, username, password_hash, email, role, is_active, created_at, password_reset_required, profile_picture_filename FROM users WHERE id = ?", (user_id,)).fetchone()
@@ -965,7 +1432,7 @@ def get_security_questions():
     try:
         db = get_db()
         questions_cursor = db.execute("SELECT id, question_text FROM security_questions ORDER BY id")
-        questions = [dict(row) for row in questions_cursor.fetchall()]
+        questions = database.fetch_dicts(questions_cursor)
         return jsonify(questions), 200
     except Exception as e:
         app.logger.error(f"Error fetching security questions: {e}")
@@ -1003,7 +1470,7 @@ def request_password_reset_info():
             WHERE usa.user_id = ?
             ORDER BY sq.id 
         """, (user['id'],)) # Ensure user['id'] is correct
-        questions = [dict(row) for row in questions_cursor.fetchall()]
+        questions = database.fetch_dicts(questions_cursor)
 
         if len(questions) != 3: # Should ideally always be 3 if registration enforces it
             app.logger.error(f"User {user['username']} (ID: {user['id']}) has {len(questions)} security questions, expected 3.")
@@ -1205,8 +1672,7 @@ def list_users():
 
     # Database Query for Total Count
     try:
-        total_users_cursor = db.execute("SELECT COUNT(*) as count FROM users")
-        total_users = total_users_cursor.fetchone()['count']
+        total_users = cached_count(db, "SELECT COUNT(*) as count FROM users", (), ['users'])
     except Exception as e:
         app.logger.error(f"Error fetching total user count: {e}")
         return jsonify(msg="Error fetching user count."), 500
@@ -1228,7 +1694,7 @@ def list_users():
     
     try:
         users_cursor = db.execute(query_string, (per_page, offset))
-        users_list_raw = [dict(row) for row in users_cursor.fetchall()]
+        users_list_raw = database.fetch_dicts(users_cursor)
         timestamp_keys = ['created_at']
         users_list = [convert_timestamps_to_ist_iso(user, timestamp_keys) for user in users_list_raw]
     except Exception as e:
@@ -1294,6 +1760,7 @@ def change_user_role(user_id):
             details={'old_role': old_role, 'new_role': new_role}
         )
         db.commit()
+        permission_deny_cache.discard(user_id) # Role-level permission rules may differ
         updated_user = find_user_by_id(user_id) # Re-fetch to get the latest data
         return jsonify(id=updated_user['id'], username=updated_user['username'], email=updated_user['email'], role=updated_user['role'], is_active=updated_user['is_active']), 200
     except Exception as e:
@@ -1439,6 +1906,7 @@ def delete_user(user_id):
             details={'deleted_username': deleted_username}
         )
         db.commit()
+        database.table_versions.bump([USERNAMES])
         app.logger.info(f"Super admin {current_super_admin_id} deleted user {user_id}.") # Existing log
         return jsonify(msg="User deleted successfully."), 200
     except sqlite3.IntegrityError as e:
@@ -1679,6 +2147,42 @@ def superadmin_create_user():
         return jsonify(msg=f"An unexpected server error occurred: {e}"), 500
 
 # --- Super Admin File Permission Management Endpoints ---
+PERMISSION_FILE_TYPES = ['document', 'patch', 'link', 'misc_file']
+
+def parse_permission_rules(permissions_data: list, context: str):
+    """
+    Validates a list of {file_id, file_type, can_view, can_download} objects.
+    Returns (rows, errors): (file_id, file_type, can_view, can_download) tuples for the valid
+    items and a message per invalid one. `context` (e.g. "user_id 5") goes into the log lines.
+    """
+    rows, errors = [], []
+    for i, perm_data in enumerate(permissions_data):
+        if not isinstance(perm_data, dict):
+            error_msg = "Each item in the list must be a permission object (dictionary)."
+            app.logger.warning(f"Validation failed for {context}, item {i}: {error_msg}. Data: {perm_data}")
+            errors.append(error_msg)
+            continue
+
+        file_id = perm_data.get('file_id')
+        file_type = perm_data.get('file_type')
+        can_view = perm_data.get('can_view')
+        can_download = perm_data.get('can_download')
+
+        if not isinstance(file_id, int) or file_id <= 0:
+            error_msg = f"Invalid 'file_id': {file_id}. Must be a positive integer."
+        elif not isinstance(file_type, str) or file_type not in PERMISSION_FILE_TYPES:
+            error_msg = f"Invalid 'file_type': {file_type}. Allowed types: {', '.join(PERMISSION_FILE_TYPES)}."
+        elif not isinstance(can_view, bool):
+            error_msg = f"Invalid 'can_view' value for file_id {file_id} (type: {file_type}). Must be boolean."
+        elif not isinstance(can_download, bool):
+            error_msg = f"Invalid 'can_download' value for file_id {file_id} (type: {file_type}). Must be boolean."
+        else:
+            rows.append((file_id, file_type, can_view, can_download))
+            continue
+        app.logger.warning(f"Validation failed for {context}, item {i}: {error_msg}. Data: {perm_data}")
+        errors.append(error_msg)
+    return rows, errors
+
 @app.route('/api/superadmin/users/<int:user_id>/permissions', methods=['GET'])
 @jwt_required()
 @super_admin_required
@@ -1693,7 +2197,7 @@ def get_user_file_permissions(user_id):
             "SELECT id, file_id, file_type, can_view, can_download, created_at, updated_at FROM file_permissions WHERE user_id = ?",
             (user_id,)
         )
-        permissions = [dict(row) for row in permissions_cursor.fetchall()]
+        permissions = database.fetch_dicts(permissions_cursor)
 
         log_audit_action(
             action_type='GET_USER_FILE_PERMISSIONS',
@@ -1741,82 +2245,31 @@ def update_user_file_permissions(user_id):
         app.logger.warning(f"permissions_data is not a list for user_id {user_id}. Type: {type(permissions_data)}")
         return jsonify(msg="Request body must be a list of permission objects."), 400
 
-    # Allowed file types for permissions, align with your application's file types
-    # This should ideally come from a shared constant or configuration if available.
-    VALID_FILE_TYPES_FOR_PERMISSIONS = ['document', 'patch', 'link', 'misc_file']
-    
+    rows, errors = parse_permission_rules(permissions_data, f"user_id {user_id}")
     processed_count = 0
-    errors = []
-
-    for i, perm_data in enumerate(permissions_data):
-        app.logger.info(f"Processing perm_data item {i} for user_id {user_id}: {json.dumps(perm_data)}")
-        if not isinstance(perm_data, dict):
-            error_msg = "Each item in the list must be a permission object (dictionary)."
-            app.logger.warning(f"Validation failed for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}")
-            errors.append(error_msg)
-            continue
-
-        file_id = perm_data.get('file_id')
-        file_type = perm_data.get('file_type')
-        can_view = perm_data.get('can_view')
-        can_download = perm_data.get('can_download')
-
-        # Validation
-        if not isinstance(file_id, int) or file_id <= 0:
-            error_msg = f"Invalid 'file_id': {file_id}. Must be a positive integer."
-            app.logger.warning(f"Validation failed for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}")
-            errors.append(error_msg)
-            continue
-        if not isinstance(file_type, str) or file_type not in VALID_FILE_TYPES_FOR_PERMISSIONS:
-            error_msg = f"Invalid 'file_type': {file_type}. Allowed types: {', '.join(VALID_FILE_TYPES_FOR_PERMISSIONS)}."
-            app.logger.warning(f"Validation failed for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}")
-            errors.append(error_msg)
-            continue
-        if not isinstance(can_view, bool):
-            error_msg = f"Invalid 'can_view' value for file_id {file_id} (type: {file_type}). Must be boolean."
-            app.logger.warning(f"Validation failed for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}")
-            errors.append(error_msg)
-            continue
-        if not isinstance(can_download, bool):
-            error_msg = f"Invalid 'can_download' value for file_id {file_id} (type: {file_type}). Must be boolean."
-            app.logger.warning(f"Validation failed for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}")
-            errors.append(error_msg)
-            continue
-        
-        # Here you might want to add validation that file_id and file_type combination actually exists
-        # e.g., SELECT 1 FROM documents WHERE id = ? (if file_type == 'document')
-        # For brevity, this example omits that deep validation.
 
+    if not errors and rows:
         try:
-            # UPSERT logic for file_permissions
-            # The file_permissions table has a UNIQUE constraint on (user_id, file_id, file_type)
-            # and created_at/updated_at are handled by DEFAULT and a trigger respectively.
-            cursor = db.execute("""
+            # One UPSERT for the whole list. file_permissions has a UNIQUE constraint on
+            # (user_id, file_id, file_type); created_at comes from the column DEFAULT.
+            db.executemany("""
                 INSERT INTO file_permissions (user_id, file_id, file_type, can_view, can_download, updated_at)
-                VALUES (?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+                VALUES (?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
                 ON CONFLICT(user_id, file_id, file_type) DO UPDATE SET
                     can_view = excluded.can_view,
                     can_download = excluded.can_download,
                     updated_at = excluded.updated_at
-            """, (user_id, file_id, file_type, can_view, can_download))
-            
-            if cursor.rowcount > 0: # Indicates an insert or update occurred
-                processed_count += 1
-            # No specific error if rowcount is 0 for an UPSERT unless an actual error occurs.
-            # An UPSERT that results in no change (same values) might report 0 affected rows in some SQLite versions/contexts.
-            # For this logic, we count it if the command was successful and didn't raise an exception.
-            app.logger.info(f"Successfully UPSERTED permission for user_id {user_id}, file_id {file_id}, file_type {file_type}. Rowcount: {cursor.rowcount}")
-
+            """, [(user_id, *row) for row in rows])
+            processed_count = len(rows)
+            app.logger.info(f"Successfully UPSERTED {processed_count} permission(s) for user_id {user_id}.")
         except sqlite3.IntegrityError as e_int:
             # This might catch FK violations if user_id is somehow invalid (though checked)
             # or other integrity issues not covered by ON CONFLICT.
-            error_msg = f"Database integrity error for file_id {file_id} (type: {file_type}): {e_int}"
-            app.logger.error(f"DB IntegrityError for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}. Exception: {e_int}", exc_info=True)
-            errors.append(error_msg)
+            app.logger.error(f"DB IntegrityError upserting permissions for user_id {user_id}: {e_int}", exc_info=True)
+            errors.append(f"Database integrity error: {e_int}")
         except Exception as e_gen:
-            error_msg = f"General error processing file_id {file_id} (type: {file_type}): {e_gen}"
-            app.logger.error(f"General error for user_id {user_id}, item {i}: {error_msg}. Data: {perm_data}. Exception: {e_gen}", exc_info=True)
-            errors.append(error_msg)
+            app.logger.error(f"General error upserting permissions for user_id {user_id}: {e_gen}", exc_info=True)
+            errors.append(f"General error processing permissions: {e_gen}")
 
     if errors:
         app.logger.warning(f"Rolling back transaction for user_id {user_id} due to errors: {errors}")
@@ -1830,6 +2283,7 @@ def update_user_file_permissions(user_id):
     
     try:
         db.commit()
+        permission_deny_cache.discard(user_id)
         log_audit_action(
             action_type='UPDATE_USER_FILE_PERMISSIONS_SUCCESS',
             target_table='users', target_id=user_id,
@@ -1844,7 +2298,7 @@ def update_user_file_permissions(user_id):
             "SELECT id, file_id, file_type, can_view, can_download, created_at, updated_at FROM file_permissions WHERE user_id = ?",
             (user_id,)
         )
-        updated_permissions_raw = [dict(row) for row in updated_permissions_cursor.fetchall()]
+        updated_permissions_raw = database.fetch_dicts(updated_permissions_cursor)
         timestamp_keys_perms_upd = ['created_at', 'updated_at']
         updated_permissions = [convert_timestamps_to_ist_iso(perm, timestamp_keys_perms_upd) for perm in updated_permissions_raw]
         return jsonify(msg=f"Successfully processed {processed_count} permission(s) for user {user_id}.", permissions=updated_permissions), 200
@@ -1858,6 +2312,244 @@ def update_user_file_permissions(user_id):
         )
         return jsonify(msg="Failed to save updated file permissions due to a server error during commit."), 500
 
+# --- Super Admin Permission Group / Role Rule Endpoints ---
+# Group and role rules apply to every member (or every user with the role) unless the user has
+# their own file_permissions row for the file; see resolve_file_permissions().
+PERMISSION_ROLES = ['user', 'admin', 'super_admin']
+
+GROUP_RULE_UPSERT_SQL = """
+    INSERT INTO group_file_permissions (group_id, file_id, file_type, can_view, can_download, updated_at)
+    VALUES (?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
+    ON CONFLICT(group_id, file_id, file_type) DO UPDATE SET
+        can_view = excluded.can_view,
+        can_download = excluded.can_download,
+        updated_at = excluded.updated_at
+"""
+
+ROLE_RULE_UPSERT_SQL = """
+    INSERT INTO role_file_permissions (role, file_id, file_type, can_view, can_download, updated_at)
+    VALUES (?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
+    ON CONFLICT(role, file_id, file_type) DO UPDATE SET
+        can_view = excluded.can_view,
+        can_download = excluded.can_download,
+        updated_at = excluded.updated_at
+"""
+
+def get_permission_group_details(db, group_id):
+    """Returns the group with its members and rules, or None if it doesn't exist."""
+    group = db.execute(
+        "SELECT id, name, description, created_by_user_id, created_at, updated_at FROM permission_groups WHERE id = ?",
+        (group_id,)
+    ).fetchone()
+    if not group:
+        return None
+    group = convert_timestamps_to_ist_iso(dict(group), ['created_at', 'updated_at'])
+    group['members'] = database.fetch_dicts(db.execute(
+        "SELECT u.id, u.username, u.role FROM permission_group_members pgm JOIN users u ON u.id = pgm.user_id WHERE pgm.group_id = ? ORDER BY u.username",
+        (group_id,)
+    ))
+    rules = database.fetch_dicts(db.execute(
+        "SELECT id, file_id, file_type, can_view, can_download, created_at, updated_at FROM group_file_permissions WHERE group_id = ? ORDER BY file_type, file_id",
+        (group_id,)
+    ))
+    group['permissions'] = [convert_timestamps_to_ist_iso(rule, ['created_at', 'updated_at']) for rule in rules]
+    return group
+
+@app.route('/api/superadmin/permission-groups', methods=['GET'])
+@jwt_required()
+@super_admin_required
+def list_permission_groups():
+    db = get_db()
+    try:
+        groups = database.fetch_dicts(db.execute("""
+            SELECT g.id, g.name, g.description, g.created_by_user_id, g.created_at, g.updated_at,
+                   (SELECT COUNT(*) FROM permission_group_members pgm WHERE pgm.group_id = g.id) AS member_count,
+                   (SELECT COUNT(*) FROM group_file_permissions gfp WHERE gfp.group_id = g.id) AS rule_count
+            FROM permission_groups g
+            ORDER BY g.name
+        """))
+        return jsonify([convert_timestamps_to_ist_iso(group, ['created_at', 'updated_at']) for group in groups]), 200
+    except Exception as e:
+        app.logger.error(f"Error listing permission groups: {e}")
+        return jsonify(msg="Failed to retrieve permission groups due to a server error."), 500
+
+@app.route('/api/superadmin/permission-groups', methods=['POST'])
+@jwt_required()
+@super_admin_required
+def create_permission_group():
+    db = get_db()
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    description = data.get('description')
+    if not name:
+        return jsonify(msg="Group name is required."), 400
+
+    try:
+        cursor = db.execute(
+            "INSERT INTO permission_groups (name, description, created_by_user_id) VALUES (?, ?, ?)",
+            (name, description, int(get_jwt_identity()))
+        )
+        group_id = cursor.lastrowid
+        db.commit()
+    except sqlite3.IntegrityError:
+        db.rollback()
+        return jsonify(msg=f"A permission group named '{name}' already exists."), 409
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Error creating permission group '{name}': {e}")
+        return jsonify(msg="Failed to create permission group due to a server error."), 500
+
+    log_audit_action(
+        action_type='CREATE_PERMISSION_GROUP', target_table='permission_groups', target_id=group_id,
+        details={'name': name}
+    )
+    return jsonify(get_permission_group_details(db, group_id)), 201
+
+@app.route('/api/superadmin/permission-groups/<int:group_id>', methods=['GET'])
+@jwt_required()
+@super_admin_required
+def get_permission_group(group_id):
+    group = get_permission_group_details(get_db(), group_id)
+    if not group:
+        return jsonify(msg="Permission group not found."), 404
+    return jsonify(group), 200
+
+@app.route('/api/superadmin/permission-groups/<int:group_id>', methods=['DELETE'])
+@jwt_required()
+@super_admin_required
+def delete_permission_group(group_id):
+    db = get_db()
+    try:
+        # Members and rules go with the group (ON DELETE CASCADE).
+        cursor = db.execute("DELETE FROM permission_groups WHERE id = ?", (group_id,))
+        if cursor.rowcount == 0:
+            db.rollback()
+            return jsonify(msg="Permission group not found."), 404
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Error deleting permission group {group_id}: {e}")
+        return jsonify(msg="Failed to delete permission group due to a server error."), 500
+
+    log_audit_action(action_type='DELETE_PERMISSION_GROUP', target_table='permission_groups', target_id=group_id)
+    return jsonify(msg="Permission group deleted successfully."), 200
+
+@app.route('/api/superadmin/permission-groups/<int:group_id>/members', methods=['PUT'])
+@jwt_required()
+@super_admin_required
+def set_permission_group_members(group_id):
+    """Replaces the group's members with {"user_ids": [...]}; ids of unknown users are ignored."""
+    db = get_db()
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not all(isinstance(uid, int) and not isinstance(uid, bool) and uid > 0 for uid in user_ids):
+        return jsonify(msg="'user_ids' must be a list of positive integers."), 400
+    if not db.execute("SELECT 1 FROM permission_groups WHERE id = ?", (group_id,)).fetchone():
+        return jsonify(msg="Permission group not found."), 404
+
+    try:
+        db.execute("DELETE FROM permission_group_members WHERE group_id = ?", (group_id,))
+        # One statement for the whole member list instead of an INSERT per user.
+        cursor = db.execute(
+            "INSERT INTO permission_group_members (group_id, user_id) SELECT ?, u.id FROM users u WHERE u.id IN (SELECT value FROM json_each(?))",
+            (group_id, json.dumps(user_ids))
+        )
+        member_count = cursor.rowcount
+        db.execute(
+            "UPDATE permission_groups SET updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30') WHERE id = ?",
+            (group_id,)
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Error setting members of permission group {group_id}: {e}")
+        return jsonify(msg="Failed to update group members due to a server error."), 500
+
+    log_audit_action(
+        action_type='SET_PERMISSION_GROUP_MEMBERS', target_table='permission_groups', target_id=group_id,
+        details={'member_count': member_count, 'user_ids_provided_count': len(user_ids)}
+    )
+    return jsonify(get_permission_group_details(db, group_id)), 200
+
+@app.route('/api/superadmin/permission-groups/<int:group_id>/permissions', methods=['PUT'])
+@jwt_required()
+@super_admin_required
+def update_permission_group_rules(group_id):
+    """Upserts the group's rules from a list of {file_id, file_type, can_view, can_download}."""
+    db = get_db()
+    permissions_data = request.get_json()
+    if not isinstance(permissions_data, list):
+        return jsonify(msg="Request body must be a list of permission objects."), 400
+    if not db.execute("SELECT 1 FROM permission_groups WHERE id = ?", (group_id,)).fetchone():
+        return jsonify(msg="Permission group not found."), 404
+
+    rows, errors = parse_permission_rules(permissions_data, f"permission group {group_id}")
+    if errors:
+        return jsonify(msg="Errors occurred while updating permissions. No changes were saved.", errors=errors), 400
+
+    try:
+        db.executemany(GROUP_RULE_UPSERT_SQL, [(group_id, *row) for row in rows])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Error updating rules of permission group {group_id}: {e}")
+        return jsonify(msg="Failed to save group permissions due to a server error."), 500
+
+    log_audit_action(
+        action_type='UPDATE_GROUP_FILE_PERMISSIONS', target_table='permission_groups', target_id=group_id,
+        details={'permissions_processed_count': len(rows), 'permissions_provided_count': len(permissions_data)}
+    )
+    return jsonify(get_permission_group_details(db, group_id)), 200
+
+def fetch_role_file_permissions(db, role):
+    rules = database.fetch_dicts(db.execute(
+        "SELECT id, file_id, file_type, can_view, can_download, created_at, updated_at FROM role_file_permissions WHERE role = ? ORDER BY file_type, file_id",
+        (role,)
+    ))
+    return [convert_timestamps_to_ist_iso(rule, ['created_at', 'updated_at']) for rule in rules]
+
+@app.route('/api/superadmin/roles/<role>/permissions', methods=['GET'])
+@jwt_required()
+@super_admin_required
+def get_role_file_permissions(role):
+    if role not in PERMISSION_ROLES:
+        return jsonify(msg=f"Invalid role. Must be one of: {', '.join(PERMISSION_ROLES)}."), 400
+    try:
+        return jsonify(fetch_role_file_permissions(get_db(), role)), 200
+    except Exception as e:
+        app.logger.error(f"Error fetching file permissions for role {role}: {e}")
+        return jsonify(msg="Failed to retrieve role permissions due to a server error."), 500
+
+@app.route('/api/superadmin/roles/<role>/permissions', methods=['PUT'])
+@jwt_required()
+@super_admin_required
+def update_role_file_permissions(role):
+    """Upserts rules that apply to every user with `role`."""
+    if role not in PERMISSION_ROLES:
+        return jsonify(msg=f"Invalid role. Must be one of: {', '.join(PERMISSION_ROLES)}."), 400
+    db = get_db()
+    permissions_data = request.get_json()
+    if not isinstance(permissions_data, list):
+        return jsonify(msg="Request body must be a list of permission objects."), 400
+
+    rows, errors = parse_permission_rules(permissions_data, f"role {role}")
+    if errors:
+        return jsonify(msg="Errors occurred while updating permissions. No changes were saved.", errors=errors), 400
+
+    try:
+        db.executemany(ROLE_RULE_UPSERT_SQL, [(role, *row) for row in rows])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Error updating file permissions for role {role}: {e}")
+        return jsonify(msg="Failed to save role permissions due to a server error."), 500
+
+    log_audit_action(
+        action_type='UPDATE_ROLE_FILE_PERMISSIONS', target_table='role_file_permissions',
+        details={'role': role, 'permissions_processed_count': len(rows), 'permissions_provided_count': len(permissions_data)}
+    )
+    return jsonify(msg=f"Successfully processed {len(rows)} permission(s) for role {role}.", permissions=fetch_role_file_permissions(db, role)), 200
+
 # --- Authentication Endpoints ---
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -2121,11 +2813,11 @@ def login():
         # --- Real-time Online Status Update (moved before return) ---
         try:
             db = get_db()
-            db.execute(
+            database.execute_write(
+                db,
                 "UPDATE users SET is_online = TRUE, last_seen = CURRENT_TIMESTAMP WHERE id = ?",
                 (user['id'],)
             )
-            db.commit()
             app.logger.info(f"User {user['id']} status set to online and last_seen updated.")
             socketio.emit('user_online', {'user_id': user['id']})
         except Exception as e_status:
@@ -2365,6 +3057,7 @@ def update_username():
             details={'old_username': old_username, 'new_username': new_username}
         )
         db.commit()
+        database.table_versions.bump([USERNAMES])
         # Re-fetch user to confirm and potentially get updated details if needed by frontend immediately
         # Though for username change, the new username is already known.
         # Consider if the JWT needs to be re-issued if username is part of its payload claims (not by default with user_id as identity).
@@ -2387,24 +3080,25 @@ def update_username():
         return jsonify(msg="Failed to update username due to a server error."), 500
 
 # --- User Dashboard Layout Preferences Endpoints ---
+def load_dashboard_layout(db, user_id):
+    """The user's saved dashboard layout ({} if none), or None if it can't be parsed."""
+    user_prefs_row = db.execute("SELECT dashboard_layout_prefs FROM users WHERE id = ?", (user_id,)).fetchone()
+    if not user_prefs_row or not user_prefs_row['dashboard_layout_prefs']:
+        return {} # No preferences set, return empty object (or a default layout)
+    try:
+        return json.loads(user_prefs_row['dashboard_layout_prefs'])
+    except json.JSONDecodeError:
+        app.logger.error(f"Failed to parse dashboard_layout_prefs for user {user_id}. Data: {user_prefs_row['dashboard_layout_prefs']}")
+        return None
+
 @app.route('/api/user/dashboard-layout', methods=['GET'])
 @active_user_required
 def get_dashboard_layout():
     user_id = int(get_jwt_identity()) # Already verified
-    db = get_db()
-    user_prefs_row = db.execute("SELECT dashboard_layout_prefs FROM users WHERE id = ?", (user_id,)).fetchone()
-
-    if user_prefs_row and user_prefs_row['dashboard_layout_prefs']:
-        try:
-            layout_prefs = json.loads(user_prefs_row['dashboard_layout_prefs'])
-            return jsonify(layout_prefs), 200
-        except json.JSONDecodeError:
-            app.logger.error(f"Failed to parse dashboard_layout_prefs for user {user_id}. Data: {user_prefs_row['dashboard_layout_prefs']}")
-            # Return a default or empty layout if parsing fails, or an error
-            return jsonify(msg="Error parsing layout preferences."), 500 # Or return default: {}
-    else:
-        # No preferences set, return empty object (or a default layout)
-        return jsonify({}), 200
+    layout_prefs = load_dashboard_layout(get_db(), user_id)
+    if layout_prefs is None:
+        return jsonify(msg="Error parsing layout preferences."), 500 # Or return default: {}
+    return jsonify(layout_prefs), 200
 
 @app.route('/api/user/dashboard-layout', methods=['PUT'])
 @active_user_required
@@ -2533,22 +3227,227 @@ def update_user_watch_preferences():
             "operation_results": results
         }), 200
 
-# --- Public GET Endpoints (Read-only data for dashboard) ---
-@app.route('/api/software', methods=['GET'])
-def get_all_software_api():
-    software_list = get_db().execute("SELECT id, name, description FROM software ORDER BY name").fetchall()
-    return jsonify([dict(row) for row in software_list])
+# --- SPA Bootstrap Endpoint ---
+@app.route('/api/bootstrap', methods=['GET'])
+@readonly_db
+@active_user_required
+def get_bootstrap_api():
+    """
+    Everything the SPA loads on startup in one response, behind one token check and one user
+    lookup, on one connection: the bodies of /api/software, /api/versions_for_software (for
+    every software), /api/misc_categories, /api/notifications/unread_count, the unread chat
+    count, /api/user/dashboard-layout and /api/user/watch_preferences, and, for the items
+    listed in ?favorites=document:12,patch:3, /api/favorites/status.
+    A part that fails is null and named in "errors"; the rest is still returned.
+    """
+    user_id = int(get_jwt_identity()) # Already verified
+
+    favorite_items = []
+    for entry in filter(None, request.args.get('favorites', default='', type=str).split(',')):
+        item_type, _, item_id = entry.partition(':')
+        if item_type not in ALLOWED_FAVORITE_ITEM_TYPES or not item_id.isdigit() or int(item_id) <= 0:
+            return jsonify(msg=f"Invalid favorites entry '{entry}'. Expected item_type:item_id with item_type one of: {', '.join(ALLOWED_FAVORITE_ITEM_TYPES)}."), 400
+        favorite_items.append((item_type, int(item_id)))
+
+    db = get_db()
+    catalog = get_catalog(db)
+    parts = {
+        'software': lambda: [dict(row) for row in catalog.software_list],
+        'versions_by_software': lambda: {
+            str(software['id']): [{'id': row['id'], 'version_number': row['version_number'], 'release_date': row['release_date']}
+                                  for row in catalog.versions_for(software['id'])]
+            for software in catalog.software_list
+        },
+        'misc_categories': lambda: [dict(row) for row in db.execute("SELECT id, name, description FROM misc_categories ORDER BY name").fetchall()],
+        'unread_notification_count': lambda: database.count_unread_notifications(db, user_id),
+        'unread_chat_count': lambda: get_total_unread_messages(db, user_id),
+        'dashboard_layout': lambda: load_dashboard_layout(db, user_id),
+        'watch_preferences': lambda: [convert_timestamps_to_ist_iso(dict(pref), ['created_at']) for pref in database.get_watch_preferences(db, user_id)],
+    }
+    if favorite_items:
+        def favorite_statuses():
+            records = database.get_favorite_statuses(db, user_id, favorite_items)
+            return {f"{item_type}:{item_id}": favorite_status_payload(records.get((item_type, item_id))) for item_type, item_id in favorite_items}
+        parts['favorites'] = favorite_statuses
+
+    result, errors = {}, {}
+    for name, load in parts.items():
+        try:
+            result[name] = load()
+        except Exception as e:
+            app.logger.error(f"Error loading '{name}' for bootstrap of user {user_id}: {e}", exc_info=True)
+            result[name] = None
+        if result[name] is None:
+            errors[name] = f"Could not load {name.replace('_', ' ')}."
+    result['errors'] = errors
+    return jsonify(result), 200
+
+# --- Public GET Endpoints (Read-only data for dashboard) ---
+@app.route('/api/software', methods=['GET'])
+@versioned_response(['software'])
+def get_all_software_api():
+    return jsonify([dict(row) for row in get_catalog(get_db()).software_list])
+
+@app.route('/api/versions_for_software', methods=['GET'])
+@versioned_response(['versions'])
+def get_versions_for_software_api():
+    software_id = request.args.get('software_id', type=int)
+    if not software_id: return jsonify(msg="software_id parameter is required"), 400
+    versions = get_catalog(get_db()).versions_for(software_id)
+    return jsonify([{'id': row['id'], 'version_number': row['version_number'], 'release_date': row['release_date']} for row in versions])
+
+# facet_counts item type -> (response key, {dimension: response name}). Patches are counted per
+# version; their software counts are rolled up from those.
+FACET_RESPONSE_KEYS = {
+    'document': ('documents', {'software_id': 'by_software', 'doc_type': 'by_doc_type'}),
+    'patch': ('patches', {'software_id': 'by_software', 'version_id': 'by_version'}),
+    'link': ('links', {'software_id': 'by_software', 'version_id': 'by_version'}),
+    'misc_file': ('misc_files', {'misc_category_id': 'by_category'}),
+}
+
+@app.route('/api/facets', methods=['GET'])
+@readonly_db
+@versioned_response(['facet_counts', 'versions'], per_user=True)
+def get_facets_api():
+    """
+    Item counts per software, version, doc type and misc category for the filter tabs, read
+    from the incrementally maintained facet_counts table, less the items the caller can't view.
+    Values are keyed as strings; items without a doc type / version are counted under "".
+    """
+    db = get_db()
+
+    logged_in_user_id = None
+    try:
+        verify_jwt_in_request(optional=True)
+        current_user_identity = get_jwt_identity()
+        if current_user_identity:
+            logged_in_user_id = int(current_user_identity)
+    except Exception as e:
+        app.logger.error(f"Error getting user_id in get_facets_api: {e}")
+
+    denies = get_file_denies(db, logged_in_user_id)
+    try:
+        counts = database.get_facet_counts(db)
+        for item_type, dimensions in counts.items():
+            hidden_ids = denies.hidden_ids_json(item_type)
+            if hidden_ids is None:
+                continue
+            # Hidden items are looked up by primary key, so this costs one seek per denied item
+            for dimension, hidden_counts in database.count_facets_for_ids(db, item_type, hidden_ids).items():
+                for facet_value, hidden_count in hidden_counts.items():
+                    remaining = dimensions[dimension].get(facet_value, 0) - hidden_count
+                    if remaining > 0:
+                        dimensions[dimension][facet_value] = remaining
+                    else:
+                        dimensions[dimension].pop(facet_value, None)
+    except Exception as e:
+        app.logger.error(f"Error fetching facet counts: {e}")
+        return jsonify(msg="Error fetching facet counts."), 500
+
+    catalog = get_catalog(db)
+    patches_by_software = {}
+    for version_id, item_count in counts['patch']['version_id'].items():
+        version = catalog.get_version(version_id)
+        if version:
+            software_key = str(version['software_id'])
+            patches_by_software[software_key] = patches_by_software.get(software_key, 0) + item_count
+    counts['patch']['software_id'] = patches_by_software
+
+    facets = {}
+    for item_type, (response_key, dimension_names) in FACET_RESPONSE_KEYS.items():
+        dimensions = counts[item_type]
+        total = sum(dimensions[database.FACET_DIMENSIONS[item_type][1][0]].values()) # Every item has one value per dimension
+        facets[response_key] = {'total': total, **{name: dimensions[dimension] for dimension, name in dimension_names.items()}}
+    return jsonify(facets)
+
+# item_changes item type -> (response key, columns returned for upserted items). Same fields as
+# the listings' own columns; names of software, versions and categories come from their endpoints.
+SYNC_ITEM_COLUMNS = {
+    'document': ('documents', "id, software_id, doc_name, description, doc_type, is_external_link, download_link, stored_filename, original_filename_ref, file_size, file_type, created_by_user_id, created_at, updated_by_user_id, updated_at, top_level_comment_count AS comment_count"),
+    'patch': ('patches', "id, version_id, patch_name, description, release_date, is_external_link, download_link, stored_filename, original_filename_ref, file_size, file_type, patch_by_developer, created_by_user_id, created_at, updated_by_user_id, updated_at, top_level_comment_count AS comment_count, compatible_vms_versions"),
+    'link': ('links', "id, title, description, software_id, version_id, is_external_link, url, stored_filename, original_filename_ref, file_size, file_type, created_by_user_id, created_at, updated_by_user_id, updated_at, top_level_comment_count AS comment_count, compatible_vms_versions"),
+    'misc_file': ('misc_files', "id, misc_category_id, user_id, user_provided_title, user_provided_description, original_filename, stored_filename, file_path, file_type, file_size, created_by_user_id, created_at, updated_by_user_id, updated_at, top_level_comment_count AS comment_count"),
+}
+
+@app.route('/api/sync', methods=['GET'])
+@readonly_db
+@versioned_response(['item_changes', 'documents', 'patches', 'links', 'misc_files'], per_user=True)
+def sync_items_api():
+    """
+    Delta sync for clients that keep their own copy of the listings. `since` is the token from
+    the previous response; the answer holds the items inserted or updated since then (current
+    rows, as the caller may see them) and the ids of those deleted or no longer visible.
+    Without `since`, or with "reset": true in the answer, the client reloads the listings and
+    continues from the returned token. Follow "has_more" by calling again with the new token.
+    """
+    db = get_db()
+
+    logged_in_user_id = None
+    try:
+        verify_jwt_in_request(optional=True)
+        current_user_identity = get_jwt_identity()
+        if current_user_identity:
+            logged_in_user_id = int(current_user_identity)
+    except Exception as e:
+        app.logger.error(f"Error getting user_id in sync_items_api: {e}")
+
+    denies = get_file_denies(db, logged_in_user_id)
+    # Tokens carry the caller's permission fingerprint: a client whose visible set changed
+    # can't be brought up to date from the log and has to reload.
+    token_suffix = denies.fingerprint[:12]
+    since_param = request.args.get('since', type=str)
+    since_id = None
+    if since_param:
+        since_id_str, _, since_suffix = since_param.partition('.')
+        try:
+            since_id = int(since_id_str)
+        except ValueError:
+            return jsonify(msg="Invalid since token."), 400
+        if since_id < 0:
+            return jsonify(msg="Invalid since token."), 400
+        if since_suffix != token_suffix:
+            since_id = None
+
+    empty_changes = {response_key: {'upserted': [], 'deleted': []} for response_key, _ in SYNC_ITEM_COLUMNS.values()}
+    try:
+        oldest_id, latest_id = database.item_change_id_range(db)
+        # Older than the retained log (pruned) or ahead of it (database reset): start over
+        if since_id is None or since_id < oldest_id - 1 or since_id > latest_id:
+            return jsonify(token=f"{latest_id}.{token_suffix}", reset=True, has_more=False, changes=empty_changes)
+
+        last_id, item_changes, has_more = database.get_item_changes_since(db, since_id, app.config['SYNC_MAX_CHANGES'])
+        changes = {}
+        for item_type, (response_key, columns) in SYNC_ITEM_COLUMNS.items():
+            changed = item_changes[item_type]
+            upsert_ids = [item_id for item_id, change_type in changed.items() if change_type == 'upsert']
+            upserted = []
+            if upsert_ids:
+                where_clauses = ["id IN (SELECT value FROM json_each(?))"]
+                params = [json.dumps(upsert_ids)]
+                view_filter = denies.view_condition(item_type, 'id')
+                if view_filter:
+                    where_clauses.append(view_filter[0])
+                    params.extend(view_filter[1])
+                downloadable_sql, downloadable_params = denies.downloadable_column(item_type, 'id')
+                rows = db.execute(
+                    f"SELECT {columns}, {downloadable_sql} AS is_downloadable FROM {database.ITEM_CHANGE_TABLES[item_type]} "
+                    f"WHERE {' AND '.join(where_clauses)} ORDER BY id",
+                    downloadable_params + params
+                ).fetchall()
+                upserted = [convert_timestamps_to_ist_iso(dict(row), ['created_at', 'updated_at']) for row in rows]
+            # Deleted, plus upserted since but already gone again or hidden from the caller
+            found_ids = {row['id'] for row in upserted}
+            deleted = sorted(item_id for item_id in changed if item_id not in found_ids)
+            changes[response_key] = {'upserted': upserted, 'deleted': deleted}
+    except Exception as e:
+        app.logger.error(f"Error fetching item changes since {since_id}: {e}")
+        return jsonify(msg="Error fetching changes."), 500
 
-@app.route('/api/versions_for_software', methods=['GET'])
-def get_versions_for_software_api():
-    software_id = request.args.get('software_id', type=int)
-    if not software_id: return jsonify(msg="software_id parameter is required"), 400
-    versions = get_db().execute(
-        "SELECT id, version_number, release_date FROM versions WHERE software_id = ? ORDER BY release_date DESC, version_number DESC", (software_id,)
-    ).fetchall()
-    return jsonify([dict(row) for row in versions])
+    return jsonify(token=f"{last_id}.{token_suffix}", reset=False, has_more=has_more, changes=changes)
 
 @app.route('/api/documents', methods=['GET'])
+@readonly_db
+@versioned_response(['documents', 'software', USERNAMES], per_user=True)
 def get_all_documents_api():
     # profiler = cProfile.Profile() # Removed
     # profiler.enable() # Removed
@@ -2560,6 +3459,7 @@ def get_all_documents_api():
     per_page = request.args.get('per_page', default=10, type=int)
     sort_by_param = request.args.get('sort_by', default='doc_name', type=str)
     sort_order = request.args.get('sort_order', default='asc', type=str).lower()
+    page_cursor = request.args.get('cursor', type=str) # Opt-in keyset pagination; replaces `page`
 
     # Get existing filter parameters
     software_id_filter = request.args.get('software_id', type=int)
@@ -2588,13 +3488,22 @@ def get_all_documents_api():
         # patch_by_developer is not applicable to documents
     }
     
+    if sort_by_param not in allowed_sort_by_map:
+        sort_by_param = 'doc_name'
     sort_by_column = allowed_sort_by_map.get(sort_by_param, 'd.doc_name') 
 
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
 
+    keyset = None
+    if page_cursor:
+        try:
+            keyset = keyset_conditions(sort_by_column, 'd.id', sort_order, *decode_page_cursor(page_cursor, sort_by_param, sort_order))
+        except ValueError as e:
+            return jsonify(msg=f"Invalid cursor: {e}"), 400
+
     # Construct Base Query and Parameters for Filtering
-    base_query_select_fields = "d.id, d.software_id, d.doc_name, d.description, d.doc_type, d.is_external_link, d.download_link, d.stored_filename, d.original_filename_ref, d.file_size, d.file_type, d.created_by_user_id, u.username as uploaded_by_username, d.created_at, d.updated_by_user_id, upd_u.username as updated_by_username, d.updated_at, s.name as software_name, (SELECT COUNT(*) FROM comments c WHERE c.item_id = d.id AND c.item_type = 'document' AND c.parent_comment_id IS NULL) as comment_count"
+    base_query_select_fields = "d.id, d.software_id, d.doc_name, d.description, d.doc_type, d.is_external_link, d.download_link, d.stored_filename, d.original_filename_ref, d.file_size, d.file_type, d.created_by_user_id, u.username as uploaded_by_username, d.created_at, d.updated_by_user_id, upd_u.username as updated_by_username, d.updated_at, d.top_level_comment_count as comment_count"
     base_query_from = "FROM documents d JOIN software s ON d.software_id = s.id LEFT JOIN users u ON d.created_by_user_id = u.id LEFT JOIN users upd_u ON d.updated_by_user_id = upd_u.id"
     
     params = [] # Parameters for the WHERE clause
@@ -2612,37 +3521,35 @@ def get_all_documents_api():
     # app.logger.info(f"API Call - Logged in user ID: {logged_in_user_id}")
 
     # Base query components
-    base_query_select_fields_with_aliases = "d.id, d.software_id, d.doc_name, d.description, d.doc_type, d.is_external_link, d.download_link, d.stored_filename, d.original_filename_ref, d.file_size, d.file_type, d.created_by_user_id, u.username as uploaded_by_username, d.created_at, d.updated_by_user_id, upd_u.username as updated_by_username, d.updated_at, s.name as software_name, (SELECT COUNT(*) FROM comments c WHERE c.item_id = d.id AND c.item_type = 'document' AND c.parent_comment_id IS NULL) as comment_count"
+    base_query_select_fields_with_aliases = "d.id, d.software_id, d.doc_name, d.description, d.doc_type, d.is_external_link, d.download_link, d.stored_filename, d.original_filename_ref, d.file_size, d.file_type, d.created_by_user_id, u.username as uploaded_by_username, d.created_at, d.updated_by_user_id, upd_u.username as updated_by_username, d.updated_at, d.top_level_comment_count as comment_count"
     
     # --- PERMISSION MODEL CHANGE ---
-    # SQL conditions based on "default allow, explicit deny"
-    # View: (fp.id IS NULL OR fp.can_view = 1)
-    # Download: (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END)
+    # "Default allow, explicit deny": the user's denies come from the cached FileDenies
+    # (hidden ids filtered in WHERE, non-downloadable ids checked in the select list).
+    denies = get_file_denies(db, logged_in_user_id)
+    downloadable_sql, downloadable_params = denies.downloadable_column('document', 'd.id')
     if logged_in_user_id:
         # Select favorite_id and is_downloadable based on the logged_in_user_id
-        select_clause = f"SELECT {base_query_select_fields_with_aliases}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields_with_aliases}, uf.id AS favorite_id, {downloadable_sql} AS is_downloadable"
     else:
         # If no user is logged in, favorite_id is NULL.
-        # is_downloadable logic: if fp_dl.id is NULL, it defaults to 1 (true).
-        select_clause = f"SELECT {base_query_select_fields_with_aliases}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields_with_aliases}, NULL AS favorite_id, {downloadable_sql} AS is_downloadable"
 
-    from_clause = "FROM documents d JOIN software s ON d.software_id = s.id LEFT JOIN users u ON d.created_by_user_id = u.id LEFT JOIN users upd_u ON d.updated_by_user_id = upd_u.id"
+    # software_name comes from the catalog; software is only joined to sort by it
+    software_join = " JOIN software s ON d.software_id = s.id" if sort_by_param == 'software_name' else ""
+    from_clause = f"FROM documents d{software_join} LEFT JOIN users u ON d.created_by_user_id = u.id LEFT JOIN users upd_u ON d.updated_by_user_id = upd_u.id"
     
     params = [] # Params for WHERE clause filters (like software_id_filter)
     # user_id_param_for_join is not used in this new logic structure for permissions directly.
     # Instead, logged_in_user_id is added to specific param lists for joins.
-    permission_join_params = [logged_in_user_id] # Param for the LEFT JOIN fp.user_id = ?
 
     filter_conditions = []
 
-    # Permission Join and Conditions
-    # --- PERMISSION MODEL CHANGE ---
-    # Default Allow, Explicit Deny
-    # LEFT JOIN file_permissions for view permission
-    from_clause += " LEFT JOIN file_permissions fp ON d.id = fp.file_id AND fp.file_type = 'document' AND fp.user_id = ?"
-    # The view condition is now part of the WHERE clause.
-    filter_conditions.append("(fp.id IS NULL OR fp.can_view = 1)")
-    # logged_in_user_id for the view permission join is part of `permission_join_params`
+    # View permission: drop the documents this user is denied (no condition if there are none)
+    view_condition = denies.view_condition('document', 'd.id')
+    if view_condition:
+        filter_conditions.append(view_condition[0])
+        params.extend(view_condition[1])
 
     # Existing Filters
     if software_id_filter:
@@ -2654,91 +3561,104 @@ def get_all_documents_api():
             if term: # Ensure term is not empty after split
                 filter_conditions.append("LOWER(d.doc_type) LIKE ?")
                 params.append(f"%{term}%")
-    if created_from_filter:
-        filter_conditions.append("date(d.created_at) >= date(?)")
-        params.append(created_from_filter)
-    if created_to_filter:
-        filter_conditions.append("date(d.created_at) <= date(?)")
-        params.append(created_to_filter)
-    if updated_from_filter:
-        filter_conditions.append("date(d.updated_at) >= date(?)")
-        params.append(updated_from_filter)
-    if updated_to_filter:
-        filter_conditions.append("date(d.updated_at) <= date(?)")
-        params.append(updated_to_filter)
+    try:
+        if created_from_filter:
+            filter_conditions.append("d.created_at >= ?")
+            params.append(day_range_start(created_from_filter))
+        if created_to_filter:
+            filter_conditions.append("d.created_at < ?")
+            params.append(day_range_end(created_to_filter))
+        if updated_from_filter:
+            filter_conditions.append("d.updated_at >= ?")
+            params.append(day_range_start(updated_from_filter))
+        if updated_to_filter:
+            filter_conditions.append("d.updated_at < ?")
+            params.append(day_range_end(updated_to_filter))
+    except ValueError:
+        return jsonify(msg="Invalid date filter format. Expected YYYY-MM-DD."), 400
     
     where_clause = ""
     if filter_conditions:
         where_clause = " WHERE " + " AND ".join(filter_conditions)
 
     # Count Query (reflects permission filtering)
-    # For count_query, the logged_in_user_id for the permission join must also be included.
-    count_params = permission_join_params + params # Combine params for join and filters
-    count_query = f"SELECT COUNT(d.id) as count {from_clause}{where_clause}"
+    count_params = params
+    # The filters only use documents columns and the joins don't change the row count, so count documents alone
+    count_query = f"SELECT COUNT(d.id) as count FROM documents d{where_clause}"
     
-    try:
-        # app.logger.info(f"Documents Count Query for user {logged_in_user_id}: {count_query}") # Removed
-        # app.logger.info(f"Documents Count Params: {tuple(count_params)}") # Removed
-        total_documents_cursor = db.execute(count_query, tuple(count_params))
-        total_documents = total_documents_cursor.fetchone()['count']
-    except Exception as e:
-        app.logger.error(f"Error fetching total document count with permissions: {e} using query {count_query} and params {tuple(count_params)}")
-        return jsonify(msg="Error fetching document count."), 500
+    if keyset is None: # Cursor pages skip the COUNT
+        try:
+            # app.logger.info(f"Documents Count Query for user {logged_in_user_id}: {count_query}") # Removed
+            # app.logger.info(f"Documents Count Params: {tuple(count_params)}") # Removed
+            total_documents = cached_count(db, count_query, count_params, ['documents'])
+        except Exception as e:
+            app.logger.error(f"Error fetching total document count with permissions: {e} using query {count_query} and params {tuple(count_params)}")
+            return jsonify(msg="Error fetching document count."), 500
 
-    # Pagination Details
-    total_pages = math.ceil(total_documents / per_page) if total_documents > 0 else 1
-    offset = (page - 1) * per_page
-    if page > total_pages and total_documents > 0:
-        page = total_pages
+        # Pagination Details
+        total_pages = math.ceil(total_documents / per_page) if total_documents > 0 else 1
         offset = (page - 1) * per_page
+        if page > total_pages and total_documents > 0:
+            page = total_pages
+            offset = (page - 1) * per_page
     
     # Main Data Query
     final_from_clause_for_data = from_clause 
-    # final_params_for_data = list(permission_join_params) 
-    # final_params_for_data.extend(params) 
-
-    # New logic for assembling final_params_for_data
-    final_params_for_data = list(permission_join_params)  # Start with permission join params
+    final_params_for_data = list(downloadable_params) # is_downloadable in the select list comes first
 
     if logged_in_user_id:
         # Add JOIN for favorite status
         final_from_clause_for_data += " LEFT JOIN user_favorites uf ON d.id = uf.item_id AND uf.item_type = 'document' AND uf.user_id = ?"
         final_params_for_data.append(logged_in_user_id) # Param for uf join
-        
-        # Add separate LEFT JOIN for download permission (fp_dl)
-        final_from_clause_for_data += " LEFT JOIN file_permissions fp_dl ON d.id = fp_dl.file_id AND fp_dl.file_type = 'document' AND fp_dl.user_id = ?"
-        final_params_for_data.append(logged_in_user_id) # Param for fp_dl join
-    else:
-        # Add fp_dl join for anonymous users as well
-        final_from_clause_for_data += " LEFT JOIN file_permissions fp_dl ON d.id = fp_dl.file_id AND fp_dl.file_type = 'document' AND fp_dl.user_id = ?"
-        final_params_for_data.append(None) # Param for fp_dl join (None for anonymous)
 
     final_params_for_data.extend(params) # Add WHERE clause filter parameters
-    final_params_for_data.extend([per_page, offset]) # Add pagination params
-    
-    final_query = f"{select_clause} {final_from_clause_for_data}{where_clause} ORDER BY {sort_by_column} {sort_order.upper()} LIMIT ? OFFSET ?"
+
+    order_by_clause = f" ORDER BY {sort_by_column} {sort_order.upper()}, d.id {sort_order.upper()}" # id breaks ties, as the cursor does
+    if keyset is None:
+        final_params_for_data.extend([per_page, offset]) # Add pagination params
+        final_query = f"{select_clause} {final_from_clause_for_data}{where_clause}{order_by_clause} LIMIT ? OFFSET ?"
+    else:
+        keyset_where_clause = f"{where_clause} AND {{keyset}}" if where_clause else " WHERE {keyset}"
+        final_query = f"{select_clause} {final_from_clause_for_data}{keyset_where_clause}{order_by_clause} LIMIT ?"
     # app.logger.info(f"Final documents query: {final_query}")
     # app.logger.info(f"Final documents params: {tuple(final_params_for_data)}")
     try:
         # app.logger.info(f"Documents Data Query for user {logged_in_user_id}: {final_query}") # Removed
         # app.logger.info(f"Documents Data Params: {tuple(final_params_for_data)}") # Removed
-        documents_cursor = db.execute(final_query, tuple(final_params_for_data))
-        documents_list_raw = [dict(row) for row in documents_cursor.fetchall()]
+        if keyset is None:
+            documents_cursor = db.execute(final_query, tuple(final_params_for_data))
+            documents_list_raw = database.fetch_dicts(documents_cursor)
+            has_more = page < total_pages
+        else:
+            documents_list_raw = fetch_keyset_rows(db, final_query, final_params_for_data, keyset, per_page + 1)
+            has_more = len(documents_list_raw) > per_page
+            documents_list_raw = documents_list_raw[:per_page]
+        catalog = get_catalog(db)
+        for doc in documents_list_raw:
+            software = catalog.get_software(doc['software_id'])
+            doc['software_name'] = software['name'] if software else None
+        next_cursor = next_page_cursor(documents_list_raw, has_more, sort_by_param, sort_order)
         ts_keys = ['created_at', 'updated_at']
         documents_list = [convert_timestamps_to_ist_iso(doc, ts_keys) for doc in documents_list_raw]
     except Exception as e:
         app.logger.error(f"Error fetching paginated documents with permissions: {e} with query {final_query} and params {final_params_for_data}")
         return jsonify(msg="Error fetching documents."), 500
 
+    if keyset is not None:
+        return jsonify({"documents": documents_list, "per_page": per_page, "next_cursor": next_cursor}), 200
+
     return jsonify({
         "documents": documents_list,
         "page": page,
         "per_page": per_page,
         "total_documents": total_documents,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
     }), 200
 
 @app.route('/api/patches', methods=['GET'])
+@readonly_db
+@versioned_response(['patches', 'versions', 'software', USERNAMES, 'patch_vms_compatibility'], per_user=True)
 def get_all_patches_api():
     db = get_db()
 
@@ -2747,6 +3667,7 @@ def get_all_patches_api():
     per_page = request.args.get('per_page', default=10, type=int)
     sort_by_param = request.args.get('sort_by', default='patch_name', type=str) # Default to patch_name
     sort_order = request.args.get('sort_order', default='asc', type=str).lower()
+    page_cursor = request.args.get('cursor', type=str) # Opt-in keyset pagination; replaces `page`
 
     # Get existing filter parameters
     software_id_filter = request.args.get('software_id', type=int)
@@ -2755,6 +3676,7 @@ def get_all_patches_api():
     release_from_filter = request.args.get('release_from', type=str)
     release_to_filter = request.args.get('release_to', type=str)
     patched_by_developer_filter = request.args.get('patched_by_developer', type=str)
+    vms_version_id_filter = request.args.get('vms_version_id', type=int) # Patches compatible with this VMS version
 
     if page <= 0:
         page = 1
@@ -2772,16 +3694,25 @@ def get_all_patches_api():
         'uploaded_by_username': 'u.username', # Retained (creator)
         'created_at': 'p.created_at',
         'updated_at': 'p.updated_at',
-        'compatible_vms_versions': 'compatible_vms_versions' # New sort option
+        'compatible_vms_versions': 'p.compatible_vms_versions' # Denormalized, see database.refresh_vms_compatibility()
     }
     
+    if sort_by_param not in allowed_sort_by_map:
+        sort_by_param = 'patch_name'
     sort_by_column = allowed_sort_by_map.get(sort_by_param, 'p.patch_name') 
 
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
 
+    keyset = None
+    if page_cursor:
+        try:
+            keyset = keyset_conditions(sort_by_column, 'p.id', sort_order, *decode_page_cursor(page_cursor, sort_by_param, sort_order))
+        except ValueError as e:
+            return jsonify(msg=f"Invalid cursor: {e}"), 400
+
     # Construct Base Query and Parameters for Filtering
-    # Added GROUP_CONCAT for compatible_vms_versions
+    # compatible_vms_versions is maintained on the patch row (migration 0007), so no GROUP BY is needed
     base_query_select_fields = """
         p.id, p.version_id, p.patch_name, p.description, p.release_date,
         p.is_external_link, p.download_link, p.stored_filename, p.original_filename_ref,
@@ -2789,11 +3720,7 @@ def get_all_patches_api():
         p.created_by_user_id, u.username as uploaded_by_username, p.created_at,
         p.updated_by_user_id, upd_u.username as updated_by_username, p.updated_at,
         s.name as software_name, s.id as software_id, v.version_number,
-        (SELECT COUNT(*) FROM comments c WHERE c.item_id = p.id AND c.item_type = 'patch' AND c.parent_comment_id IS NULL) as comment_count,
-        CASE
-            WHEN s.name IN ('VMS', 'VA') THEN GROUP_CONCAT(DISTINCT vms_v.version_number)
-            ELSE NULL
-        END as compatible_vms_versions
+        p.top_level_comment_count as comment_count, p.compatible_vms_versions
     """
     base_query_from = """
     FROM patches p
@@ -2801,11 +3728,7 @@ def get_all_patches_api():
     JOIN software s ON v.software_id = s.id
     LEFT JOIN users u ON p.created_by_user_id = u.id
     LEFT JOIN users upd_u ON p.updated_by_user_id = upd_u.id
-    LEFT JOIN patch_vms_compatibility pvc ON p.id = pvc.patch_id AND s.name IN ('VMS', 'VA')
-    LEFT JOIN versions vms_v ON pvc.vms_version_id = vms_v.id
     """
-    # Note: The condition `s.name IN ('VMS', 'VA')` in the JOIN for pvc ensures we only join for relevant software.
-    # The GROUP_CONCAT will only populate for these software types due to the CASE statement.
     
     params = [] 
     user_id_param_for_join = []
@@ -2825,122 +3748,122 @@ def get_all_patches_api():
     # The select_clause will build upon base_query_select_fields
 
     # --- PERMISSION MODEL CHANGE ---
+    denies = get_file_denies(db, logged_in_user_id)
+    downloadable_sql, downloadable_params = denies.downloadable_column('patch', 'p.id')
     if logged_in_user_id:
-        select_clause = f"SELECT {base_query_select_fields}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields}, uf.id AS favorite_id, {downloadable_sql} AS is_downloadable"
     else:
-        select_clause = f"SELECT {base_query_select_fields}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields}, NULL AS favorite_id, {downloadable_sql} AS is_downloadable"
 
     # from_clause is now base_query_from
-    from_clause_for_main_query = base_query_from # Use the new base_query_from which includes VMS compatibility joins
+    from_clause_for_main_query = base_query_from
     
     params = [] # Params for WHERE clause filters
-    permission_join_params = [logged_in_user_id] # Param for the LEFT JOIN fp.user_id = ?
     filter_conditions = []
 
-    # Permission Join and Conditions
-    # --- PERMISSION MODEL CHANGE ---
-    # The base_query_from already includes joins needed for s.name and patch_vms_compatibility.
-    # We add the file_permissions join here.
-    from_clause_for_main_query += " LEFT JOIN file_permissions fp ON p.id = fp.file_id AND fp.file_type = 'patch' AND fp.user_id = ?" # View permission join
-    # Param for this join (logged_in_user_id) will be added to permission_join_params.
-    filter_conditions.append("(fp.id IS NULL OR fp.can_view = 1)") # Final view condition
-    # No need to append logged_in_user_id to `params` here for this filter condition.
+    # View permission: drop the patches this user is denied (no condition if there are none)
+    view_condition = denies.view_condition('patch', 'p.id')
+    if view_condition:
+        filter_conditions.append(view_condition[0])
+        params.extend(view_condition[1])
 
     # Existing Filters
     if software_id_filter:
         filter_conditions.append("s.id = ?") 
         params.append(software_id_filter)
-    if release_from_filter:
-        filter_conditions.append("date(p.release_date) >= date(?)")
-        params.append(release_from_filter)
-    if release_to_filter:
-        filter_conditions.append("date(p.release_date) <= date(?)")
-        params.append(release_to_filter)
+    try:
+        if release_from_filter:
+            filter_conditions.append("p.release_date >= ?")
+            params.append(day_range_start(release_from_filter))
+        if release_to_filter:
+            filter_conditions.append("p.release_date < ?")
+            params.append(day_range_end(release_to_filter))
+    except ValueError:
+        return jsonify(msg="Invalid date filter format. Expected YYYY-MM-DD."), 400
     if patched_by_developer_filter:
         filter_conditions.append("LOWER(p.patch_by_developer) LIKE ?")
         params.append(f"%{patched_by_developer_filter.lower()}%")
+    if vms_version_id_filter:
+        # Index seek on idx_patch_vms_compatibility_vms_version; compatibility only counts for VMS/VA patches
+        filter_conditions.append("p.id IN (SELECT patch_id FROM patch_vms_compatibility WHERE vms_version_id = ?) AND p.compatible_vms_versions IS NOT NULL")
+        params.append(vms_version_id_filter)
     
     where_clause = ""
     if filter_conditions:
         where_clause = " WHERE " + " AND ".join(filter_conditions)
 
     # Count Query
-    count_params = permission_join_params + params # permission_join_params includes user_id for fp join
-    # The from_clause_for_main_query is used here as it contains all necessary joins for filtering.
-    # However, for COUNT, we only need to ensure the WHERE conditions are applied correctly based on these joins.
-    # The base_query_from already includes the necessary joins for s.name (software) and vms_v (vms versions for potential future filtering if needed)
-    # The permission join (fp) is added to from_clause_for_main_query.
-    # So, from_clause_for_main_query is appropriate here.
-    # IMPORTANT: GROUP BY for count query if base_query_from has LEFT JOINs that multiply rows (like pvc, vms_v)
-    # To count distinct patches: COUNT(DISTINCT p.id)
-    count_query = f"SELECT COUNT(DISTINCT p.id) as count {from_clause_for_main_query}{where_clause}"
-    try:
-        total_patches_cursor = db.execute(count_query, tuple(count_params))
-        total_patches = total_patches_cursor.fetchone()['count']
-    except Exception as e:
-        app.logger.error(f"Error fetching total patch count with permissions: {e} using query {count_query} and params {tuple(count_params)}")
-        return jsonify(msg="Error fetching patch count."), 500
+    count_params = params
+    # The joins only add columns (one row per patch), so the WHERE conditions are all the COUNT needs.
+    count_query = f"SELECT COUNT(p.id) as count {from_clause_for_main_query}{where_clause}"
+    if keyset is None: # Cursor pages skip the COUNT
+        try:
+            total_patches = cached_count(db, count_query, count_params, ['patches', 'versions', 'software', USERNAMES, 'patch_vms_compatibility'])
+        except Exception as e:
+            app.logger.error(f"Error fetching total patch count with permissions: {e} using query {count_query} and params {tuple(count_params)}")
+            return jsonify(msg="Error fetching patch count."), 500
 
-    # Pagination Details
-    total_pages = math.ceil(total_patches / per_page) if total_patches > 0 else 1
-    offset = (page - 1) * per_page
-    if page > total_pages and total_patches > 0:
-        page = total_pages
+        # Pagination Details
+        total_pages = math.ceil(total_patches / per_page) if total_patches > 0 else 1
         offset = (page - 1) * per_page
+        if page > total_pages and total_patches > 0:
+            page = total_pages
+            offset = (page - 1) * per_page
     
     # Main Data Query
     # final_from_clause_for_data should be from_clause_for_main_query
     # final_params_for_data needs to be assembled carefully
 
-    final_params_for_data = list(permission_join_params) # Starts with user_id for fp join
+    final_params_for_data = list(downloadable_params) # is_downloadable in the select list comes first
 
     if logged_in_user_id:
         # Add JOIN for favorite status to from_clause_for_main_query for the data query part
-        from_clause_for_data_with_fav = from_clause_for_main_query + " LEFT JOIN user_favorites uf ON p.id = uf.item_id AND uf.item_type = 'patch' AND uf.user_id = ?"
+        from_clause_for_data_with_fav_dl = from_clause_for_main_query + " LEFT JOIN user_favorites uf ON p.id = uf.item_id AND uf.item_type = 'patch' AND uf.user_id = ?"
         final_params_for_data.append(logged_in_user_id) # Param for uf join
-        
-        # Add separate LEFT JOIN for download permission (fp_dl)
-        from_clause_for_data_with_fav_dl = from_clause_for_data_with_fav + " LEFT JOIN file_permissions fp_dl ON p.id = fp_dl.file_id AND fp_dl.file_type = 'patch' AND fp_dl.user_id = ?"
-        final_params_for_data.append(logged_in_user_id) # Param for fp_dl join
     else:
-        # Add fp_dl join for anonymous users as well
-        from_clause_for_data_with_fav_dl = from_clause_for_main_query + " LEFT JOIN file_permissions fp_dl ON p.id = fp_dl.file_id AND fp_dl.file_type = 'patch' AND fp_dl.user_id = ?"
-        final_params_for_data.append(None) # Param for fp_dl join (None for anonymous)
+        from_clause_for_data_with_fav_dl = from_clause_for_main_query
 
     final_params_for_data.extend(params) # Add WHERE clause filter parameters
 
-    # Add GROUP BY clause here, before ORDER BY
-    # Group by all selected fields from 'p', 's', 'v', 'u', 'upd_u' to ensure GROUP_CONCAT works correctly
-    # The fields in base_query_select_fields (excluding GROUP_CONCAT and comment_count) should be in GROUP BY.
-    # This is a simplified GROUP BY; a more precise one would list all non-aggregated columns.
-    # For SQLite, grouping by primary key of the main table (p.id) is often sufficient if other columns are functionally dependent.
-    group_by_clause = " GROUP BY p.id " # Grouping by p.id should be enough for GROUP_CONCAT
-
-    final_params_for_data.extend([per_page, offset]) # Add pagination params
-
-    # If sort_by_column is 'compatible_vms_versions', it's an aggregated field,
-    # so it should work with GROUP BY. Otherwise, it should be part of the GROUP BY or functionally dependent.
-    # For simplicity, we assume SQLite handles this correctly with `GROUP BY p.id`.
-    final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{where_clause}{group_by_clause}ORDER BY {sort_by_column} {sort_order.upper()} LIMIT ? OFFSET ?"
+    order_by_clause = f" ORDER BY {sort_by_column} {sort_order.upper()}, p.id {sort_order.upper()}" # id breaks ties, as the cursor does
+    if keyset is None:
+        final_params_for_data.extend([per_page, offset]) # Add pagination params
+        final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{where_clause}{order_by_clause} LIMIT ? OFFSET ?"
+    else:
+        keyset_where_clause = f"{where_clause} AND {{keyset}}" if where_clause else " WHERE {keyset}"
+        final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{keyset_where_clause}{order_by_clause} LIMIT ?"
     
     try:
-        patches_cursor = db.execute(final_query, tuple(final_params_for_data))
-        patches_list_raw = [dict(row) for row in patches_cursor.fetchall()]
+        if keyset is None:
+            patches_cursor = db.execute(final_query, tuple(final_params_for_data))
+            patches_list_raw = database.fetch_dicts(patches_cursor)
+            has_more = page < total_pages
+        else:
+            patches_list_raw = fetch_keyset_rows(db, final_query, final_params_for_data, keyset, per_page + 1)
+            has_more = len(patches_list_raw) > per_page
+            patches_list_raw = patches_list_raw[:per_page]
+        next_cursor = next_page_cursor(patches_list_raw, has_more, sort_by_param, sort_order)
         ts_keys = ['created_at', 'updated_at'] # release_date is DATE
         patches_list = [convert_timestamps_to_ist_iso(patch, ts_keys) for patch in patches_list_raw]
     except Exception as e:
         app.logger.error(f"Error fetching paginated patches with permissions: {e} with query {final_query} and params {tuple(final_params_for_data)}")
         return jsonify(msg="Error fetching patches."), 500
 
+    if keyset is not None:
+        return jsonify({"patches": patches_list, "per_page": per_page, "next_cursor": next_cursor}), 200
+
     return jsonify({
         "patches": patches_list,
         "page": page,
         "per_page": per_page,
         "total_patches": total_patches,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
     }), 200
 
 @app.route('/api/links', methods=['GET'])
+@readonly_db
+@versioned_response(['links', 'software', 'versions', USERNAMES, 'link_vms_compatibility'], per_user=True)
 def get_all_links_api():
     db = get_db()
 
@@ -2949,6 +3872,7 @@ def get_all_links_api():
     per_page = request.args.get('per_page', default=10, type=int)
     sort_by_param = request.args.get('sort_by', default='title', type=str) 
     sort_order = request.args.get('sort_order', default='asc', type=str).lower()
+    page_cursor = request.args.get('cursor', type=str) # Opt-in keyset pagination; replaces `page`
     searchTerm = request.args.get('search', type=str) # Added searchTerm
 
     # Get existing filter parameters
@@ -2959,6 +3883,7 @@ def get_all_links_api():
     link_type_filter = request.args.get('link_type', type=str)
     created_from_filter = request.args.get('created_from', type=str)
     created_to_filter = request.args.get('created_to', type=str)
+    vms_version_id_filter = request.args.get('vms_version_id', type=int) # Links compatible with this VMS version
 
     if page <= 0:
         page = 1
@@ -2974,14 +3899,23 @@ def get_all_links_api():
         'uploaded_by_username': 'u.username', # Added for sorting by creator
         'created_at': 'l.created_at',
         'updated_at': 'l.updated_at',
-        'compatible_vms_versions': 'compatible_vms_versions' # New sort option for links
+        'compatible_vms_versions': 'l.compatible_vms_versions' # Denormalized, see database.refresh_vms_compatibility()
     }
     
+    if sort_by_param not in allowed_sort_by_map:
+        sort_by_param = 'title'
     sort_by_column = allowed_sort_by_map.get(sort_by_param, 'l.title') 
 
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
 
+    keyset = None
+    if page_cursor:
+        try:
+            keyset = keyset_conditions(sort_by_column, 'l.id', sort_order, *decode_page_cursor(page_cursor, sort_by_param, sort_order))
+        except ValueError as e:
+            return jsonify(msg=f"Invalid cursor: {e}"), 400
+
     # Construct Base Query and Parameters for Filtering
     base_query_select_fields = """
         l.id, l.title, l.description, l.software_id, l.version_id,
@@ -2990,23 +3924,16 @@ def get_all_links_api():
         l.created_by_user_id, u.username as uploaded_by_username, l.created_at,
         l.updated_by_user_id, upd_u.username as updated_by_username, l.updated_at,
         s.name as software_name, s.id as link_software_id, v.version_number as version_name,
-        (SELECT COUNT(*) FROM comments c WHERE c.item_id = l.id AND c.item_type = 'link' AND c.parent_comment_id IS NULL) as comment_count,
-        CASE
-            WHEN s.name IN ('VMS', 'VA') THEN GROUP_CONCAT(DISTINCT vms_v_link.version_number)
-            ELSE NULL
-        END as compatible_vms_versions
+        l.top_level_comment_count as comment_count, l.compatible_vms_versions
     """
-    # Added s.id as link_software_id to avoid conflict if vms_v also has software_id selected
+    # compatible_vms_versions is maintained on the link row (migration 0007), so no GROUP BY is needed
     base_query_from = """
     FROM links l
     JOIN software s ON l.software_id = s.id
     LEFT JOIN versions v ON l.version_id = v.id
     LEFT JOIN users u ON l.created_by_user_id = u.id
     LEFT JOIN users upd_u ON l.updated_by_user_id = upd_u.id
-    LEFT JOIN link_vms_compatibility lvc ON l.id = lvc.link_id AND s.name IN ('VMS', 'VA')
-    LEFT JOIN versions vms_v_link ON lvc.vms_version_id = vms_v_link.id
     """
-    # Aliased vms_v to vms_v_link for clarity and to avoid conflicts if patches section also uses vms_v
     
     params = []
     # user_id_param_for_join = [] # Not used in this structure
@@ -3025,28 +3952,27 @@ def get_all_links_api():
     # base_query_select_fields_with_aliases is now base_query_select_fields
     
     # --- PERMISSION MODEL CHANGE ---
+    denies = get_file_denies(db, logged_in_user_id)
+    downloadable_sql, downloadable_params = denies.downloadable_column('link', 'l.id')
     if logged_in_user_id:
-        select_clause = f"SELECT {base_query_select_fields}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields}, uf.id AS favorite_id, {downloadable_sql} AS is_downloadable"
     else:
-        select_clause = f"SELECT {base_query_select_fields}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields}, NULL AS favorite_id, {downloadable_sql} AS is_downloadable"
 
     # from_clause_main_query will use the new base_query_from
     from_clause_main_query = base_query_from
     
-    # Params for the main query's WHERE clause (excluding permission join params for now)
+    # Params for the main query's WHERE clause
     main_query_filter_params = [] 
     count_query_conditions = [] # Initialize count_query_conditions
-    # Params for the permission part of the main query's JOIN/WHERE.
-    # For main query, fp.user_id = ? uses logged_in_user_id.
-    main_query_permission_params = [logged_in_user_id] 
     
     filter_conditions = []
 
-    # Permission related JOIN for main query (fp for view permission)
-    # The base_query_from for links already includes necessary software, version, user joins.
-    # Add file_permissions join here.
-    from_clause_main_query += " LEFT JOIN file_permissions fp ON l.id = fp.file_id AND fp.file_type = 'link' AND fp.user_id = ?"
-    filter_conditions.append("(fp.id IS NULL OR fp.can_view = 1)")
+    # View permission: drop the links this user is denied (no condition if there are none)
+    view_condition = denies.view_condition('link', 'l.id')
+    if view_condition:
+        filter_conditions.append(view_condition[0])
+        main_query_filter_params.extend(view_condition[1])
         
     # Existing Filters
     if software_id_filter:
@@ -3060,12 +3986,19 @@ def get_all_links_api():
             filter_conditions.append("l.is_external_link = TRUE")
         elif link_type_filter.lower() == 'uploaded':
             filter_conditions.append("l.is_external_link = FALSE")
-    if created_from_filter:
-        filter_conditions.append("date(l.created_at) >= date(?)")
-        main_query_filter_params.append(created_from_filter)
-    if created_to_filter:
-        filter_conditions.append("date(l.created_at) <= date(?)")
-        main_query_filter_params.append(created_to_filter)
+    if vms_version_id_filter:
+        # Index seek on idx_link_vms_compatibility_vms_version; compatibility only counts for VMS/VA links
+        filter_conditions.append("l.id IN (SELECT link_id FROM link_vms_compatibility WHERE vms_version_id = ?) AND l.compatible_vms_versions IS NOT NULL")
+        main_query_filter_params.append(vms_version_id_filter)
+    try:
+        if created_from_filter:
+            filter_conditions.append("l.created_at >= ?")
+            main_query_filter_params.append(day_range_start(created_from_filter))
+        if created_to_filter:
+            filter_conditions.append("l.created_at < ?")
+            main_query_filter_params.append(day_range_end(created_to_filter))
+    except ValueError:
+        return jsonify(msg="Invalid date filter format. Expected YYYY-MM-DD."), 400
 
     # Search Term Processing
     search_terms = []
@@ -3097,86 +4030,87 @@ def get_all_links_api():
 
     # --- Count Query Construction ---
     # Base for count query will use from_clause_main_query as it includes all necessary joins for filtering.
-    # This ensures consistency in which items are counted vs. fetched.
-    # Need to use COUNT(DISTINCT l.id) due to potential row multiplication from LEFT JOINs (esp. vms_v_link).
+    # This ensures consistency in which items are counted vs. fetched. The joins are one row per link.
     
-    # Correctly initialize count_query_params: only permission and filter parameters
-    count_query_params = list(main_query_permission_params) 
-    count_query_params.extend(main_query_filter_params)
+    count_query_params = list(main_query_filter_params) # Includes the view permission condition's params
 
-    # The from_clause_main_query already has the permission join.
     # The where_clause is built from filter_conditions which also includes permission check.
-    final_count_query = f"SELECT COUNT(DISTINCT l.id) as count {from_clause_main_query}{where_clause}"
+    final_count_query = f"SELECT COUNT(l.id) as count {from_clause_main_query}{where_clause}"
     
-    try:
-        total_links_cursor = db.execute(final_count_query, tuple(count_query_params))
-        total_links_result = total_links_cursor.fetchone()
-        total_links = total_links_result['count'] if total_links_result else 0
-    except Exception as e:
-        app.logger.error(f"Error fetching total link count with permissions: {e} using query {final_count_query} and params {tuple(count_query_params)}")
-        return jsonify(msg="Error fetching link count."), 500
+    if keyset is None: # Cursor pages skip the COUNT
+        try:
+            total_links = cached_count(db, final_count_query, count_query_params, ['links', 'software', 'versions', USERNAMES, 'link_vms_compatibility'])
+        except Exception as e:
+            app.logger.error(f"Error fetching total link count with permissions: {e} using query {final_count_query} and params {tuple(count_query_params)}")
+            return jsonify(msg="Error fetching link count."), 500
 
-    # Pagination Details
-    total_pages = math.ceil(total_links / per_page) if total_links > 0 else 1
-    offset = (page - 1) * per_page
-    if page > total_pages and total_links > 0:
-        page = total_pages
+        # Pagination Details
+        total_pages = math.ceil(total_links / per_page) if total_links > 0 else 1
         offset = (page - 1) * per_page
+        if page > total_pages and total_links > 0:
+            page = total_pages
+            offset = (page - 1) * per_page
     
     # --- Main Data Query Construction ---
     # Correctly order parameters for the final query
-    final_main_query_params = []
-    final_main_query_params.extend(main_query_permission_params) # For fp.user_id = ? (view permission join)
+    final_main_query_params = list(downloadable_params) # is_downloadable in the select list comes first
 
-    from_clause_for_data_with_fav_dl = from_clause_main_query # Start with the from clause used for count (which includes fp join)
+    from_clause_for_data_with_fav_dl = from_clause_main_query # Start with the from clause used for count
 
     if logged_in_user_id:
         # Add JOIN and param for user_favorites (uf)
         from_clause_for_data_with_fav_dl += " LEFT JOIN user_favorites uf ON l.id = uf.item_id AND uf.item_type = 'link' AND uf.user_id = ?"
         final_main_query_params.append(logged_in_user_id) # Param for uf.user_id = ?
         
-        # Add JOIN and param for file_permissions for download (fp_dl)
-        from_clause_for_data_with_fav_dl += " LEFT JOIN file_permissions fp_dl ON l.id = fp_dl.file_id AND fp_dl.file_type = 'link' AND fp_dl.user_id = ?"
-        final_main_query_params.append(logged_in_user_id) # Param for fp_dl.user_id = ? (for logged-in user)
-    else:
-        # Add JOIN and param for file_permissions for download (fp_dl) for anonymous user
-        from_clause_for_data_with_fav_dl += " LEFT JOIN file_permissions fp_dl ON l.id = fp_dl.file_id AND fp_dl.file_type = 'link' AND fp_dl.user_id = ?"
-        final_main_query_params.append(None) # Param for fp_dl.user_id = ? (for anonymous user)
-        
     # Add parameters for the WHERE clause conditions
     final_main_query_params.extend(main_query_filter_params)
 
-    # Add pagination parameters
-    final_main_query_params.extend([per_page, offset])
-
-    # Add GROUP BY for the main data query, similar to patches
-    group_by_clause_links = " GROUP BY l.id "
-
-    final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{where_clause}{group_by_clause_links}ORDER BY {sort_by_column} {sort_order.upper()} LIMIT ? OFFSET ?"
+    order_by_clause = f" ORDER BY {sort_by_column} {sort_order.upper()}, l.id {sort_order.upper()}" # id breaks ties, as the cursor does
+    if keyset is None:
+        # Add pagination parameters
+        final_main_query_params.extend([per_page, offset])
+        final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{where_clause}{order_by_clause} LIMIT ? OFFSET ?"
+    else:
+        keyset_where_clause = f"{where_clause} AND {{keyset}}" if where_clause else " WHERE {keyset}"
+        final_query = f"{select_clause} {from_clause_for_data_with_fav_dl}{keyset_where_clause}{order_by_clause} LIMIT ?"
     
     try:
-        links_cursor = db.execute(final_query, tuple(final_main_query_params)) # Use final_main_query_params
-        links_list_raw = [dict(row) for row in links_cursor.fetchall()]
+        if keyset is None:
+            links_cursor = db.execute(final_query, tuple(final_main_query_params)) # Use final_main_query_params
+            links_list_raw = database.fetch_dicts(links_cursor)
+            has_more = page < total_pages
+        else:
+            links_list_raw = fetch_keyset_rows(db, final_query, final_main_query_params, keyset, per_page + 1)
+            has_more = len(links_list_raw) > per_page
+            links_list_raw = links_list_raw[:per_page]
+        next_cursor = next_page_cursor(links_list_raw, has_more, sort_by_param, sort_order)
         ts_keys = ['created_at', 'updated_at']
         links_list = [convert_timestamps_to_ist_iso(link, ts_keys) for link in links_list_raw]
     except Exception as e:
         app.logger.error(f"Error fetching paginated links with permissions: {e} with query {final_query} and params {tuple(count_query_params)}")
         return jsonify(msg="Error fetching links."), 500
 
+    if keyset is not None:
+        return jsonify({"links": links_list, "per_page": per_page, "next_cursor": next_cursor}), 200
+
     return jsonify({
         "links": links_list,
         "page": page,
         "per_page": per_page,
         "total_links": total_links,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
     }), 200
 
 @app.route('/api/misc_categories', methods=['GET'])
+@versioned_response(['misc_categories'])
 def get_all_misc_categories_api():
     categories = get_db().execute("SELECT id, name, description FROM misc_categories ORDER BY name").fetchall()
     return jsonify([dict(row) for row in categories])
 
 @app.route('/api/misc_files', methods=['GET'])
+@readonly_db
+@versioned_response(['misc_files', 'misc_categories', USERNAMES], per_user=True)
 def get_all_misc_files_api():
     db = get_db()
 
@@ -3185,6 +4119,7 @@ def get_all_misc_files_api():
     per_page = request.args.get('per_page', default=10, type=int)
     sort_by_param = request.args.get('sort_by', default='user_provided_title', type=str) 
     sort_order = request.args.get('sort_order', default='asc', type=str).lower()
+    page_cursor = request.args.get('cursor', type=str) # Opt-in keyset pagination; replaces `page`
     searchTerm = request.args.get('search', type=str) # Added searchTerm
 
     # Get existing filter parameters
@@ -3208,13 +4143,22 @@ def get_all_misc_files_api():
         # patch_by_developer is not applicable
     }
     
+    if sort_by_param not in allowed_sort_by_map:
+        sort_by_param = 'user_provided_title'
     sort_by_column = allowed_sort_by_map.get(sort_by_param, 'mf.user_provided_title')
 
     if sort_order not in ['asc', 'desc']:
         sort_order = 'asc'
 
+    keyset = None
+    if page_cursor:
+        try:
+            keyset = keyset_conditions(sort_by_column, 'mf.id', sort_order, *decode_page_cursor(page_cursor, sort_by_param, sort_order))
+        except ValueError as e:
+            return jsonify(msg=f"Invalid cursor: {e}"), 400
+
     # Construct Base Query and Parameters for Filtering
-    base_query_select_fields = "mf.id, mf.misc_category_id, mf.user_id, mf.user_provided_title, mf.user_provided_description, mf.original_filename, mf.stored_filename, mf.file_path, mf.file_type, mf.file_size, mf.created_by_user_id, u.username as uploaded_by_username, mf.created_at, mf.updated_by_user_id, upd_u.username as updated_by_username, mf.updated_at, mc.name as category_name, (SELECT COUNT(*) FROM comments c WHERE c.item_id = mf.id AND c.item_type = 'misc_file' AND c.parent_comment_id IS NULL) as comment_count"
+    base_query_select_fields = "mf.id, mf.misc_category_id, mf.user_id, mf.user_provided_title, mf.user_provided_description, mf.original_filename, mf.stored_filename, mf.file_path, mf.file_type, mf.file_size, mf.created_by_user_id, u.username as uploaded_by_username, mf.created_at, mf.updated_by_user_id, upd_u.username as updated_by_username, mf.updated_at, mc.name as category_name, mf.top_level_comment_count as comment_count"
     base_query_from = "FROM misc_files mf JOIN misc_categories mc ON mf.misc_category_id = mc.id LEFT JOIN users u ON mf.created_by_user_id = u.id LEFT JOIN users upd_u ON mf.updated_by_user_id = upd_u.id" # upd_u for updated_by_username
     
     # params = [] # Replaced by main_query_filter_params
@@ -3231,23 +4175,26 @@ def get_all_misc_files_api():
         app.logger.error(f"Error getting user_id in get_all_misc_files_api: {e}")
 
     # Base query components
-    base_query_select_fields_with_aliases = "mf.id, mf.misc_category_id, mf.user_id, mf.user_provided_title, mf.user_provided_description, mf.original_filename, mf.stored_filename, mf.file_path, mf.file_type, mf.file_size, mf.created_by_user_id, u.username as uploaded_by_username, mf.created_at, mf.updated_by_user_id, upd_u.username as updated_by_username, mf.updated_at, mc.name as category_name, (SELECT COUNT(*) FROM comments c WHERE c.item_id = mf.id AND c.item_type = 'misc_file' AND c.parent_comment_id IS NULL) as comment_count"
+    base_query_select_fields_with_aliases = "mf.id, mf.misc_category_id, mf.user_id, mf.user_provided_title, mf.user_provided_description, mf.original_filename, mf.stored_filename, mf.file_path, mf.file_type, mf.file_size, mf.created_by_user_id, u.username as uploaded_by_username, mf.created_at, mf.updated_by_user_id, upd_u.username as updated_by_username, mf.updated_at, mc.name as category_name, mf.top_level_comment_count as comment_count"
 
     # --- PERMISSION MODEL CHANGE ---
+    denies = get_file_denies(db, logged_in_user_id)
+    downloadable_sql, downloadable_params = denies.downloadable_column('misc_file', 'mf.id')
     if logged_in_user_id:
-        select_clause = f"SELECT {base_query_select_fields_with_aliases}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields_with_aliases}, uf.id AS favorite_id, {downloadable_sql} AS is_downloadable"
     else:
-        select_clause = f"SELECT {base_query_select_fields_with_aliases}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
+        select_clause = f"SELECT {base_query_select_fields_with_aliases}, NULL AS favorite_id, {downloadable_sql} AS is_downloadable"
 
     from_clause_main_query = "FROM misc_files mf JOIN misc_categories mc ON mf.misc_category_id = mc.id LEFT JOIN users u ON mf.created_by_user_id = u.id LEFT JOIN users upd_u ON mf.updated_by_user_id = upd_u.id" # upd_u for updated_by_username
     
     main_query_filter_params = []
-    main_query_permission_params = [logged_in_user_id]
     filter_conditions = []
 
-    # Permission Join for main query
-    from_clause_main_query += " LEFT JOIN file_permissions fp ON mf.id = fp.file_id AND fp.file_type = 'misc_file' AND fp.user_id = ?"
-    filter_conditions.append("(fp.id IS NULL OR fp.can_view = 1)")
+    # View permission: drop the files this user is denied (no condition if there are none)
+    view_condition = denies.view_condition('misc_file', 'mf.id')
+    if view_condition:
+        filter_conditions.append(view_condition[0])
+        main_query_filter_params.extend(view_condition[1])
 
     # Existing Filters
     if category_id_filter:
@@ -3294,10 +4241,10 @@ def get_all_misc_files_api():
     if search_terms:
         count_query_joins.append("LEFT JOIN users upd_u ON mf.updated_by_user_id = upd_u.id")
 
-    # Permission join for count query (fp_count)
-    count_query_joins.append("LEFT JOIN file_permissions fp_count ON mf.id = fp_count.file_id AND fp_count.file_type = 'misc_file' AND fp_count.user_id = ?")
-    count_query_params.append(logged_in_user_id)
-    count_query_conditions.append("(fp_count.id IS NULL OR fp_count.can_view = 1)")
+    # View permission for the count query
+    if view_condition:
+        count_query_conditions.append(view_condition[0])
+        count_query_params.extend(view_condition[1])
 
     if category_id_filter:
         count_query_conditions.append("mf.misc_category_id = ?")
@@ -3322,54 +4269,63 @@ def get_all_misc_files_api():
     if count_query_conditions:
         final_count_query += " WHERE " + " AND ".join(count_query_conditions)
 
-    try:
-        total_misc_files_cursor = db.execute(final_count_query, tuple(count_query_params))
-        total_misc_files_result = total_misc_files_cursor.fetchone()
-        total_misc_files = total_misc_files_result['count'] if total_misc_files_result else 0
-    except Exception as e:
-        app.logger.error(f"Error fetching total misc_files count: {e} using query {final_count_query} and params {tuple(count_query_params)}")
-        return jsonify(msg="Error fetching misc_files count."), 500
+    if keyset is None: # Cursor pages skip the COUNT
+        try:
+            total_misc_files = cached_count(db, final_count_query, count_query_params, ['misc_files', 'misc_categories', USERNAMES])
+        except Exception as e:
+            app.logger.error(f"Error fetching total misc_files count: {e} using query {final_count_query} and params {tuple(count_query_params)}")
+            return jsonify(msg="Error fetching misc_files count."), 500
 
-    # Pagination Details
-    total_pages = math.ceil(total_misc_files / per_page) if total_misc_files > 0 else 1
-    offset = (page - 1) * per_page
-    if page > total_pages and total_misc_files > 0:
-        page = total_pages
+        # Pagination Details
+        total_pages = math.ceil(total_misc_files / per_page) if total_misc_files > 0 else 1
         offset = (page - 1) * per_page
+        if page > total_pages and total_misc_files > 0:
+            page = total_pages
+            offset = (page - 1) * per_page
     
     # --- Main Data Query Construction ---
-    final_main_query_params = list(main_query_permission_params)
+    final_main_query_params = list(downloadable_params) # is_downloadable in the select list comes first
 
     if logged_in_user_id:
         from_clause_main_query += " LEFT JOIN user_favorites uf ON mf.id = uf.item_id AND uf.item_type = 'misc_file' AND uf.user_id = ?"
         final_main_query_params.append(logged_in_user_id)
-        
-        from_clause_main_query += " LEFT JOIN file_permissions fp_dl ON mf.id = fp_dl.file_id AND fp_dl.file_type = 'misc_file' AND fp_dl.user_id = ?"
-        final_main_query_params.append(logged_in_user_id)
-    else:
-        from_clause_main_query += " LEFT JOIN file_permissions fp_dl ON mf.id = fp_dl.file_id AND fp_dl.file_type = 'misc_file' AND fp_dl.user_id = ?"
-        final_main_query_params.append(None)
     
     final_main_query_params.extend(main_query_filter_params)
-    final_main_query_params.extend([per_page, offset])
-    
-    final_query = f"{select_clause} {from_clause_main_query}{where_clause} ORDER BY {sort_by_column} {sort_order.upper()} LIMIT ? OFFSET ?"
+
+    order_by_clause = f" ORDER BY {sort_by_column} {sort_order.upper()}, mf.id {sort_order.upper()}" # id breaks ties, as the cursor does
+    if keyset is None:
+        final_main_query_params.extend([per_page, offset])
+        final_query = f"{select_clause} {from_clause_main_query}{where_clause}{order_by_clause} LIMIT ? OFFSET ?"
+    else:
+        keyset_where_clause = f"{where_clause} AND {{keyset}}" if where_clause else " WHERE {keyset}"
+        final_query = f"{select_clause} {from_clause_main_query}{keyset_where_clause}{order_by_clause} LIMIT ?"
     
     try:
-        misc_files_cursor = db.execute(final_query, tuple(final_main_query_params))
-        misc_files_list_raw = [dict(row) for row in misc_files_cursor.fetchall()]
+        if keyset is None:
+            misc_files_cursor = db.execute(final_query, tuple(final_main_query_params))
+            misc_files_list_raw = database.fetch_dicts(misc_files_cursor)
+            has_more = page < total_pages
+        else:
+            misc_files_list_raw = fetch_keyset_rows(db, final_query, final_main_query_params, keyset, per_page + 1)
+            has_more = len(misc_files_list_raw) > per_page
+            misc_files_list_raw = misc_files_list_raw[:per_page]
+        next_cursor = next_page_cursor(misc_files_list_raw, has_more, sort_by_param, sort_order)
         ts_keys = ['created_at', 'updated_at']
         misc_files_list = [convert_timestamps_to_ist_iso(mf, ts_keys) for mf in misc_files_list_raw]
     except Exception as e:
         app.logger.error(f"Error fetching paginated misc_files: {e} with query {final_query} and params {tuple(final_main_query_params)}")
         return jsonify(msg="Error fetching misc_files."), 500
 
+    if keyset is not None:
+        return jsonify({"misc_files": misc_files_list, "per_page": per_page, "next_cursor": next_cursor}), 200
+
     return jsonify({
         "misc_files": misc_files_list,
         "page": page,
         "per_page": per_page,
         "total_misc_files": total_misc_files,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
     }), 200
 
 # --- Admin Content Management Endpoints (POST for adding new content) ---
@@ -3483,6 +4439,8 @@ def _admin_handle_file_upload_and_db_insert(
             db = get_db()
             cursor = db.execute(sql_insert_query, tuple(final_sql_params))
             new_id = cursor.lastrowid # Get new_id before commit for logging
+            database.adjust_facet_counts(db, database.FACET_ITEM_TYPES.get(table_name), [new_id], 1)
+            database.record_item_changes(db, database.FACET_ITEM_TYPES.get(table_name), [new_id])
             app.logger.info(f"_admin_helper: Successfully prepared insert for {table_name}, new ID: {new_id}")
 
             # Conditional Audit Logging for Misc Files creation
@@ -3624,13 +4582,10 @@ def get_or_create_version_id(db: sqlite3.Connection, software_id: int, version_s
 
     try:
         # Attempt to find existing version
-        existing_version = db.execute(
-            "SELECT id FROM versions WHERE software_id = ? AND version_number = ?",
-            (software_id, version_string)
-        ).fetchone()
+        existing_version_id = get_catalog(db).find_version_id(software_id, version_string)
 
-        if existing_version:
-            return existing_version['id']
+        if existing_version_id:
+            return existing_version_id
         else:
             # Create new version if not found
             # Set a default release_date to today for new versions created this way.
@@ -3736,6 +4691,8 @@ def _admin_add_item_with_external_link(
     try:
         app.logger.info(f"ADMIN_HELPER_LINK: Attempting to insert into {table_name}. Params: {final_sql_params}")
         cursor = db.execute(sql_insert_query, tuple(final_sql_params))
+        database.adjust_facet_counts(db, database.FACET_ITEM_TYPES.get(table_name), [cursor.lastrowid], 1)
+        database.record_item_changes(db, database.FACET_ITEM_TYPES.get(table_name), [cursor.lastrowid])
         db.commit()
         new_id = cursor.lastrowid
         app.logger.info(f"ADMIN_HELPER_LINK: Inserted into {table_name} with ID: {new_id}. Fetching back...")
@@ -3841,7 +4798,7 @@ def admin_add_document_with_url():
                 doc_software_id = new_doc_data.get('software_id')
                 software_category_name = None
                 if doc_software_id:
-                    software_info = get_db().execute("SELECT name FROM software WHERE id = ?", (doc_software_id,)).fetchone()
+                    software_info = get_catalog(get_db()).get_software(doc_software_id)
                     if software_info and software_info['name']:
                         software_category_name = software_info['name']
                 
@@ -3942,7 +4899,7 @@ def admin_upload_document_file():
                 doc_software_id_file = new_doc_data.get('software_id') # software_id is part of new_doc_data
                 software_category_name_file = None
                 if doc_software_id_file:
-                    software_info_file = get_db().execute("SELECT name FROM software WHERE id = ?", (doc_software_id_file,)).fetchone()
+                    software_info_file = get_catalog(get_db()).get_software(doc_software_id_file)
                     if software_info_file and software_info_file['name']:
                         software_category_name_file = software_info_file['name']
                 
@@ -4065,13 +5022,13 @@ def admin_add_patch_with_url():
 
         if new_patch_id and patch_version_id:
             # Check if the patch's software is 'VMS' or 'VA'
-            version_info = db.execute("SELECT software_id FROM versions WHERE id = ?", (patch_version_id,)).fetchone()
+            version_info = get_catalog(db).get_version(patch_version_id)
             if version_info:
-                software_info = db.execute("SELECT name FROM software WHERE id = ?", (version_info['software_id'],)).fetchone()
+                software_info = get_catalog(db).get_software(version_info['software_id'])
                 if software_info and software_info['name'] in ('VMS', 'VA'):
                     compatible_vms_version_ids = data.get('compatible_vms_version_ids') # Get from original request data
                     if compatible_vms_version_ids and isinstance(compatible_vms_version_ids, list):
-                        vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                        vms_software_id_row = get_catalog(db).find_software('VMS')
                         vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                         if not vms_software_id:
@@ -4081,10 +5038,7 @@ def admin_add_patch_with_url():
                                 try:
                                     vms_ver_id_int = int(vms_ver_id)
                                     # Validate that vms_ver_id actually belongs to 'VMS' software
-                                    vms_version_check = db.execute(
-                                        "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                        (vms_ver_id_int, vms_software_id)
-                                    ).fetchone()
+                                    vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
 
                                     if vms_version_check:
                                         db.execute(
@@ -4108,6 +5062,7 @@ def admin_add_patch_with_url():
                                 except Exception as e_compat:
                                     db.rollback()
                                     app.logger.error(f"Error adding patch VMS compatibility for patch {new_patch_id}, VMS version {vms_ver_id_int}: {e_compat}")
+                            database.refresh_vms_compatibility(db, 'patch', [new_patch_id])
                             db.commit() # Commit all successful compatibility entries
         
         # --- Notification Logic for admin_add_patch_with_url ---
@@ -4229,16 +5184,16 @@ def admin_upload_patch_file():
 
         # === VMS Compatibility Logic for admin_upload_patch_file ===
         if new_patch_id and patch_version_id_for_compat_check:
-            version_info = db.execute("SELECT software_id FROM versions WHERE id = ?", (patch_version_id_for_compat_check,)).fetchone()
+            version_info = get_catalog(db).get_version(patch_version_id_for_compat_check)
             if version_info:
-                software_info = db.execute("SELECT name FROM software WHERE id = ?", (version_info['software_id'],)).fetchone()
+                software_info = get_catalog(db).get_software(version_info['software_id'])
                 if software_info and software_info['name'] in ('VMS', 'VA'):
                     compatible_vms_ids_json = request.form.get('compatible_vms_version_ids_json')
                     if compatible_vms_ids_json:
                         try:
                             compatible_vms_version_ids = json.loads(compatible_vms_ids_json)
                             if isinstance(compatible_vms_version_ids, list):
-                                vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                                vms_software_id_row = get_catalog(db).find_software('VMS')
                                 vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                                 if not vms_software_id:
@@ -4247,10 +5202,7 @@ def admin_upload_patch_file():
                                     for vms_ver_id in compatible_vms_version_ids:
                                         try:
                                             vms_ver_id_int = int(vms_ver_id)
-                                            vms_version_check = db.execute(
-                                                "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                                (vms_ver_id_int, vms_software_id)
-                                            ).fetchone()
+                                            vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                             if vms_version_check:
                                                 db.execute(
                                                     "INSERT INTO patch_vms_compatibility (patch_id, vms_version_id) VALUES (?, ?)",
@@ -4272,6 +5224,7 @@ def admin_upload_patch_file():
                                         except Exception as e_compat_file:
                                             db.rollback()
                                             app.logger.error(f"Error adding VMS compatibility (file upload) for patch {new_patch_id}, VMS ver {vms_ver_id_int}: {e_compat_file}")
+                                    database.refresh_vms_compatibility(db, 'patch', [new_patch_id])
                                     db.commit() # Commit all successful compatibility entries
                         except json.JSONDecodeError:
                             app.logger.error("Failed to parse compatible_vms_version_ids_json from form data.")
@@ -4371,15 +5324,18 @@ def admin_edit_document_url(document_id):
         # Potentially log old values if desired by fetching 'doc' again or comparing field by field
         # For brevity, logging new values and indicating it's now a URL link.
 
+        database.adjust_facet_counts(db, 'document', [document_id], -1)
         db.execute("""
             UPDATE documents
             SET software_id = ?, doc_name = ?, description = ?, doc_type = ?,
                 download_link = ?, is_external_link = TRUE, stored_filename = NULL,
                 original_filename_ref = NULL, file_size = NULL, file_type = NULL,
-                updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+                updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?
         """, (software_id, doc_name, description, doc_type, download_link,
               current_user_id, document_id))
+        database.adjust_facet_counts(db, 'document', [document_id], 1)
+        database.record_item_changes(db, 'document', [document_id])
         log_audit_action(
             action_type='UPDATE_DOCUMENT_URL',
             target_table='documents',
@@ -4437,7 +5393,7 @@ def admin_edit_document_url(document_id):
                 doc_software_id_edit_url = processed_doc.get('software_id')
                 software_category_name_edit_url = None
                 if doc_software_id_edit_url:
-                    software_info_edit_url = get_db().execute("SELECT name FROM software WHERE id = ?", (doc_software_id_edit_url,)).fetchone()
+                    software_info_edit_url = get_catalog(get_db()).get_software(doc_software_id_edit_url)
                     if software_info_edit_url and software_info_edit_url['name']:
                         software_category_name_edit_url = software_info_edit_url['name']
                 
@@ -4558,16 +5514,19 @@ def admin_edit_document_file(document_id):
             log_details['updated_fields'].extend(['download_link', 'stored_filename', 'original_filename_ref', 'file_size', 'file_type', 'is_external_link'])
             log_details['is_external_link'] = False
 
+        database.adjust_facet_counts(db, 'document', [document_id], -1)
         db.execute("""
             UPDATE documents
             SET software_id = ?, doc_name = ?, description = ?, doc_type = ?,
                 download_link = ?, is_external_link = FALSE, stored_filename = ?,
                 original_filename_ref = ?, file_size = ?, file_type = ?,
-                updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+                updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?
         """, (software_id, doc_name, description, doc_type,
               new_download_link, new_stored_filename, new_original_filename,
               new_file_size, new_file_type, current_user_id, document_id))
+        database.adjust_facet_counts(db, 'document', [document_id], 1)
+        database.record_item_changes(db, 'document', [document_id])
         log_audit_action(
             action_type=action_type,
             target_table='documents',
@@ -4628,7 +5587,7 @@ def admin_edit_document_file(document_id):
                 doc_software_id_edit_file = processed_doc.get('software_id')
                 software_category_name_edit_file = None
                 if doc_software_id_edit_file:
-                    software_info_edit_file = get_db().execute("SELECT name FROM software WHERE id = ?", (doc_software_id_edit_file,)).fetchone()
+                    software_info_edit_file = get_catalog(get_db()).get_software(doc_software_id_edit_file)
                     if software_info_edit_file and software_info_edit_file['name']:
                         software_category_name_edit_file = software_info_edit_file['name']
                 
@@ -4694,6 +5653,8 @@ def admin_delete_document(document_id):
             target_id=document_id,
             details={'deleted_doc_name': doc['doc_name'], 'stored_filename': doc['stored_filename'], 'is_external_link': doc['is_external_link']}
         )
+        database.adjust_facet_counts(db, 'document', [document_id], -1)
+        database.record_item_changes(db, 'document', [document_id], 'delete')
         db.execute("DELETE FROM documents WHERE id = ?", (document_id,))
         db.commit()
         app.logger.info(f"Admin user {current_user_id} deleted document ID {document_id}") # Existing log
@@ -4783,14 +5744,14 @@ def admin_upload_link_file():
         link_software_id_for_compat_check = software_id # Resolved from form or typed_version_string logic
 
         if new_link_id and link_software_id_for_compat_check:
-            software_info = db.execute("SELECT name FROM software WHERE id = ?", (link_software_id_for_compat_check,)).fetchone()
+            software_info = get_catalog(db).get_software(link_software_id_for_compat_check)
             if software_info and software_info['name'] in ('VMS', 'VA'):
                 compatible_vms_ids_json = request.form.get('compatible_vms_version_ids_json')
                 if compatible_vms_ids_json:
                     try:
                         compatible_vms_version_ids = json.loads(compatible_vms_ids_json)
                         if isinstance(compatible_vms_version_ids, list):
-                            vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                            vms_software_id_row = get_catalog(db).find_software('VMS')
                             vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                             if not vms_software_id:
@@ -4799,10 +5760,7 @@ def admin_upload_link_file():
                                 for vms_ver_id in compatible_vms_version_ids:
                                     try:
                                         vms_ver_id_int = int(vms_ver_id)
-                                        vms_version_check = db.execute(
-                                            "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                            (vms_ver_id_int, vms_software_id)
-                                        ).fetchone()
+                                        vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                         if vms_version_check:
                                             db.execute(
                                                 "INSERT INTO link_vms_compatibility (link_id, vms_version_id) VALUES (?, ?)",
@@ -4823,6 +5781,7 @@ def admin_upload_link_file():
                                     except Exception as e_compat_link_file:
                                         db.rollback()
                                         app.logger.error(f"Error adding VMS compatibility for link {new_link_id} (file upload), VMS ver {vms_ver_id_int}: {e_compat_link_file}")
+                                database.refresh_vms_compatibility(db, 'link', [new_link_id])
                                 db.commit()
                     except json.JSONDecodeError:
                         app.logger.error("Failed to parse compatible_vms_version_ids_json from form data for link (file upload).")
@@ -4841,7 +5800,7 @@ def admin_upload_link_file():
                 # software_id is resolved earlier in admin_upload_link_file
                 category = None
                 if software_id: 
-                    software_info_for_notify = db.execute("SELECT name FROM software WHERE id = ?", (software_id,)).fetchone()
+                    software_info_for_notify = get_catalog(db).get_software(software_id)
                     if software_info_for_notify:
                         category = software_info_for_notify['name']
                 
@@ -4907,7 +5866,7 @@ def admin_edit_patch_url(patch_id):
         if not software_id_str: 
             # Fallback to current patch's version's software_id if not provided in payload
             # This assumes software_id is always sent by frontend if typed_version_string is active.
-            current_version_details = db.execute("SELECT software_id FROM versions WHERE id = ?", (patch['version_id'],)).fetchone()
+            current_version_details = get_catalog(db).get_version(patch['version_id'])
             if not current_version_details:
                  return jsonify(msg="Cannot determine software for the current patch version."), 500
             software_id_for_version_logic = current_version_details['software_id']
@@ -4956,13 +5915,17 @@ def admin_edit_patch_url(patch_id):
         if patch_by_developer != patch['patch_by_developer']: log_details['updated_fields'].append('patch_by_developer')
         if not patch['is_external_link']: log_details['updated_fields'].append('is_external_link') # Becoming external
 
+        database.adjust_facet_counts(db, 'patch', [patch_id], -1)
         db.execute("""
             UPDATE patches SET version_id = ?, patch_name = ?, description = ?, release_date = ?,
             download_link = ?, patch_by_developer = ?, is_external_link = TRUE, stored_filename = NULL,
             original_filename_ref = NULL, file_size = NULL, file_type = NULL,
-            updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?""",
+            updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30') WHERE id = ?""",
             (final_version_id, patch_name, description, release_date, download_link, patch_by_developer,
              current_user_id, patch_id))
+        database.adjust_facet_counts(db, 'patch', [patch_id], 1)
+        database.record_item_changes(db, 'patch', [patch_id])
+        database.refresh_vms_compatibility(db, 'patch', [patch_id])
         log_audit_action(
             action_type='UPDATE_PATCH_URL',
             target_table='patches',
@@ -4987,9 +5950,9 @@ def admin_edit_patch_url(patch_id):
 
             # === VMS Compatibility Logic for admin_edit_patch_url ===
             # final_version_id is the potentially updated version_id of the patch
-            version_info = db.execute("SELECT software_id FROM versions WHERE id = ?", (final_version_id,)).fetchone()
+            version_info = get_catalog(db).get_version(final_version_id)
             if version_info:
-                software_info = db.execute("SELECT name FROM software WHERE id = ?", (version_info['software_id'],)).fetchone()
+                software_info = get_catalog(db).get_software(version_info['software_id'])
 
                 # Always delete existing compatibility entries for this patch first
                 db.execute("DELETE FROM patch_vms_compatibility WHERE patch_id = ?", (patch_id,))
@@ -4999,11 +5962,12 @@ def admin_edit_patch_url(patch_id):
                     target_id=patch_id,
                     details={'patch_id': patch_id, 'reason': 'Pre-update clear for edit_url'}
                 )
+                database.refresh_vms_compatibility(db, 'patch', [patch_id])
 
                 if software_info and software_info['name'] in ('VMS', 'VA'):
                     compatible_vms_version_ids = data.get('compatible_vms_version_ids') # From original request
                     if compatible_vms_version_ids and isinstance(compatible_vms_version_ids, list):
-                        vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                        vms_software_id_row = get_catalog(db).find_software('VMS')
                         vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                         if not vms_software_id:
@@ -5012,10 +5976,7 @@ def admin_edit_patch_url(patch_id):
                             for vms_ver_id in compatible_vms_version_ids:
                                 try:
                                     vms_ver_id_int = int(vms_ver_id)
-                                    vms_version_check = db.execute(
-                                        "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                        (vms_ver_id_int, vms_software_id)
-                                    ).fetchone()
+                                    vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                     if vms_version_check:
                                         db.execute(
                                             "INSERT INTO patch_vms_compatibility (patch_id, vms_version_id) VALUES (?, ?)",
@@ -5036,6 +5997,7 @@ def admin_edit_patch_url(patch_id):
                                 except Exception as e_compat_edit_url:
                                     db.rollback()
                                     app.logger.error(f"Error updating VMS compatibility (edit_url) for patch {patch_id}, VMS ver {vms_ver_id_int}: {e_compat_edit_url}")
+                            database.refresh_vms_compatibility(db, 'patch', [patch_id])
                             db.commit() # Commit all successful VMS compatibility changes for this patch
 
             # Refetch the patch to include any newly added compatible_vms_versions for the response
@@ -5131,10 +6093,7 @@ def admin_edit_patch_file(patch_id):
             except ValueError:
                 return jsonify(msg="Invalid software_id format"), 400
         else:
-            current_version_details = db.execute(
-                "SELECT software_id FROM versions WHERE id = ?", 
-                (patch['version_id'],)
-            ).fetchone()
+            current_version_details = get_catalog(db).get_version(patch['version_id'])
             if not current_version_details:
                 return jsonify(msg="Cannot determine software for current patch version"), 500
             software_id_for_version_logic = current_version_details['software_id']
@@ -5190,14 +6149,18 @@ def admin_edit_patch_file(patch_id):
             log_details['updated_fields'].extend(['download_link', 'stored_filename', 'original_filename_ref', 'file_size', 'file_type', 'is_external_link'])
             log_details['is_external_link'] = False
 
+        database.adjust_facet_counts(db, 'patch', [patch_id], -1)
         db.execute("""
             UPDATE patches SET version_id = ?, patch_name = ?, description = ?, release_date = ?,
             download_link = ?, patch_by_developer = ?, is_external_link = FALSE, stored_filename = ?,
-            original_filename_ref = ?, file_size = ?, file_type = ?, updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+            original_filename_ref = ?, file_size = ?, file_type = ?, updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?""",
             (final_version_id, patch_name, description, release_date, new_download_link,
              patch_by_developer, new_stored_filename, new_original_filename, new_file_size, new_file_type,
              current_user_id, patch_id))
+        database.adjust_facet_counts(db, 'patch', [patch_id], 1)
+        database.record_item_changes(db, 'patch', [patch_id])
+        database.refresh_vms_compatibility(db, 'patch', [patch_id])
         log_audit_action(
             action_type=action_type_log,
             target_table='patches',
@@ -5222,9 +6185,9 @@ def admin_edit_patch_file(patch_id):
             processed_item_dict = convert_timestamps_to_ist_iso(dict(updated_item_row), ['created_at', 'updated_at'])
 
             # === VMS Compatibility Logic for admin_edit_patch_file ===
-            version_info = db.execute("SELECT software_id FROM versions WHERE id = ?", (final_version_id,)).fetchone()
+            version_info = get_catalog(db).get_version(final_version_id)
             if version_info:
-                software_info = db.execute("SELECT name FROM software WHERE id = ?", (version_info['software_id'],)).fetchone()
+                software_info = get_catalog(db).get_software(version_info['software_id'])
 
                 db.execute("DELETE FROM patch_vms_compatibility WHERE patch_id = ?", (patch_id,))
                 log_audit_action(
@@ -5232,6 +6195,7 @@ def admin_edit_patch_file(patch_id):
                     target_table='patch_vms_compatibility', target_id=patch_id,
                     details={'patch_id': patch_id, 'reason': 'Pre-update clear for edit_file'}
                 )
+                database.refresh_vms_compatibility(db, 'patch', [patch_id])
 
                 if software_info and software_info['name'] in ('VMS', 'VA'):
                     compatible_vms_ids_json = request.form.get('compatible_vms_version_ids_json')
@@ -5239,7 +6203,7 @@ def admin_edit_patch_file(patch_id):
                         try:
                             compatible_vms_version_ids = json.loads(compatible_vms_ids_json)
                             if isinstance(compatible_vms_version_ids, list):
-                                vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                                vms_software_id_row = get_catalog(db).find_software('VMS')
                                 vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                                 if not vms_software_id:
@@ -5248,10 +6212,7 @@ def admin_edit_patch_file(patch_id):
                                     for vms_ver_id in compatible_vms_version_ids:
                                         try:
                                             vms_ver_id_int = int(vms_ver_id)
-                                            vms_version_check = db.execute(
-                                                "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                                (vms_ver_id_int, vms_software_id)
-                                            ).fetchone()
+                                            vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                             if vms_version_check:
                                                 db.execute(
                                                     "INSERT INTO patch_vms_compatibility (patch_id, vms_version_id) VALUES (?, ?)",
@@ -5272,6 +6233,7 @@ def admin_edit_patch_file(patch_id):
                                         except Exception as e_compat_edit_file:
                                             db.rollback()
                                             app.logger.error(f"Error updating VMS compatibility (edit_file) for patch {patch_id}, VMS ver {vms_ver_id_int}: {e_compat_edit_file}")
+                                    database.refresh_vms_compatibility(db, 'patch', [patch_id])
                                     db.commit() # Commit VMS compatibility changes
                         except json.JSONDecodeError:
                             app.logger.error("Failed to parse compatible_vms_version_ids_json from form data (edit_file).")
@@ -5360,6 +6322,8 @@ def admin_delete_patch(patch_id):
             target_id=patch_id,
             details={'deleted_patch_name': patch['patch_name'], 'stored_filename': patch['stored_filename'], 'is_external_link': patch['is_external_link']}
         )
+        database.adjust_facet_counts(db, 'patch', [patch_id], -1)
+        database.record_item_changes(db, 'patch', [patch_id], 'delete')
         db.execute("DELETE FROM patches WHERE id = ?", (patch_id,))
         db.commit()
         app.logger.info(f"Admin user {current_user_id} deleted patch ID {patch_id}") # Existing log
@@ -5486,10 +6450,7 @@ def admin_edit_link_url(link_id_from_url):
         return jsonify(msg="A valid version association is mandatory for this link."), 400
 
     # Validate that final_version_id_for_db belongs to software_id_for_version_context
-    version_valid_check = db.execute(
-        "SELECT software_id FROM versions WHERE id = ? AND software_id = ?",
-        (final_version_id_for_db, software_id_for_version_context)
-    ).fetchone()
+    version_valid_check = get_catalog(db).get_version(final_version_id_for_db, software_id_for_version_context)
     if not version_valid_check:
         return jsonify(msg=f"Version ID {final_version_id_for_db} is not valid or does not belong to Software ID {software_id_for_version_context}."), 400
 
@@ -5506,13 +6467,17 @@ def admin_edit_link_url(link_id_from_url):
             'version_id': final_version_id_for_db,
             'is_external_link': True
         }
+        database.adjust_facet_counts(db, 'link', [link_id_from_url], -1)
         db.execute("""
             UPDATE links SET software_id = ?, version_id = ?, title = ?, description = ?, url = ?,
             is_external_link = TRUE, stored_filename = NULL, original_filename_ref = NULL,
-            file_size = NULL, file_type = NULL, updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+            file_size = NULL, file_type = NULL, updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?""",
             (software_id_for_link, final_version_id_for_db, title, description, url,
              current_user_id, link_id_from_url))
+        database.adjust_facet_counts(db, 'link', [link_id_from_url], 1)
+        database.record_item_changes(db, 'link', [link_id_from_url])
+        database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
         log_audit_action(
             action_type='UPDATE_LINK_URL',
             target_table='links',
@@ -5538,7 +6503,7 @@ def admin_edit_link_url(link_id_from_url):
 
             # === VMS Compatibility Logic for admin_edit_link_url ===
             link_software_id_for_compat_check = software_id_for_link # software_id_for_link is resolved earlier
-            current_link_software_info = db.execute("SELECT name FROM software WHERE id = ?", (link_software_id_for_compat_check,)).fetchone()
+            current_link_software_info = get_catalog(db).get_software(link_software_id_for_compat_check)
 
             # Always delete existing compatibility entries for this link first
             db.execute("DELETE FROM link_vms_compatibility WHERE link_id = ?", (link_id_from_url,))
@@ -5547,11 +6512,12 @@ def admin_edit_link_url(link_id_from_url):
                 target_table='link_vms_compatibility', target_id=link_id_from_url,
                 details={'link_id': link_id_from_url, 'reason': 'Pre-update clear for edit_link_url'}
             )
+            database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
 
             if current_link_software_info and current_link_software_info['name'] in ('VMS', 'VA'):
                 compatible_vms_version_ids = data.get('compatible_vms_version_ids') # From original JSON request data
                 if compatible_vms_version_ids and isinstance(compatible_vms_version_ids, list):
-                    vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                    vms_software_id_row = get_catalog(db).find_software('VMS')
                     vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                     if not vms_software_id:
@@ -5560,10 +6526,7 @@ def admin_edit_link_url(link_id_from_url):
                         for vms_ver_id in compatible_vms_version_ids:
                             try:
                                 vms_ver_id_int = int(vms_ver_id)
-                                vms_version_check = db.execute(
-                                    "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                    (vms_ver_id_int, vms_software_id)
-                                ).fetchone()
+                                vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                 if vms_version_check:
                                     db.execute(
                                         "INSERT INTO link_vms_compatibility (link_id, vms_version_id) VALUES (?, ?)",
@@ -5584,6 +6547,7 @@ def admin_edit_link_url(link_id_from_url):
                             except Exception as e_compat_link_edit_url:
                                 db.rollback()
                                 app.logger.error(f"Error updating VMS compatibility for link {link_id_from_url} (edit_url), VMS ver {vms_ver_id_int}: {e_compat_link_edit_url}")
+                        database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
                         db.commit() # Commit VMS compatibility changes for this link
             return jsonify(response_data_dict), 200
         else:
@@ -5604,7 +6568,7 @@ def admin_edit_link_url(link_id_from_url):
                     category = None
                     # software_id_for_link is the software_id used for the update (from scope of admin_edit_link_url)
                     if software_id_for_link: 
-                        software_info_notify = db.execute("SELECT name FROM software WHERE id = ?", (software_id_for_link,)).fetchone()
+                        software_info_notify = get_catalog(db).get_software(software_id_for_link)
                         if software_info_notify:
                             category = software_info_notify['name']
                     
@@ -5688,10 +6652,7 @@ def admin_edit_link_file(link_id_from_url):
     if final_version_id_for_db is None:
         return jsonify(msg="A valid version association is mandatory for this link."), 400
 
-    version_valid_check = db.execute(
-        "SELECT software_id FROM versions WHERE id = ? AND software_id = ?",
-        (final_version_id_for_db, software_id_for_version_context)
-    ).fetchone()
+    version_valid_check = get_catalog(db).get_version(final_version_id_for_db, software_id_for_version_context)
     if not version_valid_check:
         return jsonify(msg=f"Version ID {final_version_id_for_db} is not valid or does not belong to Software ID {software_id_for_version_context}."), 400
 
@@ -5741,13 +6702,17 @@ def admin_edit_link_file(link_id_from_url):
             log_details['updated_fields'].extend(['url', 'stored_filename', 'original_filename_ref', 'file_size', 'file_type', 'is_external_link'])
             log_details['is_external_link'] = False
 
+        database.adjust_facet_counts(db, 'link', [link_id_from_url], -1)
         db.execute("""
             UPDATE links SET software_id = ?, version_id = ?, title = ?, description = ?, url = ?,
             is_external_link = FALSE, stored_filename = ?, original_filename_ref = ?,
-            file_size = ?, file_type = ?, updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+            file_size = ?, file_type = ?, updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?""",
             (software_id_for_link, final_version_id_for_db, title, description, new_url, new_stored_filename,
              new_original_filename, new_file_size, new_file_type, current_user_id, link_id_from_url))
+        database.adjust_facet_counts(db, 'link', [link_id_from_url], 1)
+        database.record_item_changes(db, 'link', [link_id_from_url])
+        database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
         log_audit_action(
             action_type=action_type_log,
             target_table='links',
@@ -5769,13 +6734,14 @@ def admin_edit_link_file(link_id_from_url):
 
             # === VMS Compatibility Logic for admin_edit_link_file ===
             link_software_id_for_compat_check = software_id_for_link # software_id_for_link is resolved earlier
-            current_link_software_info = db.execute("SELECT name FROM software WHERE id = ?", (link_software_id_for_compat_check,)).fetchone()
+            current_link_software_info = get_catalog(db).get_software(link_software_id_for_compat_check)
             db.execute("DELETE FROM link_vms_compatibility WHERE link_id = ?", (link_id_from_url,))
             log_audit_action(
                 action_type='CLEAR_LINK_VMS_COMPATIBILITY',
                 target_table='link_vms_compatibility', target_id=link_id_from_url,
                 details={'link_id': link_id_from_url, 'reason': 'Pre-update clear for edit_link_file'}
             )
+            database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
 
             if current_link_software_info and current_link_software_info['name'] in ('VMS', 'VA'):
                 compatible_vms_ids_json = request.form.get('compatible_vms_version_ids_json')
@@ -5783,7 +6749,7 @@ def admin_edit_link_file(link_id_from_url):
                     try:
                         compatible_vms_version_ids = json.loads(compatible_vms_ids_json)
                         if isinstance(compatible_vms_version_ids, list):
-                            vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                            vms_software_id_row = get_catalog(db).find_software('VMS')
                             vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
                             if not vms_software_id:
                                 app.logger.error("Could not find software_id for 'VMS' to validate compatible_vms_version_ids for link (edit_file).")
@@ -5791,7 +6757,7 @@ def admin_edit_link_file(link_id_from_url):
                                 for vms_ver_id in compatible_vms_version_ids:
                                     try:
                                         vms_ver_id_int = int(vms_ver_id)
-                                        vms_version_check = db.execute("SELECT id FROM versions WHERE id = ? AND software_id = ?", (vms_ver_id_int, vms_software_id)).fetchone()
+                                        vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                         if vms_version_check:
                                             db.execute("INSERT INTO link_vms_compatibility (link_id, vms_version_id) VALUES (?, ?)", (link_id_from_url, vms_ver_id_int))
                                             log_audit_action(action_type='UPDATE_LINK_VMS_COMPATIBILITY', target_table='link_vms_compatibility', target_id=link_id_from_url, details={'link_id': link_id_from_url, 'vms_version_id_added': vms_ver_id_int, 'method': 'edit_link_file'})
@@ -5800,6 +6766,7 @@ def admin_edit_link_file(link_id_from_url):
                                     except ValueError: app.logger.warning(f"Invalid vms_version_id format for link (edit_file): {vms_ver_id}. Skipping.")
                                     except sqlite3.IntegrityError as e_lf_compat_int: db.rollback(); app.logger.error(f"Integrity error for link VMS compat (edit_file) L:{link_id_from_url} V:{vms_ver_id_int}: {e_lf_compat_int}")
                                     except Exception as e_lf_compat_gen: db.rollback(); app.logger.error(f"General error for link VMS compat (edit_file) L:{link_id_from_url} V:{vms_ver_id_int}: {e_lf_compat_gen}")
+                                database.refresh_vms_compatibility(db, 'link', [link_id_from_url])
                                 db.commit()
                     except json.JSONDecodeError: app.logger.error("Failed to parse compatible_vms_version_ids_json from form for link (edit_file).")
             
@@ -5817,7 +6784,7 @@ def admin_edit_link_file(link_id_from_url):
                     category = None
                     # software_id_for_link is the software_id used for the update (from scope of admin_edit_link_file)
                     if software_id_for_link: 
-                        software_info_notify = db.execute("SELECT name FROM software WHERE id = ?", (software_id_for_link,)).fetchone()
+                        software_info_notify = get_catalog(db).get_software(software_id_for_link)
                         if software_info_notify:
                             category = software_info_notify['name']
                     
@@ -5882,6 +6849,8 @@ def admin_delete_link(link_id):
             target_id=link_id,
             details={'deleted_title': link_item['title'], 'stored_filename': link_item['stored_filename'], 'is_external_link': link_item['is_external_link']}
         )
+        database.adjust_facet_counts(db, 'link', [link_id], -1)
+        database.record_item_changes(db, 'link', [link_id], 'delete')
         db.execute("DELETE FROM links WHERE id = ?", (link_id,))
         db.commit()
         app.logger.info(f"Admin user {current_user_id} deleted link ID {link_id}") # Existing log
@@ -5916,7 +6885,7 @@ def admin_edit_misc_category(category_id):
         
         db.execute("""
             UPDATE misc_categories
-            SET name = ?, description = ?, updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+            SET name = ?, description = ?, updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?
         """, (name, description, current_user_id, category_id))
         log_audit_action(
@@ -6083,15 +7052,18 @@ def admin_edit_misc_file(file_id):
             log_details['new_original_filename'] = new_original_filename
 
 
+        database.adjust_facet_counts(db, 'misc_file', [file_id], -1)
         db.execute("""
             UPDATE misc_files
             SET misc_category_id = ?, user_provided_title = ?, user_provided_description = ?,
                 original_filename = ?, stored_filename = ?, file_path = ?,
-                file_type = ?, file_size = ?, updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+                file_type = ?, file_size = ?, updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?
         """, (misc_category_id, user_provided_title, user_provided_description,
               new_original_filename, new_stored_filename, new_file_path,
               new_file_type, new_file_size, current_user_id, file_id))
+        database.adjust_facet_counts(db, 'misc_file', [file_id], 1)
+        database.record_item_changes(db, 'misc_file', [file_id])
         
         if changed_fields: 
             log_audit_action(
@@ -6193,6 +7165,8 @@ def admin_delete_misc_file(file_id):
                 'category_id': misc_file_item['misc_category_id']
             }
         )
+        database.adjust_facet_counts(db, 'misc_file', [file_id], -1)
+        database.record_item_changes(db, 'misc_file', [file_id], 'delete')
         db.execute("DELETE FROM misc_files WHERE id = ?", (file_id,))
         db.commit()
         app.logger.info(f"Admin user {current_user_id} deleted misc file ID {file_id} (physical file: {misc_file_item['stored_filename']})") # Existing Log
@@ -6319,6 +7293,8 @@ def _admin_handle_large_file_db_insert(
 
         cursor = db.execute(sql_insert_query, tuple(sql_params_list))
         new_id = cursor.lastrowid
+        database.adjust_facet_counts(db, item_type, [new_id], 1)
+        database.record_item_changes(db, item_type, [new_id])
         db.commit()
         app.logger.info(f"Large file DB insert: Successfully inserted {item_type} '{item_name_for_log}', new ID: {new_id}")
         # If commit is successful, the temp file should have already been deleted by the caller after successful move.
@@ -6525,11 +7501,11 @@ def admin_add_link_with_url():
 
         if new_link_id and link_software_id_for_compat_check:
             # Check if the link's software is 'VMS' or 'VA'
-            software_info = db.execute("SELECT name FROM software WHERE id = ?", (link_software_id_for_compat_check,)).fetchone()
+            software_info = get_catalog(db).get_software(link_software_id_for_compat_check)
             if software_info and software_info['name'] in ('VMS', 'VA'):
                 compatible_vms_version_ids = data.get('compatible_vms_version_ids') # Get from original request data
                 if compatible_vms_version_ids and isinstance(compatible_vms_version_ids, list):
-                    vms_software_id_row = db.execute("SELECT id FROM software WHERE name = 'VMS'").fetchone()
+                    vms_software_id_row = get_catalog(db).find_software('VMS')
                     vms_software_id = vms_software_id_row['id'] if vms_software_id_row else None
 
                     if not vms_software_id:
@@ -6538,10 +7514,7 @@ def admin_add_link_with_url():
                         for vms_ver_id in compatible_vms_version_ids:
                             try:
                                 vms_ver_id_int = int(vms_ver_id)
-                                vms_version_check = db.execute(
-                                    "SELECT id FROM versions WHERE id = ? AND software_id = ?",
-                                    (vms_ver_id_int, vms_software_id)
-                                ).fetchone()
+                                vms_version_check = get_catalog(db).get_version(vms_ver_id_int, vms_software_id)
                                 if vms_version_check:
                                     db.execute(
                                         "INSERT INTO link_vms_compatibility (link_id, vms_version_id) VALUES (?, ?)",
@@ -6562,6 +7535,7 @@ def admin_add_link_with_url():
                             except Exception as e_compat_link_url:
                                 db.rollback()
                                 app.logger.error(f"Error adding VMS compatibility for link {new_link_id} (add_with_url), VMS ver {vms_ver_id_int}: {e_compat_link_url}")
+                        database.refresh_vms_compatibility(db, 'link', [new_link_id])
                         db.commit() # Commit all successful VMS compatibility entries for this link
         
         # --- Notification Logic for admin_add_link_with_url ---
@@ -6578,7 +7552,7 @@ def admin_add_link_with_url():
                 # software_id is from the scope of admin_add_link_with_url
                 category = None
                 if software_id: 
-                    software_info_for_notify = db.execute("SELECT name FROM software WHERE id = ?", (software_id,)).fetchone()
+                    software_info_for_notify = get_catalog(db).get_software(software_id)
                     if software_info_for_notify:
                         category = software_info_for_notify['name']
 
@@ -6744,18 +7718,10 @@ def admin_list_versions():
         # Database Query for Total Count
         count_query = f"SELECT COUNT(v.id) as count {base_query_from}{where_clause}"
         try:
-            total_versions_cursor = db.execute(count_query, tuple(params))
-            total_versions_result = total_versions_cursor.fetchone()
-            if total_versions_result is None:
-                app.logger.error("Failed to fetch total version count: query returned None.")
-                return jsonify(msg="Error fetching version count: No result from count query."), 500
-            total_versions = total_versions_result['count']
+            total_versions = cached_count(db, count_query, params, ['versions', 'software'])
         except sqlite3.Error as e: # Be specific with database errors if possible
             app.logger.error(f"Database error fetching total version count: {e}")
             return jsonify(msg=f"Database error fetching version count: {e}"), 500
-        except KeyError:
-            app.logger.error("Failed to fetch total version count: 'count' key missing.")
-            return jsonify(msg="Error fetching version count: Malformed count query result."), 500
 
 
         total_pages = math.ceil(total_versions / per_page) if total_versions > 0 else 1
@@ -6772,7 +7738,7 @@ def admin_list_versions():
 
         try:
             versions_cursor = db.execute(final_query, tuple(paginated_params))
-            versions_list_raw = [dict(row) for row in versions_cursor.fetchall()]
+            versions_list_raw = database.fetch_dicts(versions_cursor)
             # Note: 'release_date' is DATE, not TIMESTAMP.
             ts_keys = ['created_at', 'updated_at']
             versions_list = [convert_timestamps_to_ist_iso(ver, ts_keys) for ver in versions_list_raw]
@@ -6823,10 +7789,8 @@ def logout():
                 # If it's a naive string, parse and make aware (similar to convert_timestamps_to_ist_iso)
                 # For CURRENT_TIMESTAMP in SQLite, it's usually UTC.
                 try:
-                    naive_dt = datetime.strptime(user_details_for_event['last_seen'], '%Y-%m-%d %H:%M:%S')
-                    # Assuming CURRENT_TIMESTAMP in SQLite gives UTC. If it's local, adjust timezone.
-                    utc_dt = UTC.localize(naive_dt) # Make it timezone-aware (UTC)
-                    last_seen_timestamp_iso = utc_dt.isoformat()
+                    # CURRENT_TIMESTAMP in SQLite gives UTC.
+                    last_seen_timestamp_iso = utc_db_timestamp_to_iso(user_details_for_event['last_seen'])
                 except Exception as e_ts_conv:
                     app.logger.error(f"Error converting last_seen for logout event (user {current_user_id}): {e_ts_conv}")
                     last_seen_timestamp_iso = datetime.now(timezone.utc).isoformat() # Fallback
@@ -6925,10 +7889,12 @@ def admin_update_version(version_id):
             UPDATE versions
             SET software_id = ?, version_number = ?, release_date = ?, 
                 main_download_link = ?, changelog = ?, known_bugs = ?,
-                updated_by_user_id = ?, updated_at = CURRENT_TIMESTAMP
+                updated_by_user_id = ?, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')
             WHERE id = ?
         """, (software_id, version_number, release_date, main_download_link, changelog, known_bugs,
               current_user_id, version_id))
+        if 'software_id' in updated_fields_details or 'version_number' in updated_fields_details:
+            database.refresh_vms_compatibility_for_version(db, version_id)
         
         if updated_fields_details: # Only log if something actually changed
             log_audit_action(
@@ -7005,6 +7971,7 @@ def admin_delete_version(version_id):
             }
         )
         db.execute("DELETE FROM versions WHERE id = ?", (version_id,))
+        database.refresh_vms_compatibility_for_version(db, version_id)
         db.commit()
         app.logger.info(f"Admin user {get_jwt_identity()} deleted version ID {version_id}")
         return jsonify(msg="Version deleted successfully."), 200
@@ -7027,9 +7994,7 @@ def serve_official_doc_file(filename):
             app.logger.warning(f"Invalid user ID format in JWT for doc download: {current_user_identity}")
             return jsonify(msg="Invalid user identity in token."), 401
 
-    # If user is not logged in, logged_in_user_id will be None.
-    # The permission query `WHERE user_id = ?` with `logged_in_user_id = None`
-    # will correctly not find any user-specific permissions.
+    # If user is not logged in, logged_in_user_id will be None and nothing is denied.
     # Default allow: if no specific deny, then allow.
 
     doc_item = db.execute("SELECT id FROM documents WHERE stored_filename = ?", (filename,)).fetchone()
@@ -7037,23 +8002,14 @@ def serve_official_doc_file(filename):
         return jsonify(msg="File not found in database records."), 404
     file_id = doc_item['id']
 
-    # Check permission
-    # If logged_in_user_id is None, this query will not find a row, permission will be None.
-    permission = db.execute(
-        "SELECT can_download FROM file_permissions WHERE user_id = ? AND file_id = ? AND file_type = 'document'",
-        (logged_in_user_id, file_id)
-    ).fetchone()
-
-    # Default Allow, Explicit Deny Logic:
-    # Allow if no permission entry (permission is None)
-    # OR if entry exists and can_download is not FALSE (i.e., TRUE or NULL)
-    if permission and permission['can_download'] is False: # Explicitly False
+    # Check permission (default allow, explicit deny) against the user's cached denies.
+    # Anonymous users have none.
+    if not get_file_denies(db, logged_in_user_id).can_download('document', file_id):
         log_audit_action(
             action_type='DOWNLOAD_DENIED', target_table='documents', target_id=file_id,
             details={'filename': filename, 'reason': 'Explicit DENY permission (can_download is FALSE)'}
         )
         return jsonify(msg="You do not have permission to download this file."), 403
-    # Else (permission is None OR permission['can_download'] is True OR permission['can_download'] is NULL), allow.
 
     try:
         _log_download_activity(filename, 'document', db) # Log before serving
@@ -7100,12 +8056,7 @@ def serve_official_patch_file(filename):
         return jsonify(msg="File not found in database records."), 404
     file_id = patch_item['id']
 
-    permission = db.execute(
-        "SELECT can_download FROM file_permissions WHERE user_id = ? AND file_id = ? AND file_type = 'patch'",
-        (logged_in_user_id, file_id)
-    ).fetchone()
-
-    if permission and permission['can_download'] is False: # Explicit Deny
+    if not get_file_denies(db, logged_in_user_id).can_download('patch', file_id): # Explicit Deny
         log_audit_action(
             action_type='DOWNLOAD_DENIED', target_table='patches', target_id=file_id,
             details={'filename': filename, 'reason': 'Explicit DENY permission (can_download is FALSE)'}
@@ -7158,12 +8109,7 @@ def serve_official_link_file(filename): # Only for uploaded files via "Links"
         return jsonify(msg="Cannot download external links directly via this endpoint."), 400 
     file_id = link_item['id']
 
-    permission = db.execute(
-        "SELECT can_download FROM file_permissions WHERE user_id = ? AND file_id = ? AND file_type = 'link'",
-        (logged_in_user_id, file_id)
-    ).fetchone()
-
-    if permission and permission['can_download'] is False: # Explicit Deny
+    if not get_file_denies(db, logged_in_user_id).can_download('link', file_id): # Explicit Deny
         log_audit_action(
             action_type='DOWNLOAD_DENIED', target_table='links', target_id=file_id,
             details={'filename': filename, 'reason': 'Explicit DENY permission (can_download is FALSE)'}
@@ -7214,12 +8160,7 @@ def serve_misc_file(filename):
         return jsonify(msg="File not found in database records."), 404
     file_id = misc_item['id']
 
-    permission = db.execute(
-        "SELECT can_download FROM file_permissions WHERE user_id = ? AND file_id = ? AND file_type = 'misc_file'",
-        (logged_in_user_id, file_id)
-    ).fetchone()
-
-    if permission and permission['can_download'] is False: # Explicit Deny
+    if not get_file_denies(db, logged_in_user_id).can_download('misc_file', file_id): # Explicit Deny
         log_audit_action(
             action_type='DOWNLOAD_DENIED', target_table='misc_files', target_id=file_id,
             details={'filename': filename, 'reason': 'Explicit DENY permission (can_download is FALSE)'}
@@ -7251,6 +8192,7 @@ def serve_misc_file(filename):
     )
 
 @app.route('/api/search', methods=['GET'])
+@readonly_db
 @jwt_required(optional=True)
 def search_api():
     query_term = request.args.get('q', '').strip()
@@ -7283,103 +8225,103 @@ def search_api():
                 conditions.append(f"({' OR '.join(term_condition_group)})")
         return " AND ".join(conditions), params
 
-    base_permission_where_clause = "(fp.id IS NULL OR fp.can_view IS NOT FALSE)"
+    denies = get_file_denies(db, logged_in_user_id)
+
+    def permission_where(file_type, id_column, search_conditions, search_params):
+        """WHERE clause (view denies, then search terms) and its params for one item type."""
+        conditions, params = [], []
+        view_condition = denies.view_condition(file_type, id_column)
+        if view_condition:
+            conditions.append(view_condition[0])
+            params.extend(view_condition[1])
+        if search_conditions:
+            conditions.append(f"({search_conditions})")
+            params.extend(search_params)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
 
     # Documents
-    doc_select_base = "SELECT d.id, d.doc_name AS name, d.description, 'document' AS type, (SELECT COUNT(*) FROM comments c WHERE c.item_id = d.id AND c.item_type = 'document' AND c.parent_comment_id IS NULL) as comment_count"
-    doc_from_base = "FROM documents d LEFT JOIN users u_up ON d.created_by_user_id = u_up.id LEFT JOIN users u_upd ON d.updated_by_user_id = u_upd.id LEFT JOIN file_permissions fp ON d.id = fp.file_id AND fp.file_type = 'document' AND fp.user_id = ?"
+    doc_select_base = "SELECT d.id, d.doc_name AS name, d.description, 'document' AS type, d.top_level_comment_count as comment_count"
+    doc_from_base = "FROM documents d LEFT JOIN users u_up ON d.created_by_user_id = u_up.id LEFT JOIN users u_upd ON d.updated_by_user_id = u_upd.id"
     doc_fields_to_search = ['LOWER(d.doc_name)', 'LOWER(d.description)', 'LOWER(u_up.username)', 'LOWER(u_upd.username)']
     doc_search_conditions, doc_search_params = build_search_conditions(doc_fields_to_search, search_terms)
+    doc_where_combined, doc_where_params = permission_where('document', 'd.id', doc_search_conditions, doc_search_params)
+    doc_downloadable_sql, doc_downloadable_params = denies.downloadable_column('document', 'd.id')
 
-    doc_params = [logged_in_user_id] + doc_search_params
-    
-    doc_where_combined = base_permission_where_clause
-    if doc_search_conditions:
-        doc_where_combined += f" AND ({doc_search_conditions})"
-        
+    doc_params = list(doc_downloadable_params) # Params follow placeholder order: select list, joins, WHERE
     if logged_in_user_id:
-        doc_select_final = f"{doc_select_base}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END) AS is_downloadable"
-        doc_from_final = f"{doc_from_base} LEFT JOIN file_permissions fp_dl ON d.id = fp_dl.file_id AND fp_dl.file_type = 'document' AND fp_dl.user_id = ? LEFT JOIN user_favorites uf ON d.id = uf.item_id AND uf.item_type = 'document' AND uf.user_id = ?"
-        doc_params.extend([logged_in_user_id, logged_in_user_id])
+        doc_select_final = f"{doc_select_base}, uf.id AS favorite_id, {doc_downloadable_sql} AS is_downloadable"
+        doc_from_final = f"{doc_from_base} LEFT JOIN user_favorites uf ON d.id = uf.item_id AND uf.item_type = 'document' AND uf.user_id = ?"
+        doc_params.append(logged_in_user_id)
     else:
-        doc_select_final = f"{doc_select_base}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END) AS is_downloadable"
-        doc_from_final = f"{doc_from_base} LEFT JOIN file_permissions fp_dl ON d.id = fp_dl.file_id AND fp_dl.file_type = 'document' AND fp_dl.user_id = ?"
-        doc_params.append(None)
+        doc_select_final = f"{doc_select_base}, NULL AS favorite_id, {doc_downloadable_sql} AS is_downloadable"
+        doc_from_final = doc_from_base
+    doc_params.extend(doc_where_params)
 
-    sql_documents = f"{doc_select_final} {doc_from_final} WHERE {doc_where_combined}"
-    results.extend([dict(row) for row in db.execute(sql_documents, tuple(doc_params)).fetchall()])
+    sql_documents = f"{doc_select_final} {doc_from_final}{doc_where_combined}"
+    results.extend(database.fetch_dicts(db.execute(sql_documents, tuple(doc_params))))
 
     # Patches
-    patch_select_base = "SELECT p.id, p.patch_name AS name, p.description, 'patch' AS type, (SELECT COUNT(*) FROM comments c WHERE c.item_id = p.id AND c.item_type = 'patch' AND c.parent_comment_id IS NULL) as comment_count"
-    patch_from_base = "FROM patches p LEFT JOIN users u_up ON p.created_by_user_id = u_up.id LEFT JOIN users u_upd ON p.updated_by_user_id = u_upd.id LEFT JOIN file_permissions fp ON p.id = fp.file_id AND fp.file_type = 'patch' AND fp.user_id = ?"
+    patch_select_base = "SELECT p.id, p.patch_name AS name, p.description, 'patch' AS type, p.top_level_comment_count as comment_count"
+    patch_from_base = "FROM patches p LEFT JOIN users u_up ON p.created_by_user_id = u_up.id LEFT JOIN users u_upd ON p.updated_by_user_id = u_upd.id"
     patch_fields_to_search = ['LOWER(p.patch_name)', 'LOWER(p.description)', 'LOWER(u_up.username)', 'LOWER(u_upd.username)'] # Added user fields
     patch_search_conditions, patch_search_params = build_search_conditions(patch_fields_to_search, search_terms)
+    patch_where_combined, patch_where_params = permission_where('patch', 'p.id', patch_search_conditions, patch_search_params)
+    patch_downloadable_sql, patch_downloadable_params = denies.downloadable_column('patch', 'p.id')
 
-    patch_params = [logged_in_user_id] + patch_search_params
-    
-    patch_where_combined = base_permission_where_clause
-    if patch_search_conditions:
-        patch_where_combined += f" AND ({patch_search_conditions})"
-        
+    patch_params = list(patch_downloadable_params) # Params follow placeholder order: select list, joins, WHERE
     if logged_in_user_id:
-        patch_select_final = f"{patch_select_base}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        patch_from_final = f"{patch_from_base} LEFT JOIN file_permissions fp_dl ON p.id = fp_dl.file_id AND fp_dl.file_type = 'patch' AND fp_dl.user_id = ? LEFT JOIN user_favorites uf ON p.id = uf.item_id AND uf.item_type = 'patch' AND uf.user_id = ?"
-        patch_params.extend([logged_in_user_id, logged_in_user_id])
+        patch_select_final = f"{patch_select_base}, uf.id AS favorite_id, {patch_downloadable_sql} AS is_downloadable"
+        patch_from_final = f"{patch_from_base} LEFT JOIN user_favorites uf ON p.id = uf.item_id AND uf.item_type = 'patch' AND uf.user_id = ?"
+        patch_params.append(logged_in_user_id)
     else:
-        patch_select_final = f"{patch_select_base}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        patch_from_final = f"{patch_from_base} LEFT JOIN file_permissions fp_dl ON p.id = fp_dl.file_id AND fp_dl.file_type = 'patch' AND fp_dl.user_id = ?"
-        patch_params.append(None)
+        patch_select_final = f"{patch_select_base}, NULL AS favorite_id, {patch_downloadable_sql} AS is_downloadable"
+        patch_from_final = patch_from_base
+    patch_params.extend(patch_where_params)
+
+    sql_patches = f"{patch_select_final} {patch_from_final}{patch_where_combined}"
+    results.extend(database.fetch_dicts(db.execute(sql_patches, tuple(patch_params))))
 
-    sql_patches = f"{patch_select_final} {patch_from_final} WHERE {patch_where_combined}"
-    results.extend([dict(row) for row in db.execute(sql_patches, tuple(patch_params)).fetchall()])
-    
     # Links
-    link_select_base = "SELECT l.id, l.title AS name, l.description, l.url, l.is_external_link, l.stored_filename, 'link' AS type, (SELECT COUNT(*) FROM comments c WHERE c.item_id = l.id AND c.item_type = 'link' AND c.parent_comment_id IS NULL) as comment_count"
-    link_from_base = "FROM links l LEFT JOIN users u_up ON l.created_by_user_id = u_up.id LEFT JOIN users u_upd ON l.updated_by_user_id = u_upd.id LEFT JOIN file_permissions fp ON l.id = fp.file_id AND fp.file_type = 'link' AND fp.user_id = ?"
+    link_select_base = "SELECT l.id, l.title AS name, l.description, l.url, l.is_external_link, l.stored_filename, 'link' AS type, l.top_level_comment_count as comment_count"
+    link_from_base = "FROM links l LEFT JOIN users u_up ON l.created_by_user_id = u_up.id LEFT JOIN users u_upd ON l.updated_by_user_id = u_upd.id"
     link_fields_to_search = ['LOWER(l.title)', 'LOWER(l.description)', 'LOWER(l.url)', 'LOWER(u_up.username)', 'LOWER(u_upd.username)'] # Added user fields
     link_search_conditions, link_search_params = build_search_conditions(link_fields_to_search, search_terms)
-    
-    link_params = [logged_in_user_id] + link_search_params
+    link_where_combined, link_where_params = permission_where('link', 'l.id', link_search_conditions, link_search_params)
+    link_downloadable_sql, link_downloadable_params = denies.downloadable_column('link', 'l.id')
 
-    link_where_combined = base_permission_where_clause
-    if link_search_conditions:
-        link_where_combined += f" AND ({link_search_conditions})"
-        
+    link_params = list(link_downloadable_params) # Params follow placeholder order: select list, joins, WHERE
     if logged_in_user_id:
-        link_select_final = f"{link_select_base}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        link_from_final = f"{link_from_base} LEFT JOIN file_permissions fp_dl ON l.id = fp_dl.file_id AND fp_dl.file_type = 'link' AND fp_dl.user_id = ? LEFT JOIN user_favorites uf ON l.id = uf.item_id AND uf.item_type = 'link' AND uf.user_id = ?"
-        link_params.extend([logged_in_user_id, logged_in_user_id])
+        link_select_final = f"{link_select_base}, uf.id AS favorite_id, {link_downloadable_sql} AS is_downloadable"
+        link_from_final = f"{link_from_base} LEFT JOIN user_favorites uf ON l.id = uf.item_id AND uf.item_type = 'link' AND uf.user_id = ?"
+        link_params.append(logged_in_user_id)
     else:
-        link_select_final = f"{link_select_base}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        link_from_final = f"{link_from_base} LEFT JOIN file_permissions fp_dl ON l.id = fp_dl.file_id AND fp_dl.file_type = 'link' AND fp_dl.user_id = ?"
-        link_params.append(None)
-        
-    sql_links = f"{link_select_final} {link_from_final} WHERE {link_where_combined}"
-    results.extend([dict(row) for row in db.execute(sql_links, tuple(link_params)).fetchall()])
+        link_select_final = f"{link_select_base}, NULL AS favorite_id, {link_downloadable_sql} AS is_downloadable"
+        link_from_final = link_from_base
+    link_params.extend(link_where_params)
+
+    sql_links = f"{link_select_final} {link_from_final}{link_where_combined}"
+    results.extend(database.fetch_dicts(db.execute(sql_links, tuple(link_params))))
 
     # Misc Files
-    misc_select_base = "SELECT mf.id, mf.user_provided_title AS name, mf.original_filename, mf.user_provided_description AS description, mf.stored_filename, 'misc_file' AS type, (SELECT COUNT(*) FROM comments c WHERE c.item_id = mf.id AND c.item_type = 'misc_file' AND c.parent_comment_id IS NULL) as comment_count"
-    misc_from_base = "FROM misc_files mf LEFT JOIN users u_up ON mf.created_by_user_id = u_up.id LEFT JOIN users u_upd ON mf.updated_by_user_id = u_upd.id LEFT JOIN file_permissions fp ON mf.id = fp.file_id AND fp.file_type = 'misc_file' AND fp.user_id = ?"
+    misc_select_base = "SELECT mf.id, mf.user_provided_title AS name, mf.original_filename, mf.user_provided_description AS description, mf.stored_filename, 'misc_file' AS type, mf.top_level_comment_count as comment_count"
+    misc_from_base = "FROM misc_files mf LEFT JOIN users u_up ON mf.created_by_user_id = u_up.id LEFT JOIN users u_upd ON mf.updated_by_user_id = u_upd.id"
     misc_fields_to_search = ['LOWER(mf.user_provided_title)', 'LOWER(mf.user_provided_description)', 'LOWER(mf.original_filename)', 'LOWER(u_up.username)', 'LOWER(u_upd.username)'] # Added user fields
     misc_search_conditions, misc_search_params = build_search_conditions(misc_fields_to_search, search_terms)
+    misc_where_combined, misc_where_params = permission_where('misc_file', 'mf.id', misc_search_conditions, misc_search_params)
+    misc_downloadable_sql, misc_downloadable_params = denies.downloadable_column('misc_file', 'mf.id')
 
-    misc_params = [logged_in_user_id] + misc_search_params
-
-    misc_where_combined = base_permission_where_clause
-    if misc_search_conditions:
-        misc_where_combined += f" AND ({misc_search_conditions})"
-
+    misc_params = list(misc_downloadable_params) # Params follow placeholder order: select list, joins, WHERE
     if logged_in_user_id:
-        misc_select_final = f"{misc_select_base}, uf.id AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        misc_from_final = f"{misc_from_base} LEFT JOIN file_permissions fp_dl ON mf.id = fp_dl.file_id AND fp_dl.file_type = 'misc_file' AND fp_dl.user_id = ? LEFT JOIN user_favorites uf ON mf.id = uf.item_id AND uf.item_type = 'misc_file' AND uf.user_id = ?"
-        misc_params.extend([logged_in_user_id, logged_in_user_id])
+        misc_select_final = f"{misc_select_base}, uf.id AS favorite_id, {misc_downloadable_sql} AS is_downloadable"
+        misc_from_final = f"{misc_from_base} LEFT JOIN user_favorites uf ON mf.id = uf.item_id AND uf.item_type = 'misc_file' AND uf.user_id = ?"
+        misc_params.append(logged_in_user_id)
     else:
-        misc_select_final = f"{misc_select_base}, NULL AS favorite_id, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download IS FALSE THEN 0 ELSE 1 END) AS is_downloadable"
-        misc_from_final = f"{misc_from_base} LEFT JOIN file_permissions fp_dl ON mf.id = fp_dl.file_id AND fp_dl.file_type = 'misc_file' AND fp_dl.user_id = ?"
-        misc_params.append(None)
+        misc_select_final = f"{misc_select_base}, NULL AS favorite_id, {misc_downloadable_sql} AS is_downloadable"
+        misc_from_final = misc_from_base
+    misc_params.extend(misc_where_params)
 
-    sql_misc_files = f"{misc_select_final} {misc_from_final} WHERE {misc_where_combined}"
-    results.extend([dict(row) for row in db.execute(sql_misc_files, tuple(misc_params)).fetchall()])
+    sql_misc_files = f"{misc_select_final} {misc_from_final}{misc_where_combined}"
+    results.extend(database.fetch_dicts(db.execute(sql_misc_files, tuple(misc_params))))
 
     # Software
     software_fields_to_search = ['LOWER(s.name)', 'LOWER(s.description)']
@@ -7388,20 +8330,21 @@ def search_api():
     sql_software_select = "SELECT s.id, s.name, s.description, 'software' AS type"
     sql_software_from = "FROM software s"
     
-    final_software_params = list(software_search_params) 
+    final_software_params = [] # Params follow placeholder order: the favorites join, then WHERE
     if logged_in_user_id:
         sql_software_select += ", uf.id AS favorite_id"
         sql_software_from += " LEFT JOIN user_favorites uf ON s.id = uf.item_id AND uf.item_type = 'software' AND uf.user_id = ?"
         final_software_params.append(logged_in_user_id)
     else:
         sql_software_select += ", NULL AS favorite_id"
+    final_software_params.extend(software_search_params)
     
     if software_search_conditions:
         sql_software_query = f"{sql_software_select} {sql_software_from} WHERE {software_search_conditions}"
     else: 
         sql_software_query = f"{sql_software_select} {sql_software_from}"
 
-    results.extend([dict(row) for row in db.execute(sql_software_query, tuple(final_software_params)).fetchall()])
+    results.extend(database.fetch_dicts(db.execute(sql_software_query, tuple(final_software_params))))
 
     # Versions
     version_fields_to_search = ['LOWER(v.version_number)', 'LOWER(v.changelog)', 'LOWER(v.known_bugs)']
@@ -7410,20 +8353,21 @@ def search_api():
     sql_versions_select = "SELECT v.id, v.version_number AS name, v.changelog, v.known_bugs, v.software_id, sw.name AS software_name, 'version' AS type"
     sql_versions_from = "FROM versions v JOIN software sw ON v.software_id = sw.id"
     
-    final_version_params = list(version_search_params)
+    final_version_params = [] # Params follow placeholder order: the favorites join, then WHERE
     if logged_in_user_id:
         sql_versions_select += ", uf.id AS favorite_id"
         sql_versions_from += " LEFT JOIN user_favorites uf ON v.id = uf.item_id AND uf.item_type = 'version' AND uf.user_id = ?"
         final_version_params.append(logged_in_user_id)
     else:
         sql_versions_select += ", NULL AS favorite_id"
+    final_version_params.extend(version_search_params)
 
     if version_search_conditions:
         sql_versions_query = f"{sql_versions_select} {sql_versions_from} WHERE {version_search_conditions}"
     else:
         sql_versions_query = f"{sql_versions_select} {sql_versions_from}"
         
-    results.extend([dict(row) for row in db.execute(sql_versions_query, tuple(final_version_params)).fetchall()])
+    results.extend(database.fetch_dicts(db.execute(sql_versions_query, tuple(final_version_params))))
 
     return jsonify(results)
 
@@ -7736,18 +8680,29 @@ def restore_database():
         # Create a failsafe backup of the current live DB
         try:
             if os.path.exists(current_db_path): # Only backup if current DB exists
-                 shutil.copy2(current_db_path, failsafe_db_backup_path)
+                 database.backup_database(current_db_path, failsafe_db_backup_path)
                  app.logger.info(f"Created failsafe backup of current DB at {failsafe_db_backup_path}")
         except Exception as e_backup:
             app.logger.error(f"Failed to create failsafe backup of current DB: {e_backup}")
             # Decide if to proceed or not. For now, we'll proceed but this is a risk.
             # Consider returning an error here if failsafe is critical.
 
+        # Release this request's connection and close pooled ones, then drop the old -wal/-shm
+        # files so SQLite doesn't replay the old database's WAL onto the restored file.
+        db_conn_to_release = g.pop('db', None)
+        if db_conn_to_release is not None:
+            database.release_db_connection(db_conn_to_release)
+        database.dispose_pool(current_db_path)
+        database.remove_database_files(current_db_path)
+
         # Move the uploaded file to replace the current database
         # This operation should be atomic on most systems if source and destination are on the same filesystem.
         shutil.move(temp_uploaded_db_path, current_db_path)
         app.logger.info(f"Successfully moved uploaded DB {temp_uploaded_db_path} to {current_db_path}")
 
+        # Bring an older backup up to the current schema version
+        schema_migrations.run_migrations(current_db_path, log=app.logger.info)
+
 
         # 11. Log an audit action
         log_audit_action(
@@ -7843,11 +8798,13 @@ def database_reset_confirm():
         except Exception as e_close:
             app.logger.error(f"Error closing g.db connection before reset: {e_close}")
             # Potentially proceed, but this is risky. For now, we will proceed.
+    # Close idle pooled connections; connections still borrowed elsewhere are closed when released.
+    database.dispose_pool(db_path)
 
-    # Delete the database file
+    # Delete the database file (and its WAL side files)
     try:
         if os.path.exists(db_path):
-            os.remove(db_path)
+            database.remove_database_files(db_path)
             app.logger.info(f"Database file {db_path} deleted successfully.")
         else:
             app.logger.warning(f"Database file {db_path} not found for deletion during reset. Proceeding to re-initialize.")
@@ -7863,14 +8820,14 @@ def database_reset_confirm():
     # Re-initialize the database
     try:
         database.init_db(db_path) # This function now handles db_path correctly
+        schema_migrations.run_migrations(db_path, log=app.logger.info)
         app.logger.info(f"Database {db_path} re-initialized successfully.")
 
         # After init_db, it's good practice to re-establish g.db for any subsequent operations in this request (if any)
         # or for other teardown logic that might expect g.db.
         # However, since we're returning immediately, it might not be strictly necessary here.
         # For robustness:
-        g.db = database.get_db_connection(db_path)
-        g.db.row_factory = sqlite3.Row
+        get_db()
 
 
         log_audit_action(
@@ -8002,6 +8959,17 @@ def get_user_favorites_api():
         return jsonify(msg="An error occurred while fetching favorites."), 500
 
 
+def favorite_status_payload(favorite_record):
+    """The /api/favorites/status body for a user_favorites row (or None)."""
+    if favorite_record:
+        processed_fav_record = convert_timestamps_to_ist_iso(dict(favorite_record), ['created_at'])
+        return {
+            "is_favorite": True,
+            "favorite_id": processed_fav_record['id'], # ID of the user_favorites record
+            "favorited_at": processed_fav_record['created_at'] # Key is 'created_at' in DB, exposed as 'favorited_at'
+        }
+    return {"is_favorite": False, "favorite_id": None, "favorited_at": None}
+
 @app.route('/api/favorites/status/<item_type>/<int:item_id>', methods=['GET'])
 @active_user_required
 def get_user_favorite_status_api(item_type, item_id):
@@ -8014,15 +8982,7 @@ def get_user_favorite_status_api(item_type, item_id):
     db = get_db()
     favorite_record = database.get_favorite_status(db, user_id, item_id, item_type)
 
-    if favorite_record:
-        processed_fav_record = convert_timestamps_to_ist_iso(dict(favorite_record), ['created_at'])
-        return jsonify({
-            "is_favorite": True,
-            "favorite_id": processed_fav_record['id'], # ID of the user_favorites record
-            "favorited_at": processed_fav_record['created_at'] # Key is 'created_at' in DB, exposed as 'favorited_at'
-        }), 200
-    else:
-        return jsonify({"is_favorite": False, "favorite_id": None, "favorited_at": None}), 200
+    return jsonify(favorite_status_payload(favorite_record)), 200
 
 # --- Audit Log Viewer Endpoint (Admin) ---
 @app.route('/api/admin/audit-logs', methods=['GET'])
@@ -8080,16 +9040,14 @@ def get_audit_logs():
             query_params.append(filter_target_table)
         if filter_date_from:
             try:
-                datetime.strptime(filter_date_from, '%Y-%m-%d')
-                where_clauses.append("date(timestamp) >= date(?)")
-                query_params.append(filter_date_from)
+                where_clauses.append("timestamp >= ?")
+                query_params.append(day_range_start(filter_date_from))
             except ValueError:
                 return jsonify(msg="Invalid date_from format. Expected YYYY-MM-DD."), 400
         if filter_date_to:
             try:
-                datetime.strptime(filter_date_to, '%Y-%m-%d')
-                where_clauses.append("date(timestamp) <= date(?)")
-                query_params.append(filter_date_to)
+                where_clauses.append("timestamp < ?")
+                query_params.append(day_range_end(filter_date_to))
             except ValueError:
                 return jsonify(msg="Invalid date_to format. Expected YYYY-MM-DD."), 400
 
@@ -8100,18 +9058,10 @@ def get_audit_logs():
 
         # Get total count
         try:
-            total_logs_cursor = db.execute(count_query, tuple(query_params))
-            total_logs_result = total_logs_cursor.fetchone()
-            if total_logs_result is None: # Defensive check
-                app.logger.error("Failed to fetch audit log count: query returned None.")
-                return jsonify(msg="Error fetching audit log count: No result from count query."), 500
-            total_logs = total_logs_result['count']
+            total_logs = cached_count(db, count_query, query_params, ['audit_logs'])
         except sqlite3.Error as e:
             app.logger.error(f"Database error fetching audit log count: {e}")
             return jsonify(msg=f"Database error fetching audit log count: {e}"), 500
-        except KeyError: # If 'count' key is missing from the result
-            app.logger.error("Failed to fetch audit log count: 'count' key missing from result.")
-            return jsonify(msg="Error fetching audit log count: Malformed count query result."), 500
 
 
         total_pages = math.ceil(total_logs / per_page) if total_logs > 0 else 1
@@ -8126,7 +9076,7 @@ def get_audit_logs():
 
         try:
             logs_cursor = db.execute(base_query, tuple(query_params))
-            logs_list_raw = [dict(row) for row in logs_cursor.fetchall()]
+            logs_list_raw = database.fetch_dicts(logs_cursor)
             ts_keys = ['timestamp']
             logs_list = [convert_timestamps_to_ist_iso(log, ts_keys) for log in logs_list_raw]
         except sqlite3.Error as e:
@@ -8146,6 +9096,132 @@ def get_audit_logs():
         app.logger.error(f"Failed to retrieve audit logs: {e}", exc_info=True)
         return jsonify(error="Failed to retrieve audit logs", details=str(e)), 500
 
+# --- Catalog Export Endpoint (Admin) ---
+# Export name -> (file type for permissions, id column, select fields, FROM clause). The same
+# fields as the listings, without the caller's favorites.
+EXPORT_ITEM_QUERIES = {
+    'documents': ('document', 'd.id', """
+        d.id, d.software_id, s.name as software_name, d.doc_name, d.description, d.doc_type,
+        d.is_external_link, d.download_link, d.stored_filename, d.original_filename_ref, d.file_size, d.file_type,
+        d.created_by_user_id, u.username as uploaded_by_username, d.created_at,
+        d.updated_by_user_id, upd_u.username as updated_by_username, d.updated_at, d.top_level_comment_count as comment_count
+    """, """
+        FROM documents d JOIN software s ON d.software_id = s.id
+        LEFT JOIN users u ON d.created_by_user_id = u.id LEFT JOIN users upd_u ON d.updated_by_user_id = upd_u.id
+    """),
+    'patches': ('patch', 'p.id', """
+        p.id, p.version_id, p.patch_name, p.description, p.release_date,
+        p.is_external_link, p.download_link, p.stored_filename, p.original_filename_ref,
+        p.file_size, p.file_type, p.patch_by_developer,
+        p.created_by_user_id, u.username as uploaded_by_username, p.created_at,
+        p.updated_by_user_id, upd_u.username as updated_by_username, p.updated_at,
+        s.name as software_name, s.id as software_id, v.version_number,
+        p.top_level_comment_count as comment_count, p.compatible_vms_versions
+    """, """
+        FROM patches p JOIN versions v ON p.version_id = v.id JOIN software s ON v.software_id = s.id
+        LEFT JOIN users u ON p.created_by_user_id = u.id LEFT JOIN users upd_u ON p.updated_by_user_id = upd_u.id
+    """),
+    'links': ('link', 'l.id', """
+        l.id, l.title, l.description, l.software_id, l.version_id,
+        l.is_external_link, l.url, l.stored_filename, l.original_filename_ref,
+        l.file_size, l.file_type,
+        l.created_by_user_id, u.username as uploaded_by_username, l.created_at,
+        l.updated_by_user_id, upd_u.username as updated_by_username, l.updated_at,
+        s.name as software_name, v.version_number as version_name,
+        l.top_level_comment_count as comment_count, l.compatible_vms_versions
+    """, """
+        FROM links l JOIN software s ON l.software_id = s.id LEFT JOIN versions v ON l.version_id = v.id
+        LEFT JOIN users u ON l.created_by_user_id = u.id LEFT JOIN users upd_u ON l.updated_by_user_id = upd_u.id
+    """),
+    'misc_files': ('misc_file', 'mf.id', """
+        mf.id, mf.misc_category_id, mc.name as category_name, mf.user_id, mf.user_provided_title,
+        mf.user_provided_description, mf.original_filename, mf.stored_filename, mf.file_path, mf.file_type, mf.file_size,
+        mf.created_by_user_id, u.username as uploaded_by_username, mf.created_at,
+        mf.updated_by_user_id, upd_u.username as updated_by_username, mf.updated_at, mf.top_level_comment_count as comment_count
+    """, """
+        FROM misc_files mf JOIN misc_categories mc ON mf.misc_category_id = mc.id
+        LEFT JOIN users u ON mf.created_by_user_id = u.id LEFT JOIN users upd_u ON mf.updated_by_user_id = upd_u.id
+    """),
+}
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+@app.route('/api/admin/export/<string:export_name>', methods=['GET'])
+@readonly_db
+@jwt_required()
+@admin_required
+def export_items(export_name):
+    """
+    Streams every document, patch, link or misc file the caller may view as NDJSON (one object
+    per line, default) or CSV (?format=csv), in id order. Rows are read from one cursor in
+    batches of EXPORT_BATCH_SIZE and written out as they come, so memory use doesn't grow
+    with the table; the export is a consistent snapshot of the table as of its start.
+    """
+    query = EXPORT_ITEM_QUERIES.get(export_name)
+    if query is None:
+        return jsonify(msg=f"Unknown export '{export_name}'. Use one of: {', '.join(EXPORT_ITEM_QUERIES)}."), 400
+    export_format = request.args.get('format', default='ndjson', type=str).lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(msg="format must be 'ndjson' or 'csv'."), 400
+
+    db = get_db()
+    current_user_id = int(get_jwt_identity())
+    file_type, id_column, select_fields, from_clause = query
+    denies = get_file_denies(db, current_user_id)
+    downloadable_sql, downloadable_params = denies.downloadable_column(file_type, id_column)
+    params = list(downloadable_params)
+    sql = f"SELECT {select_fields}, {downloadable_sql} AS is_downloadable {from_clause}"
+    view_filter = denies.view_condition(file_type, id_column)
+    if view_filter:
+        sql += f" WHERE {view_filter[0]}"
+        params.extend(view_filter[1])
+    sql += f" ORDER BY {id_column}"
+    try:
+        cursor = db.execute(sql, params) # Only prepares and steps to the first row
+    except Exception as e:
+        app.logger.error(f"Error starting {export_name} export: {e}")
+        return jsonify(msg="Error starting export."), 500
+
+    log_audit_action(
+        action_type='EXPORT_ITEMS',
+        target_table=export_name,
+        details={'format': export_format}
+    )
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    column_names = [column[0] for column in cursor.description]
+
+    def generate_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == 'csv' else None
+        if writer:
+            writer.writerow(column_names)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    item = convert_timestamps_to_ist_iso(dict(zip(column_names, row)), ['created_at', 'updated_at'])
+                    if writer:
+                        writer.writerow(item.values())
+                    else:
+                        buffer.write(app.json.dumps(item))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        except Exception as e:
+            # Headers are already sent, so the client sees a truncated body rather than an error status
+            app.logger.error(f"Error during {export_name} export, output truncated: {e}")
+        finally:
+            cursor.close()
+        if writer and buffer.tell():
+            yield buffer.getvalue() # The header row of an empty export
+
+    response = app.response_class(stream_with_context(generate_rows()), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_name}.{export_format}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # --- Admin System Health Endpoint ---
 @app.route('/api/admin/system-health', methods=['GET'])
 @jwt_required()
@@ -8169,150 +9245,116 @@ def get_system_health():
         "db_connection": db_status
     }), 200
 
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@jwt_required()
+@super_admin_required
+def get_slow_queries():
+    """Statements slower than SLOW_QUERY_THRESHOLD_MS since startup, grouped by normalized SQL."""
+    limit = request.args.get('limit', 50, type=int)
+    entries = slow_query_log.entries()
+    return jsonify({
+        "threshold_ms": slow_query_log.threshold_ms,
+        "total_entries": len(entries),
+        "slow_queries": entries[:max(limit, 0)]
+    }), 200
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@jwt_required()
+@super_admin_required
+def clear_slow_queries():
+    slow_query_log.clear()
+    log_audit_action(action_type='CLEAR_SLOW_QUERY_LOG')
+    return jsonify(msg="Slow query log cleared."), 200
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@jwt_required()
+@super_admin_required
+def get_cache_stats():
+    """Size and hit rate of the in-process caches invalidated by database.table_versions."""
+    return jsonify({
+        "responses": response_cache.stats(),
+        "listing_counts": listing_count_cache.stats(),
+        "permission_denies": permission_deny_cache.stats(),
+        "favorites_fingerprints": favorites_fingerprint_cache.stats(),
+        "catalog": catalog_cache.stats(),
+    }), 200
+
+@app.route('/api/admin/cache-stats', methods=['DELETE'])
+@jwt_required()
+@super_admin_required
+def clear_response_cache():
+    """Drops cached responses and resets the counters (entries are otherwise only replaced when stale)."""
+    response_cache.clear()
+    response_cache.hits = response_cache.misses = 0
+    log_audit_action(action_type='CLEAR_RESPONSE_CACHE')
+    return jsonify(msg="Response cache cleared."), 200
+
 # --- Admin Dashboard Statistics Endpoint ---
 
-def get_daily_counts(db, action_types, days=7):
-    if not action_types:
-        return []
-    
-    placeholders = ','.join(['?'] * len(action_types))
+def _count_rows_per_day(db, table, timestamp_col, days, extra_where='', params=()):
+    """
+    Row counts for each of the last `days` IST calendar days (oldest first, zero-filled).
+    Each day is counted with a half-open range on timestamp_col so it is an index range scan.
+    """
     query = f"""
         WITH RECURSIVE dates(date) AS (
-          SELECT date('now', '-{days-1} days') -- Corrected to ensure 'days' includes today
+          SELECT date('now', '+05:30', '-{days-1} days')
           UNION ALL
           SELECT date(date, '+1 day')
           FROM dates
-          WHERE date < date('now')
+          WHERE date < date('now', '+05:30')
         )
         SELECT
           d.date,
-          COALESCE(COUNT(al.id), 0) as count
+          (SELECT COUNT(*) FROM {table} t
+           WHERE t.{timestamp_col} >= d.date AND t.{timestamp_col} < date(d.date, '+1 day'){extra_where}) as count
         FROM dates d
-        LEFT JOIN audit_logs al
-          ON date(al.timestamp) = d.date AND al.action_type IN ({placeholders})
-        GROUP BY d.date
         ORDER BY d.date ASC;
     """
-    params = list(action_types)
-    results = db.execute(query, params).fetchall()
-    return [dict(row) for row in results]
-
-def get_weekly_counts(db, action_types, weeks=4):
-    if not action_types:
-        return []
+    return database.fetch_dicts(db.execute(query, tuple(params)))
 
-    placeholders = ','.join(['?'] * len(action_types))
-    # Calculate the start date for the recursive CTE:
-    # (weeks-1)*7 days ago from today, then find the Sunday of that week.
-    # Example: for 4 weeks, this is 21 days ago.
-    start_date_offset = (weeks - 1) * 7
-    query = f"""
-        WITH RECURSIVE week_starts(week_start_date) AS (
-          SELECT date('now', 'weekday 0', '-{start_date_offset + 6} days') 
-          UNION ALL
-          SELECT date(week_start_date, '+7 days')
-          FROM week_starts
-          WHERE date(week_start_date, '+7 days') <= date('now', 'weekday 0', '+1 day') 
-        )
-        SELECT
-          w.week_start_date,
-          COALESCE(COUNT(al.id), 0) as count
-        FROM week_starts w
-        LEFT JOIN audit_logs al
-          ON date(al.timestamp, 'weekday 0', '-6 days') = w.week_start_date AND al.action_type IN ({placeholders})
-        GROUP BY w.week_start_date
-        ORDER BY w.week_start_date ASC;
+def _count_rows_per_week(db, table, timestamp_col, weeks, extra_where='', params=()):
     """
-    # The recursive CTE for weeks needs to generate Sundays.
-    # If today is Sunday, 'weekday 0' gives today.
-    # If today is Monday, 'weekday 0' gives yesterday (Sunday).
-    # So, date('now', 'weekday 0', '-{X} days') is the correct way to get a past Sunday.
-    # For `weeks=4`: we want this week's Sunday, and 3 previous Sundays.
-    # `date('now', 'weekday 0')` is this week's Sunday.
-    # `date('now', 'weekday 0', '-7 days')` is last week's Sunday.
-    # `date('now', 'weekday 0', '-14 days')` is two weeks ago Sunday.
-    # `date('now', 'weekday 0', '-21 days')` is three weeks ago Sunday.
-    # So the initial SELECT for weeks should be `date('now', 'weekday 0', '-{(weeks-1)*7} days')`
-    # The condition `WHERE date(week_start_date, '+7 days') <= date('now', 'weekday 0', '+1 day')` seems a bit off.
-    # It should be `WHERE week_start_date < date('now', 'weekday 0')` if the initial date is correct.
-    # Or, more simply, limit the recursion count or ensure the last date is not beyond current week's Sunday.
-    # Let's adjust the initial select and the recursive condition.
-    # If weeks = 4, initial select: date('now', 'weekday 0', '-21 days')
-    # Loop while date(week_start_date, '+7 days') <= date('now', 'weekday 0')
-
-    # Corrected weekly query logic:
-    # Initial date: Sunday of the week (weeks-1) weeks ago.
-    # End date: Sunday of the current week.
-    initial_sunday_offset = (weeks - 1) * 7
-    query_corrected_weekly = f"""
+    Row counts for the last `weeks` Sunday-to-Saturday IST weeks, including the current one.
+    week_start_date is the Sunday; the week covers [week_start_date, week_start_date + 7 days).
+    """
+    query = f"""
         WITH RECURSIVE week_dates(week_start_date) AS (
-          SELECT date('now', 'weekday 0', '-{initial_sunday_offset} days')
+          SELECT date('now', '+05:30', '-6 days', 'weekday 0', '-{(weeks - 1) * 7} days')
           UNION ALL
           SELECT date(week_start_date, '+7 days')
           FROM week_dates
-          WHERE date(week_start_date, '+7 days') <= date('now', 'weekday 0')
+          WHERE week_start_date < date('now', '+05:30', '-6 days', 'weekday 0')
         )
         SELECT
           wd.week_start_date,
-          COALESCE(COUNT(al.id), 0) as count
+          (SELECT COUNT(*) FROM {table} t
+           WHERE t.{timestamp_col} >= wd.week_start_date AND t.{timestamp_col} < date(wd.week_start_date, '+7 days'){extra_where}) as count
         FROM week_dates wd
-        LEFT JOIN audit_logs al
-          ON date(al.timestamp, 'weekday 0', '-6 days') = wd.week_start_date AND al.action_type IN ({placeholders})
-        GROUP BY wd.week_start_date
         ORDER BY wd.week_start_date ASC;
     """
-    # Check if the number of weeks generated is correct.
-    # If weeks = 1, initial_sunday_offset = 0. Dates: current Sunday. Correct.
-    # If weeks = 4, initial_sunday_offset = 21. Dates: Sun(-3w), Sun(-2w), Sun(-1w), Sun(current). Correct.
+    return database.fetch_dicts(db.execute(query, tuple(params)))
+
+def get_daily_counts(db, action_types, days=7):
+    if not action_types:
+        return []
+    placeholders = ','.join(['?'] * len(action_types))
+    return _count_rows_per_day(db, 'audit_logs', 'timestamp', days, f" AND t.action_type IN ({placeholders})", action_types)
 
-    params = list(action_types)
-    results = db.execute(query_corrected_weekly, params).fetchall()
-    return [dict(row) for row in results]
+def get_weekly_counts(db, action_types, weeks=4):
+    if not action_types:
+        return []
+    placeholders = ','.join(['?'] * len(action_types))
+    return _count_rows_per_week(db, 'audit_logs', 'timestamp', weeks, f" AND t.action_type IN ({placeholders})", action_types)
 
 def get_daily_download_counts(db, days=7):
-    query = f"""
-        WITH RECURSIVE dates(date) AS (
-          SELECT date('now', '-{days-1} days')
-          UNION ALL
-          SELECT date(date, '+1 day')
-          FROM dates
-          WHERE date < date('now')
-        )
-        SELECT
-          d.date,
-          COALESCE(COUNT(dl.id), 0) as count
-        FROM dates d
-        LEFT JOIN download_log dl
-          ON date(dl.download_timestamp) = d.date
-        GROUP BY d.date
-        ORDER BY d.date ASC;
-    """
-    results = db.execute(query).fetchall()
-    return [dict(row) for row in results]
+    return _count_rows_per_day(db, 'download_log', 'download_timestamp', days)
 
 def get_weekly_download_counts(db, weeks=4):
-    initial_sunday_offset = (weeks - 1) * 7
-    query = f"""
-        WITH RECURSIVE week_dates(week_start_date) AS (
-          SELECT date('now', 'weekday 0', '-{initial_sunday_offset} days')
-          UNION ALL
-          SELECT date(week_start_date, '+7 days')
-          FROM week_dates
-          WHERE date(week_start_date, '+7 days') <= date('now', 'weekday 0')
-        )
-        SELECT
-          wd.week_start_date,
-          COALESCE(COUNT(dl.id), 0) as count
-        FROM week_dates wd
-        LEFT JOIN download_log dl
-          ON date(dl.download_timestamp, 'weekday 0', '-6 days') = wd.week_start_date
-        GROUP BY wd.week_start_date
-        ORDER BY wd.week_start_date ASC;
-    """
-    results = db.execute(query).fetchall()
-    return [dict(row) for row in results]
+    return _count_rows_per_week(db, 'download_log', 'download_timestamp', weeks)
 
 @app.route('/api/admin/dashboard-stats', methods=['GET'])
+@readonly_db
 @jwt_required()
 @admin_required
 def get_dashboard_stats():
@@ -8427,7 +9469,7 @@ def get_dashboard_stats():
         total_storage_utilized_bytes = docs_size + patches_size + links_size + misc_files_size
 
         # --- Content Health Indicators ---
-        stale_threshold_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        stale_threshold_date = (datetime.now(IST) - timedelta(days=365)).strftime('%Y-%m-%d')
         content_health = {"missing_descriptions": {}, "stale_content": {}}
 
         # Missing Descriptions
@@ -8458,27 +9500,27 @@ def get_dashboard_stats():
 
         # Stale Content
         content_health['stale_content']['documents'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM documents WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM documents WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': content_health['missing_descriptions']['documents']['total']
         }
         content_health['stale_content']['patches'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM patches WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM patches WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': content_health['missing_descriptions']['patches']['total']
         }
         content_health['stale_content']['links'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM links WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM links WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': content_health['missing_descriptions']['links']['total']
         }
         content_health['stale_content']['misc_files'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM misc_files WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM misc_files WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': content_health['missing_descriptions']['misc_files']['total']
         }
         content_health['stale_content']['versions'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM versions WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM versions WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': db.execute("SELECT COUNT(*) as count FROM versions").fetchone()['count'] or 0
         }
         content_health['stale_content']['misc_categories'] = {
-            'stale': db.execute("SELECT COUNT(*) as count FROM misc_categories WHERE date(updated_at) < date(?)", (stale_threshold_date,)).fetchone()['count'] or 0,
+            'stale': db.execute("SELECT COUNT(*) as count FROM misc_categories WHERE updated_at < ?", (stale_threshold_date,)).fetchone()['count'] or 0,
             'total': content_health['missing_descriptions']['misc_categories']['total']
         }
 
@@ -8523,13 +9565,46 @@ def _initialize_global_password(db: sqlite3.Connection):
 # --- CLI Command ---
 @app.cli.command('init-db')
 def init_db_command():
-    database.init_db(app.config['DATABASE'])
+    if postgres_backend.is_postgres_url(app.config['DATABASE_URL']):
+        postgres_backend.init_db(app.config['DATABASE_URL'])
+    else:
+        database.init_db(app.config['DATABASE'])
+        schema_migrations.run_migrations(app.config['DATABASE'])
     print('Initialized the database.')
     try:
         db = get_db() 
         _initialize_global_password(db)
     except Exception as e: print(f"Error during global password initialization in init_db_command: {e}")
 
+@app.cli.command('migrate')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations and whether they are applied.')
+@click.option('--target', type=int, default=None, help='Apply migrations up to and including this version.')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='Rows per transaction for backfill steps.')
+def migrate_command(show_status, target, batch_size):
+    """Applies pending schema migrations from migrations/. Safe to re-run after an interruption."""
+    if postgres_backend.is_postgres_url(app.config['DATABASE_URL']):
+        # The runner is SQLite-only; a PostgreSQL schema comes from schema.sql, which init-db
+        # records as including every migration present at the time.
+        conn = postgres_backend.PostgresConnection(app.config['DATABASE_URL'])
+        try:
+            pending = postgres_backend.pending_migrations(conn)
+        finally:
+            conn.close()
+        if not pending:
+            print("Database schema is up to date.")
+            return
+        for migration in pending:
+            print(f"{migration.version:04d}_{migration.name}: pending")
+        raise click.ClickException("Migrations can't be applied to PostgreSQL; apply these changes by hand "
+                                   "and record them in schema_version, or re-create the schema with 'flask init-db'.")
+    runner = schema_migrations.MigrationRunner(app.config['DATABASE'], batch_size=batch_size)
+    if show_status:
+        for migration, state in runner.status():
+            print(f"{migration.version:04d}_{migration.name}: {state}")
+        return
+    applied = runner.run(target=target)
+    print(f"Applied {applied} migration(s)." if applied else "Database schema is up to date.")
+
 # It's important that app.static_folder is correctly defined earlier in the script,
 # which should be:
 # STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'dist')
@@ -8565,7 +9640,7 @@ def get_maintenance_mode_status():
 def enable_maintenance_mode():
     db = get_db()
     try:
-        cursor = db.execute("UPDATE system_settings SET is_enabled = 1 WHERE setting_name = 'maintenance_mode'")
+        cursor = db.execute("UPDATE system_settings SET is_enabled = 1, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30') WHERE setting_name = 'maintenance_mode'")
         db.commit()
         if cursor.rowcount > 0:
             log_audit_action(action_type='MAINTENANCE_MODE_ENABLED')
@@ -8589,7 +9664,7 @@ def enable_maintenance_mode():
 def disable_maintenance_mode():
     db = get_db()
     try:
-        cursor = db.execute("UPDATE system_settings SET is_enabled = 0 WHERE setting_name = 'maintenance_mode'")
+        cursor = db.execute("UPDATE system_settings SET is_enabled = 0, updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30') WHERE setting_name = 'maintenance_mode'")
         db.commit()
         if cursor.rowcount > 0:
             log_audit_action(action_type='MAINTENANCE_MODE_DISABLED')
@@ -8966,7 +10041,7 @@ def admin_upload_large_file():
                         # Category for links is software name
                         link_software_id = new_item.get('software_id')
                         if link_software_id:
-                            sw_info = db.execute("SELECT name FROM software WHERE id = ?", (link_software_id,)).fetchone()
+                            sw_info = get_catalog(db).get_software(link_software_id)
                             if sw_info: category_for_notification = sw_info['name']
                     elif db_item_type == 'misc_file':
                         resolved_content_type = 'misc'
@@ -9038,9 +10113,9 @@ def check_item_exists(db, item_type, item_id):
     elif item_type == 'misc_file':
         return db.execute("SELECT 1 FROM misc_files WHERE id = ?", (item_id,)).fetchone()
     elif item_type == 'software': # Added for future commentability
-        return db.execute("SELECT 1 FROM software WHERE id = ?", (item_id,)).fetchone()
+        return get_catalog(db).get_software(item_id)
     elif item_type == 'version': # Added for future commentability
-        return db.execute("SELECT 1 FROM versions WHERE id = ?", (item_id,)).fetchone()
+        return get_catalog(db).get_version(item_id)
     return None
 
 # --- Bulk Action Endpoints ---
@@ -9095,7 +10170,7 @@ def bulk_delete_items():
     failed_ids = []
     processed_ids_details = [] # For logging individual successes or failures
 
-    db.execute("BEGIN") # Start transaction
+    db.execute("BEGIN IMMEDIATE") # Start transaction; IMMEDIATE so the later DELETEs can't hit a stale WAL snapshot
 
     try:
         for item_id in item_ids:
@@ -9125,10 +10200,12 @@ def bulk_delete_items():
                     file_deleted_successfully = False # Log this, but don't necessarily fail the DB delete for it
 
             # Delete DB record
+            database.adjust_facet_counts(db, item_type, [item_id], -1)
             delete_cursor = db.execute(f"DELETE FROM {config['table']} WHERE {config['id_col']} = ?", (item_id,))
             
             if delete_cursor.rowcount > 0:
                 success_count += 1
+                database.record_item_changes(db, item_type, [item_id], 'delete')
                 processed_ids_details.append({'id': item_id, 'name': item_name, 'status': 'deleted', 'file_deleted': file_deleted_successfully})
                 log_audit_action(
                     action_type=config['log_action'],
@@ -9474,10 +10551,7 @@ def bulk_move_items():
             app.logger.debug(f"bulk_move_items: Returning error status=400, msg='target_software_id is required when target_version_id is specified for a link.'")
             return jsonify(msg="target_software_id is required when target_version_id is specified for a link."), 400
 
-        version_belongs_to_software = db.execute(
-            "SELECT 1 FROM versions WHERE id = ? AND software_id = ?",
-            (target_version_id_for_link, target_software_id_for_link)
-        ).fetchone()
+        version_belongs_to_software = get_catalog(db).get_version(target_version_id_for_link, target_software_id_for_link)
         if not version_belongs_to_software:
             app.logger.debug(f"bulk_move_items: Returning error status=400, msg='Target version ID {target_version_id_for_link} does not belong to target software ID {target_software_id_for_link}.'")
             return jsonify(msg=f"Target version ID {target_version_id_for_link} does not belong to target software ID {target_software_id_for_link}."), 400
@@ -9489,9 +10563,12 @@ def bulk_move_items():
     failed_items_details = [] # Store {id, error_reason}
     conflicted_items = [] # Added to store items with conflicts
     processed_ids_audit_details = []
+    moved_audit_entries = []
 
-    db.execute("BEGIN")
+    db.execute("BEGIN IMMEDIATE")
     try:
+        # Items that end up not moved are counted back under the same values below
+        database.adjust_facet_counts(db, item_type, item_ids, -1)
         for item_id in item_ids:
             # Fetch old item details for logging
             old_item_details_query = f"SELECT * FROM {config['table']} WHERE {config['id_col']} = ?"
@@ -9529,7 +10606,7 @@ def bulk_move_items():
             
             set_clauses.append("updated_by_user_id = ?")
             update_params.append(current_user_id)
-            set_clauses.append("updated_at = CURRENT_TIMESTAMP")
+            set_clauses.append("updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')")
 
             update_query = f"UPDATE {config['table']} SET {', '.join(set_clauses)} WHERE {config['id_col']} = ?"
             update_params.append(item_id)
@@ -9544,7 +10621,9 @@ def bulk_move_items():
                     'old_associations': old_associations, 
                     'new_associations': valid_targets
                 })
-                log_audit_action(
+                # Logged once the moves are committed: log_audit_action() commits the open
+                # transaction, which must stay whole until it's clear whether to roll back.
+                moved_audit_entries.append(dict(
                     action_type=config['log_action'],
                     target_table=config['table'],
                     target_id=item_id,
@@ -9554,13 +10633,19 @@ def bulk_move_items():
                         'new_associations': valid_targets,
                         'bulk_operation_id': request.headers.get('X-Request-ID', 'N/A')
                     }
-                )
+                ))
             else:
                 # Should not happen if item was found, unless DB error or concurrent modification
                 failed_items_details.append({'id': item_id, 'error': 'update_failed_in_db'})
                 processed_ids_audit_details.append({'id': item_id, 'status': 'db_update_failed'})
                 app.logger.error(f"Bulk move: DB update command affected 0 rows for {item_type} ID {item_id}.")
 
+        database.adjust_facet_counts(db, item_type, item_ids, 1)
+        moved_ids = [entry['id'] for entry in processed_ids_audit_details if entry['status'] == 'moved']
+        database.record_item_changes(db, item_type, moved_ids)
+        if item_type in ('patch', 'link'): # A new version/software can change whether an item is VMS/VA
+            database.refresh_vms_compatibility(db, item_type, moved_ids)
+
         # Refined message logic
         if success_count == 0 and len(conflicted_items) > 0 and len(failed_items_details) == 0:
             # Scenario 1: All items conflicted
@@ -9606,6 +10691,9 @@ def bulk_move_items():
                 if len(failed_items_details) > 0:
                     msg += f" {len(failed_items_details)} item(s) could not be processed (e.g., not found)."
 
+        if success_count > 0: # Every branch that rolled back left success_count at 0
+            for audit_entry in moved_audit_entries:
+                log_audit_action(**audit_entry)
         log_audit_action(
             action_type='BULK_MOVE_COMPLETE',
             details={
@@ -9937,7 +11025,7 @@ def get_mention_suggestions():
         #     (search_pattern_lower,)
         # )
         
-        suggestions = [dict(row) for row in users_cursor.fetchall()]
+        suggestions = database.fetch_dicts(users_cursor)
         return jsonify(suggestions), 200
         
     except sqlite3.Error as e:
@@ -10008,8 +11096,7 @@ def get_unread_notification_count_api():
     user_id = int(get_jwt_identity()) # Already verified
     db = get_db()
     try:
-        unread_notifications = database.get_unread_notifications(db, user_id)
-        return jsonify({"count": len(unread_notifications)}), 200
+        return jsonify({"count": database.count_unread_notifications(db, user_id)}), 200
     except Exception as e:
         app.logger.error(f"Error fetching unread notification count for user {user_id}: {e}", exc_info=True)
         return jsonify(msg="An error occurred while fetching unread notification count."), 500
@@ -10106,7 +11193,7 @@ def clear_batch_conversations():
     processed_conversation_details = []
 
     try:
-        db.execute("BEGIN")  # Start transaction
+        db.execute("BEGIN IMMEDIATE")  # Start transaction
 
         for conv_id in conversation_ids_to_clear:
             # Initialize result for each conversation for detailed feedback
@@ -10438,18 +11525,7 @@ def get_my_conversations():
         last_message_ts_str = conv_dict.get('last_message_created_at')
         if isinstance(last_message_ts_str, str) and last_message_ts_str:
             try:
-                naive_dt = None
-                try:
-                    naive_dt = datetime.strptime(last_message_ts_str, '%Y-%m-%d %H:%M:%S.%f')
-                except ValueError:
-                    naive_dt = datetime.strptime(last_message_ts_str, '%Y-%m-%d %H:%M:%S')
-                
-                if naive_dt:
-                    utc_aware_dt = UTC.localize(naive_dt)
-                    ist_aware_dt = utc_aware_dt.astimezone(IST)
-                    conv_dict['last_message_created_at'] = ist_aware_dt.isoformat()
-                else:
-                    app.logger.warning(f"Conv list timestamp parsing failed for: '{last_message_ts_str}' in conv ID: {conv_dict.get('conversation_id')}")
+                conv_dict['last_message_created_at'] = utc_db_timestamp_to_ist_iso(last_message_ts_str)
             except Exception as e_ts_conv_list:
                 app.logger.error(f"Conv list timestamp conversion error for conv {conv_dict.get('conversation_id')}: {e_ts_conv_list}", exc_info=True)
                 # In case of error, conv_dict['last_message_created_at'] remains the original string
@@ -10507,14 +11583,7 @@ def get_conversation_with_user(other_user_id_param):
     last_msg_ts_str = target_conversation_details.get('last_message_created_at')
     if isinstance(last_msg_ts_str, str) and last_msg_ts_str:
         try:
-            naive_dt = None
-            try: naive_dt = datetime.strptime(last_msg_ts_str, '%Y-%m-%d %H:%M:%S.%f')
-            except ValueError: naive_dt = datetime.strptime(last_msg_ts_str, '%Y-%m-%d %H:%M:%S')
-            
-            if naive_dt:
-                utc_aware_dt = UTC.localize(naive_dt) # Assuming stored as UTC
-                ist_aware_dt = utc_aware_dt.astimezone(IST) # Convert to IST
-                target_conversation_details['last_message_created_at'] = ist_aware_dt.isoformat()
+            target_conversation_details['last_message_created_at'] = utc_db_timestamp_to_ist_iso(last_msg_ts_str) # Stored as UTC
         except Exception as e_ts_conv_single:
             app.logger.error(f"Timestamp conversion error for single conversation {conversation_row['id']}: {e_ts_conv_single}")
             # Keep original string if conversion fails
@@ -10570,19 +11639,7 @@ def get_conversation_messages(conversation_id):
 
         if isinstance(created_at_str, str) and created_at_str:
             try:
-                naive_dt = None
-                try:
-                    naive_dt = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S.%f')
-                except ValueError:
-                    naive_dt = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S')
-                
-                if naive_dt:
-                    utc_aware_dt = UTC.localize(naive_dt)
-                    ist_aware_dt = utc_aware_dt.astimezone(IST)
-                    message_dict['created_at'] = ist_aware_dt.isoformat()
-                else:
-                    # Log if parsing completely failed (should be rare if DB format is consistent)
-                    app.logger.warning(f"Chat history timestamp parsing failed for: '{created_at_str}' in message ID (if available): {message_dict.get('id')}")
+                message_dict['created_at'] = utc_db_timestamp_to_ist_iso(created_at_str)
             except Exception as e_ts_conv_hist:
                 app.logger.error(f"Chat history timestamp conversion error for message {message_dict.get('id')}: {e_ts_conv_hist}", exc_info=True)
                 # In case of error, message_dict['created_at'] remains the original string
@@ -10646,18 +11703,7 @@ def post_new_message(conversation_id):
         created_at_str = message_dict.get('created_at')
         if isinstance(created_at_str, str) and created_at_str: 
             try:
-                naive_dt = None
-                try:
-                    naive_dt = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S.%f')
-                except ValueError:
-                    naive_dt = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S')
-                
-                if naive_dt: 
-                    utc_aware_dt = UTC.localize(naive_dt) 
-                    ist_aware_dt = utc_aware_dt.astimezone(IST) 
-                    message_dict['created_at'] = ist_aware_dt.isoformat()
-                else:
-                    app.logger.warning(f"Chat timestamp parsing failed for: '{created_at_str}' in message ID (if available): {message_dict.get('id')}")
+                message_dict['created_at'] = utc_db_timestamp_to_ist_iso(created_at_str)
             except Exception as e_ts_conv:
                 app.logger.error(f"Chat timestamp conversion error for message {message_dict.get('id')}: {e_ts_conv}", exc_info=True)
         
@@ -10714,9 +11760,7 @@ def get_user_chat_status(target_user_id):
     # Convert last_seen to ISO format
     if status_dict.get('last_seen'):
         try:
-            naive_dt = datetime.strptime(status_dict['last_seen'], '%Y-%m-%d %H:%M:%S')
-            aware_dt = UTC.localize(naive_dt) 
-            status_dict['last_seen'] = aware_dt.isoformat()
+            status_dict['last_seen'] = utc_db_timestamp_to_iso(status_dict['last_seen'])
         except ValueError as e_ts_conv:
             app.logger.error(f"Error converting last_seen for user_status endpoint (user {target_user_id}): {e_ts_conv}. Value: {status_dict['last_seen']}")
     
@@ -10972,13 +12016,7 @@ def start_conversation_and_send_message():
             last_msg_ts_str = conv_dict.get('last_message_created_at')
             if isinstance(last_msg_ts_str, str) and last_msg_ts_str:
                 try:
-                    naive_dt = None
-                    try: naive_dt = datetime.strptime(last_msg_ts_str, '%Y-%m-%d %H:%M:%S.%f')
-                    except ValueError: naive_dt = datetime.strptime(last_msg_ts_str, '%Y-%m-%d %H:%M:%S')
-                    if naive_dt:
-                        utc_aware_dt = UTC.localize(naive_dt)
-                        ist_aware_dt = utc_aware_dt.astimezone(IST)
-                        conv_dict['last_message_created_at'] = ist_aware_dt.isoformat()
+                    conv_dict['last_message_created_at'] = utc_db_timestamp_to_ist_iso(last_msg_ts_str)
                 except Exception as e_ts_conv:
                      app.logger.error(f"Timestamp conversion error for start_and_send (conv {actual_conversation_id}): {e_ts_conv}")
 
@@ -10998,13 +12036,7 @@ def start_conversation_and_send_message():
     created_at_socket_str = message_dict_for_socket.get('created_at')
     if isinstance(created_at_socket_str, str) and created_at_socket_str:
         try:
-            naive_dt_socket = None
-            try: naive_dt_socket = datetime.strptime(created_at_socket_str, '%Y-%m-%d %H:%M:%S.%f')
-            except ValueError: naive_dt_socket = datetime.strptime(created_at_socket_str, '%Y-%m-%d %H:%M:%S')
-            if naive_dt_socket:
-                utc_aware_dt_socket = UTC.localize(naive_dt_socket)
-                ist_aware_dt_socket = utc_aware_dt_socket.astimezone(IST)
-                message_dict_for_socket['created_at'] = ist_aware_dt_socket.isoformat()
+            message_dict_for_socket['created_at'] = utc_db_timestamp_to_ist_iso(created_at_socket_str)
         except Exception as e_ts_sock:
             app.logger.error(f"Timestamp conversion error for socket message (conv {actual_conversation_id}): {e_ts_sock}")
 
@@ -11034,13 +12066,7 @@ def start_conversation_and_send_message():
                 last_msg_ts_rcp = rcp_conv_dict.get('last_message_created_at')
                 if isinstance(last_msg_ts_rcp, str) and last_msg_ts_rcp:
                     try:
-                        naive_dt_rcp = None
-                        try: naive_dt_rcp = datetime.strptime(last_msg_ts_rcp, '%Y-%m-%d %H:%M:%S.%f')
-                        except ValueError: naive_dt_rcp = datetime.strptime(last_msg_ts_rcp, '%Y-%m-%d %H:%M:%S')
-                        if naive_dt_rcp:
-                            utc_aware_dt_rcp = UTC.localize(naive_dt_rcp)
-                            ist_aware_dt_rcp = utc_aware_dt_rcp.astimezone(IST)
-                            rcp_conv_dict['last_message_created_at'] = ist_aware_dt_rcp.isoformat()
+                        rcp_conv_dict['last_message_created_at'] = utc_db_timestamp_to_ist_iso(last_msg_ts_rcp)
                     except Exception as e_ts_rcp:
                         app.logger.error(f"Timestamp conversion error for start_and_send (recipient, conv {actual_conversation_id}): {e_ts_rcp}")
 
@@ -11151,11 +12177,13 @@ def handle_connect(auth=None):
     
     try:
         db = get_db()
-        db.execute(
+        # wait=True: the online-users count emitted below must include this user.
+        database.execute_write(
+            db,
             "UPDATE users SET is_online = TRUE, last_seen = CURRENT_TIMESTAMP WHERE id = ?",
-            (user_id_for_connect,)
+            (user_id_for_connect,),
+            wait=True
         )
-        db.commit()
         app.logger.info(f"SocketIO connect: User {user_id_for_connect} status set to online and last_seen updated.")
         socketio.emit('user_online', {'user_id': user_id_for_connect}) # Broadcast user_online
         emit_unread_chat_count(user_id_for_connect)
@@ -11177,23 +12205,22 @@ def handle_disconnect():
         # Update user's online status to FALSE and record last_seen
         try:
             db = get_db() # Ensure db is accessible
-            cursor = db.execute(
+            write_result = database.execute_write(
+                db,
                 "UPDATE users SET is_online = FALSE, last_seen = CURRENT_TIMESTAMP WHERE id = ?",
-                (user_id_for_disconnect,)
+                (user_id_for_disconnect,),
+                wait=True
             )
-            db.commit()
 
-            if cursor.rowcount > 0:
+            if write_result.rowcount > 0:
                 app.logger.info(f"SocketIO disconnect: User {user_id_for_disconnect} status set to offline and last_seen updated.")
                 # Fetch the updated last_seen time
                 user_details_for_event = db.execute("SELECT last_seen FROM users WHERE id = ?", (user_id_for_disconnect,)).fetchone()
                 last_seen_timestamp_iso = None
                 if user_details_for_event and user_details_for_event['last_seen']:
                     try:
-                        # Assuming last_seen is stored as 'YYYY-MM-DD HH:MM:SS' (UTC from CURRENT_TIMESTAMP)
-                        naive_dt = datetime.strptime(user_details_for_event['last_seen'], '%Y-%m-%d %H:%M:%S')
-                        aware_dt = UTC.localize(naive_dt) # Make it UTC aware
-                        last_seen_timestamp_iso = aware_dt.isoformat()
+                        # last_seen is stored as 'YYYY-MM-DD HH:MM:SS' (UTC from CURRENT_TIMESTAMP)
+                        last_seen_timestamp_iso = utc_db_timestamp_to_iso(user_details_for_event['last_seen'])
                     except Exception as e_ts_conv:
                         app.logger.error(f"Error converting last_seen for disconnect event (user {user_id_for_disconnect}): {e_ts_conv}")
                         last_seen_timestamp_iso = datetime.now(timezone.utc).isoformat() # Fallback
@@ -11560,6 +12587,12 @@ if __name__ == '__main__':
         else:
             app.logger.info(f"Database file already exists at {db_path}. Skipping schema initialization.")
 
+        if os.path.exists(db_path):
+            try:
+                schema_migrations.run_migrations(db_path, log=app.logger.info)
+            except Exception as e:
+                app.logger.error(f"An error occurred while applying schema migrations: {e}")
+
         if os.path.exists(db_path):
             with app.app_context(): # Create an app context for get_db()
                  temp_conn_main = None
@@ -0,0 +1,107 @@
+# benchmarks/bench_file_denies.py
+"""
+/api/documents for a user with thousands of file_permissions deny rows: the old query shape
+(LEFT JOIN file_permissions fp for visibility in both the COUNT and the page, plus fp_dl for
+is_downloadable) versus the current one (the user's FileDenies passed as JSON id arrays).
+
+The "after" numbers are for a warm deny set, as on every request after the first until the
+permission tables change; the cold cost of reading and resolving it is reported separately.
+
+    python benchmarks/bench_file_denies.py [--documents 20000] [--hidden 3000] [--undownloadable 1000]
+"""
+import os
+import sys
+
+# app.py monkey patches eventlet on import, which has to happen before anything else loads.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module # FileDenies and EFFECTIVE_PERMISSIONS_SQL live in app.py
+
+import argparse
+import tempfile
+
+from common import best_of, migrated_database, report, seed_catalog
+
+import database
+
+PAGE_SIZE = 10
+
+OLD_COUNT_SQL = """
+    SELECT COUNT(d.id) FROM documents d
+    LEFT JOIN file_permissions fp ON d.id = fp.file_id AND fp.file_type = 'document' AND fp.user_id = ?
+    WHERE (fp.id IS NULL OR fp.can_view = 1)
+"""
+
+OLD_PAGE_SQL = f"""
+    SELECT d.id, d.doc_name, (CASE WHEN fp_dl.id IS NULL THEN 1 WHEN fp_dl.can_download = 0 THEN 0 ELSE 1 END) AS is_downloadable
+    FROM documents d
+    LEFT JOIN file_permissions fp ON d.id = fp.file_id AND fp.file_type = 'document' AND fp.user_id = ?
+    LEFT JOIN file_permissions fp_dl ON d.id = fp_dl.file_id AND fp_dl.file_type = 'document' AND fp_dl.user_id = ?
+    WHERE (fp.id IS NULL OR fp.can_view = 1)
+    ORDER BY d.doc_name ASC LIMIT {PAGE_SIZE} OFFSET ?
+"""
+
+def new_queries(denies):
+    """(count_sql, count_params, page_sql, page_params) as get_all_documents_api builds them."""
+    view_sql, view_params = denies.view_condition('document', 'd.id')
+    downloadable_sql, downloadable_params = denies.downloadable_column('document', 'd.id')
+    count_sql = f"SELECT COUNT(d.id) FROM documents d WHERE {view_sql}"
+    page_sql = (f"SELECT d.id, d.doc_name, {downloadable_sql} AS is_downloadable FROM documents d "
+                f"WHERE {view_sql} ORDER BY d.doc_name ASC LIMIT {PAGE_SIZE} OFFSET ?")
+    return count_sql, view_params, page_sql, downloadable_params + view_params
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--hidden', type=int, default=3000)
+    parser.add_argument('--undownloadable', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = migrated_database(os.path.join(tmp, 'bench.db'))
+        user_id = seed_catalog(path, documents=args.documents)
+        conn = database.get_db_connection(path)
+        hidden = range(1, args.hidden + 1)
+        undownloadable = range(args.hidden + 1, args.hidden + args.undownloadable + 1)
+        conn.executemany(
+            "INSERT INTO file_permissions (user_id, file_type, file_id, can_view, can_download) VALUES (?, 'document', ?, ?, ?)",
+            [(user_id, file_id, 0, 0) for file_id in hidden] + [(user_id, file_id, 1, 0) for file_id in undownloadable]
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+
+        def load_denies():
+            rows = conn.execute(app_module.EFFECTIVE_PERMISSIONS_SQL, (user_id, user_id, user_id)).fetchall()
+            return app_module.FileDenies(app_module.resolve_file_permissions(rows))
+
+        denies = load_denies()
+        count_sql, count_params, page_sql, page_params = new_queries(denies)
+        last_offset = (args.documents - args.hidden) // PAGE_SIZE * PAGE_SIZE
+
+        old_count = conn.execute(OLD_COUNT_SQL, (user_id,)).fetchone()[0]
+        new_count = conn.execute(count_sql, count_params).fetchone()[0]
+        assert old_count == new_count == args.documents - args.hidden, (old_count, new_count)
+        for offset in (0, last_offset):
+            old_page = conn.execute(OLD_PAGE_SQL, (user_id, user_id, offset)).fetchall()
+            new_page = conn.execute(page_sql, page_params + [offset]).fetchall()
+            assert old_page == new_page, offset
+
+        results = [
+            ("COUNT of visible documents",
+             best_of(lambda: conn.execute(OLD_COUNT_SQL, (user_id,)).fetchone()),
+             best_of(lambda: conn.execute(count_sql, count_params).fetchone())),
+            ("first page",
+             best_of(lambda: conn.execute(OLD_PAGE_SQL, (user_id, user_id, 0)).fetchall()),
+             best_of(lambda: conn.execute(page_sql, page_params + [0]).fetchall())),
+            ("last page",
+             best_of(lambda: conn.execute(OLD_PAGE_SQL, (user_id, user_id, last_offset)).fetchall()),
+             best_of(lambda: conn.execute(page_sql, page_params + [last_offset]).fetchall())),
+        ]
+        cold_ms = best_of(load_denies)
+        conn.close()
+
+    report(f"file_permissions JOIN -> JSON deny lists ({args.documents} documents, "
+           f"{args.hidden} hidden, {args.undownloadable} not downloadable)", results)
+    print(f"  {'cold deny set (read and resolve)':<40} {cold_ms:10.2f} ms, once per permission change")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_indexes.py
+"""
+The comment, notification and chat queries with the single-column indexes schema.sql had
+before migration 0001 and with the composite/partial ones it created instead.
+
+One database is seeded with --rows comments, notifications and messages (1M each by
+default), then each query is timed with the old indexes and again after swapping in
+migration 0001's. The swap itself (CREATE INDEX through the same statements the migration
+runs, plus ANALYZE) is timed as well. Queries are the application's own functions in
+database.py, for a hot item, user and conversation:
+
+- comment page: get_comments_for_item(), the top-level COUNT plus a page with its replies
+- unread / notification page / unread count: get_unread_notifications(),
+  get_all_notifications(page=5) and count_unread_notifications()
+- chat page / unread messages: get_messages(offset=200) and get_total_unread_messages()
+
+    python benchmarks/bench_indexes.py [--rows 1000000]
+"""
+import os
+import sys
+
+# app.py monkey patches eventlet on import, which has to happen before anything else loads.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module # get_messages() decrypts with the app's ENCRYPTION_KEY
+
+import argparse
+import sqlite3
+import tempfile
+import time
+
+from common import best_of, migrated_database, report
+
+import database
+import schema_migrations
+
+USERS = 1000
+ITEMS = 10000 # Commented documents
+CONVERSATIONS = 1000
+
+# What migration 0001 dropped: the indexes its composite ones extend as a prefix.
+OLD_INDEXES = [
+    "CREATE INDEX idx_comments_item_id_item_type ON comments (item_id, item_type)",
+    "CREATE INDEX idx_notifications_user_id ON notifications (user_id)",
+    "CREATE INDEX idx_messages_recipient_id ON messages (recipient_id)",
+]
+
+def migration_indexes() -> list:
+    """The CreateIndex steps of migration 0001."""
+    migration = next(m for m in schema_migrations.load_migrations() if m.version == 1)
+    return [step for step in migration.steps if isinstance(step, schema_migrations.CreateIndex)]
+
+def create_index_sql(step) -> str:
+    sql = f"CREATE INDEX {step.name} ON {step.table} ({', '.join(step.columns)})"
+    return sql + (f" WHERE {step.where}" if step.where else "")
+
+def seed(conn, rows: int):
+    conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, 'x')", ((f"user{i}",) for i in range(USERS)))
+    conn.executemany(
+        "INSERT INTO conversations (user1_id, user2_id) VALUES (?, ?)",
+        ((1 + i % (USERS - 1), 1 + i % (USERS - 1) + 1 + i // (USERS - 1)) for i in range(CONVERSATIONS))
+    )
+    conversations = conn.execute("SELECT id, user1_id, user2_id FROM conversations ORDER BY id").fetchall()
+    # One in five comments is a reply to the comment before it.
+    conn.executemany(
+        "INSERT INTO comments (content, user_id, item_id, item_type, parent_comment_id, created_at) "
+        "VALUES (?, ?, ?, 'document', ?, datetime('2024-01-01', ?))",
+        ((f"Comment {i}", 1 + i % USERS, 1 + (i // 5) % ITEMS, i if i % 5 == 4 else None, f"+{i} seconds") for i in range(rows))
+    )
+    # One in ten notifications is unread.
+    conn.executemany(
+        "INSERT INTO notifications (user_id, type, message, is_read, created_at) VALUES (?, 'new_content', ?, ?, datetime('2024-01-01', ?))",
+        ((1 + i % USERS, f"Notification {i}", i % 10 != 0, f"+{i} seconds") for i in range(rows))
+    )
+    # One in twenty messages is unread. All share one ciphertext; decrypting it is part of a page.
+    content = database.encrypt_message("Message")
+    def messages():
+        for i in range(rows):
+            conversation_id, user1_id, user2_id = conversations[i % CONVERSATIONS]
+            sender_id, recipient_id = (user1_id, user2_id) if i % 2 else (user2_id, user1_id)
+            yield conversation_id, sender_id, recipient_id, content, f"+{i} seconds", i % 20 != 0
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, sender_id, recipient_id, content, created_at, is_read) "
+        "VALUES (?, ?, ?, ?, datetime('2024-01-01', ?), ?)",
+        messages()
+    )
+    conn.commit()
+
+def queries(conn):
+    user_id, conversation_id, item_id = 1, 1, 1
+    return [
+        ("comment page", lambda: database.get_comments_for_item(conn, item_id, 'document')),
+        ("unread notifications", lambda: database.get_unread_notifications(conn, user_id, limit=10)),
+        ("notification page 5", lambda: database.get_all_notifications(conn, user_id, page=5, per_page=20)),
+        ("unread notification count", lambda: database.count_unread_notifications(conn, user_id)),
+        ("chat page (offset 200)", lambda: database.get_messages(conn, conversation_id, limit=50, offset=200)),
+        ("unread messages", lambda: database.get_total_unread_messages(conn, user_id)),
+    ]
+
+def swap_indexes(conn, drop: list, create: list) -> float:
+    start = time.perf_counter()
+    for name in drop:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for sql in create:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    new_indexes = migration_indexes()
+    with tempfile.TemporaryDirectory() as tmp, app_module.app.app_context():
+        path = migrated_database(os.path.join(tmp, 'bench.db'))
+        conn = database.get_db_connection(path)
+        conn.row_factory = sqlite3.Row
+        swap_indexes(conn, [step.name for step in new_indexes], OLD_INDEXES) # Back to the pre-0001 schema
+        seed(conn, args.rows)
+        swap_indexes(conn, [], []) # ANALYZE the seeded tables
+
+        before = {label: best_of(fn) for label, fn in queries(conn)}
+        build_ms = swap_indexes(conn, [sql.split()[2] for sql in OLD_INDEXES], [create_index_sql(step) for step in new_indexes])
+        after = {label: best_of(fn) for label, fn in queries(conn)}
+        conn.close()
+
+    report(f"Migration 0001 indexes ({args.rows:,} comments, notifications and messages)",
+           [(label, before[label], after[label]) for label in before])
+    print(f"  {'building the 0001 indexes + ANALYZE':<40} {build_ms:10.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_timestamps.py
+"""
+Timestamp conversion on audit log pages: the old convert_timestamps_to_ist_iso (strptime +
+IST.localize per value) versus the current one (memoized ist_db_timestamp_to_iso), with a
+cold cache (first render of a page) and a warm one (the same page again).
+
+Rows come from the /api/admin/audit-logs SELECT on a seeded database, one timestamp a few
+seconds apart per row, so most values are distinct.
+
+    python benchmarks/bench_timestamps.py [--rows 10000]
+"""
+import os
+import sys
+
+# app.py monkey patches eventlet on import, which has to happen before anything else loads.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module # The converters live in app.py
+
+import argparse
+from datetime import datetime
+import tempfile
+
+from common import best_of, migrated_database, report, seed_catalog
+
+import database
+
+AUDIT_LOG_PAGE_SQL = "SELECT id, user_id, username, action_type, target_table, target_id, details, timestamp FROM audit_logs ORDER BY timestamp DESC LIMIT ?"
+
+def convert_with_strptime(row_dict, timestamp_keys):
+    """convert_timestamps_to_ist_iso before memoization (error logging left out)."""
+    for key in timestamp_keys:
+        value = row_dict.get(key)
+        if isinstance(value, str) and value:
+            try:
+                naive_dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+            except ValueError:
+                naive_dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+            row_dict[key] = app_module.IST.localize(naive_dt).isoformat()
+    return row_dict
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = migrated_database(os.path.join(tmp, 'bench.db'))
+        seed_catalog(path, audit_logs=args.rows)
+        conn = database.get_db_connection(path)
+        page = database.fetch_dicts(conn.execute(AUDIT_LOG_PAGE_SQL, (args.rows,)))
+        conn.close()
+
+    def old_page():
+        for row in page:
+            convert_with_strptime(dict(row), ['timestamp'])
+
+    def new_page():
+        for row in page:
+            app_module.convert_timestamps_to_ist_iso(dict(row), ['timestamp'])
+
+    for row in page[:100]:
+        assert convert_with_strptime(dict(row), ['timestamp']) == app_module.convert_timestamps_to_ist_iso(dict(row), ['timestamp'])
+
+    old_ms = best_of(old_page)
+    cold_ms = best_of(new_page, setup=app_module.ist_db_timestamp_to_iso.cache_clear)
+    warm_ms = best_of(new_page)
+    report(f"Audit log page of {len(page)} rows: strptime -> memoized conversion", [
+        ("cold cache", old_ms, cold_ms),
+        ("warm cache", old_ms, warm_ms),
+    ])
+
+if __name__ == '__main__':
+    main()
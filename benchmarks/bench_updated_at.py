@@ -0,0 +1,94 @@
+# benchmarks/bench_updated_at.py
+"""
+Bulk UPDATE throughput with and without the AFTER UPDATE updated_at triggers that
+migration 0003 dropped.
+
+Both databases run the application's own statements, which set updated_at themselves:
+database.mark_all_notifications_as_read() and the per-item UPDATE of /api/bulk/move. The
+"before" database additionally has the old triggers, which wrote every updated row a
+second time. Reports the time and the WAL bytes each bulk update produces.
+
+    python benchmarks/bench_updated_at.py [--rows 20000]
+"""
+import argparse
+import os
+import tempfile
+
+from common import best_of, migrated_database, report
+
+import database
+
+OLD_TRIGGERS = [
+    """CREATE TRIGGER update_notifications_updated_at
+       AFTER UPDATE ON notifications FOR EACH ROW BEGIN
+           UPDATE notifications SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
+       END""",
+    """CREATE TRIGGER update_documents_updated_at
+       AFTER UPDATE ON documents FOR EACH ROW BEGIN
+           UPDATE documents SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
+       END""",
+]
+
+MOVE_SQL = "UPDATE documents SET software_id = ?, updated_by_user_id = ?, updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = ?"
+
+def build(path: str, rows: int, with_triggers: bool):
+    migrated_database(path)
+    conn = database.get_db_connection(path)
+    user_id = conn.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')").lastrowid
+    conn.executemany(
+        "INSERT INTO notifications (user_id, type, message) VALUES (?, 'new_content', ?)",
+        [(user_id, f"Notification {i}") for i in range(rows)]
+    )
+    conn.executemany(
+        "INSERT INTO documents (software_id, doc_name, download_link, created_by_user_id) VALUES (1, ?, 'https://example.com', ?)",
+        [(f"Document {i}", user_id) for i in range(rows)]
+    )
+    for trigger in OLD_TRIGGERS if with_triggers else ():
+        conn.execute(trigger)
+    conn.commit()
+    conn.execute("PRAGMA wal_autocheckpoint = 0") # Let the WAL grow so its size can be read
+    return conn, user_id
+
+def wal_bytes(conn, path: str, fn) -> int:
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    fn()
+    return os.path.getsize(path + '-wal')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    results, wal = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = {}
+        for with_triggers in (True, False):
+            path = os.path.join(tmp, f"bench_{with_triggers}.db")
+            conn, user_id = build(path, args.rows, with_triggers)
+            ids = [(2 + i % 3, user_id, i + 1) for i in range(args.rows)]
+
+            def reset_unread():
+                conn.execute("UPDATE notifications SET is_read = FALSE")
+                conn.commit()
+
+            def mark_all_read():
+                database.mark_all_notifications_as_read(conn, user_id)
+
+            def bulk_move():
+                conn.executemany(MOVE_SQL, ids)
+                conn.commit()
+
+            timings[with_triggers] = (best_of(mark_all_read, setup=reset_unread), best_of(bulk_move))
+            reset_unread()
+            wal[with_triggers] = (wal_bytes(conn, path, mark_all_read), wal_bytes(conn, path, bulk_move))
+            conn.close()
+        results.append((f"mark_all_notifications_as_read ({args.rows} rows)", timings[True][0], timings[False][0]))
+        results.append((f"bulk move ({args.rows} documents)", timings[True][1], timings[False][1]))
+
+    report("updated_at: AFTER UPDATE trigger -> explicit column (time)", results)
+    print("WAL bytes written")
+    for label, index in (("mark_all_notifications_as_read", 0), ("bulk move", 1)):
+        print(f"  {label:<40} {wal[True][index]:>12,} -> {wal[False][index]:>12,}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/common.py
+"""Shared setup for the scripts in benchmarks/ (run them from the repository root)."""
+from contextlib import redirect_stdout
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import schema_migrations
+
+def migrated_database(path: str) -> str:
+    """Creates a database at `path` from schema.sql plus every migration, like 'flask init-db'."""
+    database.remove_database_files(path)
+    with redirect_stdout(io.StringIO()): # init_db() narrates every step
+        database.init_db(path)
+    schema_migrations.run_migrations(path, log=lambda message: None)
+    return path
+
+def best_of(fn, repeat: int = 5, setup=None) -> float:
+    """Fastest of `repeat` runs of fn(), in milliseconds. setup() runs untimed before each."""
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def report(title: str, rows: list):
+    """Prints (label, before_ms, after_ms) rows with the speedup."""
+    print(title)
+    for label, before, after in rows:
+        print(f"  {label:<40} {before:10.2f} ms -> {after:10.2f} ms  ({before / after:5.1f}x)")
+
+def seed_catalog(path: str, documents: int = 0, patches: int = 0, audit_logs: int = 0) -> int:
+    """Fills a migrated database with listing-shaped rows; returns the uploader's user id."""
+    conn = database.get_db_connection(path)
+    try:
+        user_id = conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('bench', 'x', 'admin')").lastrowid
+        version_id = conn.execute("INSERT INTO versions (software_id, version_number) VALUES (2, '1.0')").lastrowid
+        conn.executemany(
+            "INSERT INTO documents (software_id, doc_name, description, doc_type, download_link, file_size, file_type, created_by_user_id, updated_by_user_id) "
+            "VALUES (1 + ? % 5, ?, ?, 'Manual', ?, ?, 'pdf', ?, ?)",
+            [(i, f"Document {i}", f"Description of document {i}", f"https://example.com/d/{i}", 1000 + i, user_id, user_id)
+             for i in range(documents)]
+        )
+        conn.executemany(
+            "INSERT INTO patches (version_id, patch_name, description, release_date, download_link, patch_by_developer, created_by_user_id, updated_by_user_id, "
+            "created_at, updated_at) VALUES (?, ?, ?, date('2024-01-01', ?), ?, 'dev', ?, ?, datetime('2024-01-01', ?), datetime('2024-01-01', ?))",
+            [(version_id, f"Patch {i}", f"Description of patch {i}", f"+{i % 365} days", f"https://example.com/p/{i}", user_id, user_id,
+              f"+{i} minutes", f"+{i} minutes") for i in range(patches)]
+        )
+        conn.executemany(
+            "INSERT INTO audit_logs (user_id, username, action_type, target_table, target_id, details, timestamp) "
+            "VALUES (?, 'bench', 'UPDATE_DOCUMENT', 'documents', ?, '{}', datetime('2024-01-01', ?))",
+            [(user_id, i, f"+{i * 7} seconds") for i in range(audit_logs)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return user_id
@@ -1,11 +1,19 @@
 # database.py
 import sqlite3
+import json
 import os
 from flask import current_app # For accessing app.config for encryption key
 from encryption_utils import encrypt_message, decrypt_message # For message encryption/decryption
 import sys # Added for PyInstaller path handling
+import re
+from pathlib import Path
+import queue # Idle connection storage for ConnectionPool
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import Future
 import pytz
-from datetime import datetime, timezone # ensure timezone is imported if needed
+from datetime import datetime, timedelta, timezone # ensure timezone is imported if needed
 
 IST = pytz.timezone('Asia/Kolkata')
 
@@ -13,16 +21,713 @@ IST = pytz.timezone('Asia/Kolkata')
 # BASE_DIR might still be needed for locating schema.sql relative to this file.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# --- Connection Settings & Pooling ---
+# PRAGMAs applied to every connection we hand out. journal_mode=WAL is persistent in the
+# database file, the rest are per-connection and must be re-applied on each connect.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),      # Readers no longer block on a writer (and vice versa)
+    ("synchronous", "NORMAL"),    # Safe with WAL; fsync only at checkpoints
+    ("busy_timeout", 5000),       # ms to wait for the write lock before SQLITE_BUSY
+    ("cache_size", -16000),       # Negative = KiB, i.e. ~16 MB page cache per connection
+    ("mmap_size", 268435456),     # 256 MB memory-mapped I/O for reads
+    ("temp_store", "MEMORY"),     # Sorts/temp b-trees for ORDER BY/GROUP BY stay in RAM
+)
+# Read-only connections can't change the journal mode, and additionally refuse any write
+# at the SQLite level even if a statement slips through.
+READONLY_PRAGMAS = tuple(p for p in SQLITE_PRAGMAS if p[0] != "journal_mode") + (("query_only", "ON"),)
+# Size of sqlite3's per-connection prepared statement cache (the module default is 128).
+# Listing endpoints build a handful of SQL shapes per filter combination, so a larger
+# cache lets pooled connections skip re-preparing them across requests.
+STATEMENT_CACHE_SIZE = 256
+
+class QueryStats:
+    """
+    Per-request tally of the statements run on a connection: count, total time and the
+    slowest few. Time is measured around execute(), i.e. it includes preparing the
+    statement and stepping to the first row, but not fetching the remaining rows.
+    """
+
+    def __init__(self, keep_slowest: int = 5, label: str = None, slow_query_log=None):
+        self.label = label # e.g. "GET /api/documents", used by the slow query log
+        self.slow_query_log = slow_query_log
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep_slowest = keep_slowest
+        self.slowest = [] # (duration_ms, sql), slowest first
+        self.statement_counts = Counter()
+
+    def record(self, sql: str, duration_ms: float):
+        sql = " ".join(sql.split())
+        self.count += 1
+        self.total_ms += duration_ms
+        self.statement_counts[sql] += 1
+        if len(self.slowest) < self.keep_slowest or duration_ms > self.slowest[-1][0]:
+            self.slowest.append((duration_ms, sql))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep_slowest:]
+
+    def repeated_statements(self, threshold: int) -> list:
+        """Statements executed at least `threshold` times, the usual sign of an N+1 loop."""
+        return [(sql, n) for sql, n in self.statement_counts.most_common() if n >= threshold]
+
+class SlowQueryLog:
+    """
+    Process-wide record of statements slower than threshold_ms, aggregated by normalized SQL
+    (whitespace collapsed, literals replaced with ?), so the same f-string-built listing query
+    with different filter values lands in one entry. Parameters are never stored, only their
+    types and sizes. The EXPLAIN QUERY PLAN of the slowest execution is kept with each entry.
+    """
+
+    _LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _NO_PLAN_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'EXPLAIN')
+
+    def __init__(self, threshold_ms: float = 100, max_entries: int = 200, log=print):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self.log = log
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, sql: str) -> str:
+        return cls._LITERAL_RE.sub('?', " ".join(sql.split()))
+
+    @staticmethod
+    def redact(parameters) -> list:
+        if isinstance(parameters, dict):
+            return {key: SlowQueryLog.redact([value])[0] for key, value in parameters.items()}
+        redacted = []
+        for value in parameters or ():
+            if isinstance(value, (str, bytes)):
+                redacted.append(f"<{type(value).__name__}:{len(value)}>")
+            else:
+                redacted.append(f"<{type(value).__name__}>")
+        return redacted
+
+    def record(self, conn, sql: str, parameters, duration_ms: float, label: str = None, many: bool = False):
+        key = self.normalize(sql)
+        redacted = None if many else self.redact(parameters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    return
+                entry = self._entries[key] = {
+                    'sql': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'last_seen': None, 'label': None, 'sample_params': None, 'plan': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['last_seen'] = datetime.now(IST).isoformat()
+            is_new_max = duration_ms > entry['max_ms']
+            if is_new_max:
+                entry['max_ms'] = duration_ms
+                entry['label'] = label
+                entry['sample_params'] = redacted
+        plan = None
+        if is_new_max and not many and not key.upper().startswith(self._NO_PLAN_PREFIXES):
+            plan = self._explain(conn, sql, parameters)
+            with self._lock:
+                entry['plan'] = plan
+        self.log(f"SLOW_QUERY: {duration_ms:.1f} ms [{label or '-'}] {key[:500]} params={redacted} plan={plan}")
+
+    @staticmethod
+    def _explain(conn, sql, parameters):
+        try:
+            # Bypass PooledConnection.execute so the EXPLAIN itself isn't instrumented.
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+            return [row[3] for row in rows]
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def entries(self) -> list:
+        """Snapshot of all entries, most total time first."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        for entry in entries:
+            entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 2)
+            entry['total_ms'] = round(entry['total_ms'], 2)
+            entry['max_ms'] = round(entry['max_ms'], 2)
+        return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# --- Table Versions ---
+# Process-wide change counters per table, used to tell whether a cached query result (a
+# listing total, a response) is still current. Pooled connections attribute every
+# INSERT/UPDATE/DELETE to its target table and bump those tables once the write is
+# committed, whether via commit(), a COMMIT statement or autocommit. Tables changed through
+# ON DELETE/UPDATE foreign key actions are bumped along with their parent. Over-counting
+# (e.g. a write that was later rolled back) only costs a cache miss.
+_WRITE_STATEMENT_RE = re.compile(
+    r"\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE
+)
+
+def write_target_table(sql: str):
+    """Returns the (lower-cased) table an INSERT/UPDATE/DELETE writes to, else None."""
+    match = _WRITE_STATEMENT_RE.match(sql)
+    return match.group(1).lower() if match else None
+
+class TableVersions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._epoch = 0 # Bumped when the whole database is replaced (restore/reset/init)
+        self._dependents = None # table -> tables changed by its foreign key actions
+        # Versions restart at 0 with the process; anything derived from them that outlives it
+        # (HTTP ETags) includes this as well.
+        self.instance_id = os.urandom(8).hex()
+
+    def snapshot(self, tables) -> tuple:
+        """Current versions of `tables`; compare snapshots to detect changes."""
+        versions = self._versions
+        return (self._epoch,) + tuple(versions.get(table, 0) for table in tables)
+
+    def bump(self, tables, conn=None):
+        if self._dependents is None and conn is not None:
+            self._dependents = self._load_dependents(conn)
+        dependents = self._dependents or {}
+        with self._lock:
+            for table in set(tables).union(*(dependents.get(t, ()) for t in tables)):
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def bump_all(self):
+        with self._lock:
+            self._epoch += 1
+            self._dependents = None
+
+    @staticmethod
+    def _load_dependents(conn) -> dict:
+        # child tables with ON DELETE/UPDATE CASCADE / SET NULL / SET DEFAULT, transitively
+        direct = {}
+        try:
+            tables = [row[0] for row in sqlite3.Connection.execute(conn, "SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for child in tables:
+                for fk in sqlite3.Connection.execute(conn, f'PRAGMA foreign_key_list("{child}")'):
+                    parent, on_update, on_delete = fk[2].lower(), fk[5], fk[6]
+                    if on_update != 'NO ACTION' or on_delete != 'NO ACTION':
+                        direct.setdefault(parent, set()).add(child.lower())
+        except sqlite3.Error as e:
+            print(f"DB_HELPER: Could not read foreign keys for table versioning: {e}")
+            return None
+        dependents = {}
+        for parent in direct:
+            seen, stack = set(), list(direct[parent])
+            while stack:
+                table = stack.pop()
+                if table not in seen:
+                    seen.add(table)
+                    stack.extend(direct.get(table, ()))
+            dependents[parent] = seen
+        return dependents
+
+table_versions = TableVersions()
+
+class VersionedCache:
+    """
+    Small LRU cache whose entries are only valid while the TableVersions snapshot they were
+    stored with is unchanged (and, as a backstop for writes made outside this process,
+    for at most `ttl` seconds). With max_bytes, the sizes passed to put() are bounded too.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300, max_bytes: int = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != versions or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, versions, value, size: int = 0):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[3]
+            self._entries[key] = (versions, time.monotonic() + self.ttl, value, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size_bytes > self.max_bytes):
+                self.size_bytes -= self._entries.popitem(last=False)[1][3]
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= entry[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports to its connection's query_stats, when one is attached."""
+
+    def execute(self, sql, parameters=()):
+        stats = self.connection.query_stats
+        if stats is None:
+            super().execute(sql, parameters)
+            self.connection.note_statement(sql)
+            return self
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._record(stats, sql, parameters, (time.perf_counter() - start) * 1000, many=False)
+        self.connection.note_statement(sql)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = self.connection.query_stats
+        if stats is None:
+            super().executemany(sql, seq_of_parameters)
+            self.connection.note_statement(sql)
+            return self
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(stats, sql, None, (time.perf_counter() - start) * 1000, many=True)
+        self.connection.note_statement(sql)
+        return self
+
+    def _record(self, stats, sql, parameters, duration_ms, many):
+        stats.record(sql, duration_ms)
+        slow_log = stats.slow_query_log
+        if slow_log is not None and duration_ms >= slow_log.threshold_ms:
+            slow_log.record(self.connection, sql, parameters, duration_ms, label=stats.label, many=many)
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection subclass so connections can remember their file and pool.
+    Attaching a QueryStats as `query_stats` makes every execute() on it get recorded.
+    """
+    db_path = None
+    pool = None
+    pool_generation = 0
+    query_stats = None
+    pending_write_tables = None # Tables written in the open transaction (see TableVersions)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if self.query_stats is None:
+            cursor = super().execute(sql, parameters)
+            self.note_statement(sql)
+            return cursor
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.query_stats is None:
+            cursor = super().executemany(sql, seq_of_parameters)
+            self.note_statement(sql)
+            return cursor
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        cursor = super().executescript(sql_script)
+        table_versions.bump_all() # Schema scripts (init_db) may rewrite anything
+        return cursor
+
+    def note_statement(self, sql):
+        """Records a write's target table; bumps table versions once nothing is left uncommitted."""
+        table = write_target_table(sql)
+        if table is not None:
+            if self.pending_write_tables is None:
+                self.pending_write_tables = set()
+            self.pending_write_tables.add(table)
+        if self.pending_write_tables and not self.in_transaction:
+            self._flush_write_tables()
+
+    def commit(self):
+        super().commit()
+        if self.pending_write_tables:
+            self._flush_write_tables()
+
+    def rollback(self):
+        super().rollback()
+        if self.pending_write_tables:
+            self._flush_write_tables()
+
+    def _flush_write_tables(self):
+        tables, self.pending_write_tables = self.pending_write_tables, None
+        table_versions.bump(tables, self)
+
+def configure_connection(conn, pragmas=SQLITE_PRAGMAS):
+    """Applies SQLITE_PRAGMAS (or the given pragmas) to a freshly opened connection."""
+    for pragma, value in pragmas:
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
 def get_db_connection(db_path: str):
     """Creates a database connection to the specified database path."""
     # print(f"DB_HELPER: Connecting to database at: {db_path}") # Optional: for debugging
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA busy_timeout = 5000")
+    # check_same_thread=False: pooled connections may be returned by one greenthread/thread
+    # and borrowed by another. A connection is only ever used by one borrower at a time.
+    conn = sqlite3.connect(db_path, factory=PooledConnection, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.db_path = db_path
+    configure_connection(conn)
     # conn.row_factory = sqlite3.Row # This is good, but often set in app.py's get_db for g.db
                                     # If you set it here, ensure it doesn't conflict or is consistently used.
                                     # For simplicity, let app.py handle row_factory on g.db
     return conn
 
+def get_readonly_db_connection(db_path: str):
+    """
+    Opens a read-only connection (file:...?mode=ro, query_only=ON) to db_path.
+    Under WAL these never take the write lock, so long scans can't hold up writers.
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, factory=PooledConnection, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    # Keep the plain path: execute_write() uses it to find the writer for this database.
+    conn.db_path = db_path
+    configure_connection(conn, READONLY_PRAGMAS)
+    return conn
+
+class ConnectionPool:
+    """
+    A small pool of preconfigured SQLite connections for one database file.
+
+    acquire() never blocks: it reuses an idle connection if one is available and opens a
+    new one otherwise, so greenthreads can't deadlock waiting on each other. release()
+    keeps at most `max_idle` connections around for reuse and closes the rest.
+    dispose() closes idle connections and makes any borrowed ones close on release, which
+    is needed whenever the database file itself is replaced (restore/reset).
+    With readonly=True the pool hands out get_readonly_db_connection() connections.
+    """
+
+    def __init__(self, db_path: str, max_idle: int = 8, readonly: bool = False):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.readonly = readonly
+        self._idle = queue.LifoQueue(maxsize=max_idle) # LIFO keeps the warmest caches in use
+        self._generation = 0
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            if self.readonly:
+                conn = get_readonly_db_connection(self.db_path)
+            else:
+                conn = get_db_connection(self.db_path)
+            conn.pool = self
+            conn.pool_generation = self._generation
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                # Never hand an open (possibly half-written) transaction to the next borrower.
+                conn.rollback()
+            conn.row_factory = None
+            conn.query_stats = None
+            if conn.pool_generation != self._generation:
+                conn.close()
+                return
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"DB_POOL: Discarding connection after error on release: {e}")
+            conn.close()
+
+    def dispose(self):
+        self._generation += 1
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            except sqlite3.Error as e:
+                print(f"DB_POOL: Error closing idle connection during dispose: {e}")
+
+_pools = {}
+_writers = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str, max_idle: int = 8, readonly: bool = False) -> ConnectionPool:
+    """
+    Returns the process-wide ConnectionPool for db_path, creating it on first use.
+    Read-only and read-write connections live in separate pools.
+    """
+    key = (db_path, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(db_path, max_idle=max_idle, readonly=readonly)
+    return pool
+
+def fetch_dicts(cursor) -> list:
+    """
+    Fetches all remaining rows of an executed cursor as plain dicts, ready for jsonify().
+    Equivalent to [dict(row) for row in cursor.fetchall()], but the column names are read
+    once and rows come back as tuples, so no intermediate sqlite3.Row objects are built.
+    """
+    cursor.row_factory = None
+    keys = [column[0] for column in cursor.description]
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+def release_db_connection(conn):
+    """Returns a pooled connection to its pool; plain connections are simply closed."""
+    pool = getattr(conn, 'pool', None)
+    if pool is not None:
+        pool.release(conn)
+    else:
+        conn.close()
+
+def dispose_pool(db_path: str):
+    """
+    Closes pooled connections and the writer's connection for db_path.
+    Call before the database file is replaced or deleted.
+    """
+    for readonly in (False, True):
+        pool = _pools.get((db_path, readonly))
+        if pool is not None:
+            pool.dispose()
+    writer = _writers.get(db_path)
+    if writer is not None:
+        writer.reset()
+    table_versions.bump_all()
+
+def backup_database(source_db_path: str, dest_path: str):
+    """
+    Copies a live database to dest_path using SQLite's online backup API.
+    Unlike a plain file copy this includes changes still sitting in the -wal file.
+    """
+    src = sqlite3.connect(source_db_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        src.execute("PRAGMA busy_timeout = 5000")
+        src.backup(dest)
+    finally:
+        dest.close()
+        src.close()
+
+def remove_database_files(db_path: str):
+    """Deletes the database file along with its -wal/-shm side files, if present."""
+    for suffix in ('', '-wal', '-shm'):
+        path = db_path + suffix
+        if os.path.exists(path):
+            os.remove(path)
+
+# --- Single-Writer Queue ---
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount'])
+
+class DatabaseWriter:
+    """
+    Owns the one connection used for queued writes and applies them from a single
+    background thread (a greenthread once eventlet has monkey-patched threading).
+
+    Callers submit a statement (or a callable taking the connection) and get back a
+    concurrent.futures.Future. Everything waiting in the queue when the writer wakes up
+    is applied in one BEGIN IMMEDIATE ... COMMIT, each operation inside its own SAVEPOINT
+    so a failing statement only fails its own future. Futures are resolved after COMMIT,
+    so a caller that waits on one can immediately read its row from another connection.
+    """
+
+    _STOP = object()
+    _RESET = object()
+
+    def __init__(self, db_path: str, max_batch: int = 200):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, fn) -> Future:
+        """Queues fn(conn); the future resolves to its return value."""
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def execute(self, sql: str, params=()) -> Future:
+        """Queues a single statement; the future resolves to a WriteResult."""
+        def _op(conn):
+            cursor = conn.execute(sql, params)
+            return WriteResult(cursor.lastrowid, cursor.rowcount)
+        return self.submit(_op)
+
+    def reset(self, timeout: float = 5.0):
+        """
+        Flushes queued writes and closes the write connection so the database file can be
+        replaced or deleted (Windows refuses to delete open files). The next write reopens it.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            future = Future()
+            self._queue.put((self._RESET, future))
+            future.result(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put((self._STOP, None))
+            self._thread.join(timeout)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = get_db_connection(self.db_path)
+            self._conn.isolation_level = None # We issue BEGIN/COMMIT/SAVEPOINT ourselves
+            self._conn.row_factory = sqlite3.Row
+        return self._conn
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch and batch[-1][0] not in (self._STOP, self._RESET):
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            control, control_future = batch[-1]
+            if control in (self._STOP, self._RESET):
+                batch.pop()
+            if batch:
+                self._apply_batch(batch)
+            if control is self._RESET:
+                self._close_connection()
+                control_future.set_result(None)
+            elif control is self._STOP:
+                self._close_connection()
+                return
+
+    def _apply_batch(self, batch):
+        results = []
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            print(f"DB_WRITER: Could not start write batch of {len(batch)} operations: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for fn, future in batch:
+            try:
+                conn.execute("SAVEPOINT write_op")
+                result = fn(conn)
+                conn.execute("RELEASE write_op")
+                results.append((future, result, None))
+            except Exception as e:
+                try:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                except sqlite3.Error:
+                    pass
+                results.append((future, None, e))
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"DB_WRITER: Commit of write batch failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for future, _, _ in results:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+def get_writer(db_path: str) -> DatabaseWriter:
+    """Returns the process-wide, started DatabaseWriter for db_path."""
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = _writers[db_path] = DatabaseWriter(db_path)
+    return writer.start()
+
+def execute_write(db, sql: str, params=(), wait: bool = False):
+    """
+    Runs a single INSERT/UPDATE/DELETE through the DatabaseWriter for db's database.
+
+    If `db` already has an open transaction (the caller has uncommitted writes), the
+    statement is executed and committed on `db` itself, as this code always did:
+    queuing it instead would leave the writer waiting on the caller's own write lock.
+    Returns a WriteResult when wait=True or when executed inline, otherwise None.
+    """
+    db_path = getattr(db, 'db_path', None)
+    if db_path is None or db.in_transaction:
+        cursor = db.execute(sql, params)
+        db.commit()
+        return WriteResult(cursor.lastrowid, cursor.rowcount)
+    future = get_writer(db_path).execute(sql, params)
+    if wait:
+        return future.result()
+    future.add_done_callback(_log_failed_write)
+    return None
+
+def _log_failed_write(future):
+    error = future.exception()
+    if error is not None:
+        print(f"DB_WRITER: Queued write failed: {error}")
+
+def stop_writers():
+    for writer in list(_writers.values()):
+        writer.stop()
+
+# Seed rows added by init_db() (and postgres_backend.init_db()) to an empty database.
+DEFAULT_SOFTWARE = ['ITMS', 'VMS', 'Analytic Manager', 'ICCC', 'VA']
+DEFAULT_SECURITY_QUESTIONS = [
+    "What was your first pet's name?",
+    "What city were you born in?",
+    "What is your mother's maiden name?",
+    "What was the name of your elementary school?",
+    "What is your favorite book?",
+    "What was the model of your first car?",
+]
+
 def init_db(db_path: str):
     """Initializes the database at the specified path using schema.sql."""
     print(f"DB_HELPER: Attempting to initialize database at: {db_path}")
@@ -70,9 +775,8 @@ def init_db(db_path: str):
         count_row = cursor.fetchone()
         if count_row is not None and count_row[0] == 0:
             print("DB_HELPER: Adding initial software entries...")
-            software_list = ['ITMS', 'VMS', 'Analytic Manager', 'ICCC', 'VA']
             # Use executemany with a list of tuples
-            cursor.executemany("INSERT INTO software (name) VALUES (?)", [(s,) for s in software_list])
+            cursor.executemany("INSERT INTO software (name) VALUES (?)", [(s,) for s in DEFAULT_SOFTWARE])
             conn.commit()
             print("DB_HELPER: Initial software added.")
         elif count_row is not None:
@@ -85,14 +789,7 @@ def init_db(db_path: str):
         count_row_questions = cursor.fetchone()
         if count_row_questions is not None and count_row_questions[0] == 0:
             print("DB_HELPER: Adding initial security questions...")
-            default_questions = [
-                ("What was your first pet's name?",),
-                ("What city were you born in?",),
-                ("What is your mother's maiden name?",),
-                ("What was the name of your elementary school?",),
-                ("What is your favorite book?",),
-                ("What was the model of your first car?",)
-            ]
+            default_questions = [(question,) for question in DEFAULT_SECURITY_QUESTIONS]
             cursor.executemany("INSERT INTO security_questions (question_text) VALUES (?)", default_questions)
             conn.commit()
             print(f"DB_HELPER: Added {len(default_questions)} initial security questions.")
@@ -122,6 +819,7 @@ def add_favorite(db, user_id, item_id, item_type):
             (user_id, item_id, item_type)
         )
         db.commit()
+        table_versions.bump([('user_favorites', user_id)]) # This user's favorites only (see get_favorites_fingerprint in app.py)
         return cursor.lastrowid
     except sqlite3.IntegrityError:
         # This typically means the (user_id, item_id, item_type) combination already exists,
@@ -142,6 +840,7 @@ def remove_favorite(db, user_id, item_id, item_type):
             (user_id, item_id, item_type)
         )
         db.commit()
+        table_versions.bump([('user_favorites', user_id)])
         return cursor.rowcount > 0  # True if a row was deleted
     except sqlite3.Error as e:
         print(f"DB_FAVORITES: Error removing favorite for user {user_id}, item {item_id}, type {item_type}: {e}")
@@ -159,6 +858,27 @@ def get_favorite_status(db, user_id, item_id, item_type) -> 'sqlite3.Row | None'
         print(f"DB_FAVORITES: Error fetching favorite status for user {user_id}, item {item_id}, type {item_type}: {e}")
         return None
 
+def get_favorite_statuses(db, user_id, items) -> dict:
+    """get_favorite_status() for many (item_type, item_id) pairs in one query: {(item_type, item_id): row}."""
+    ids_by_type = {}
+    for item_type, item_id in items:
+        ids_by_type.setdefault(item_type, []).append(int(item_id))
+    if not ids_by_type:
+        return {}
+    conditions, params = [], [user_id]
+    for item_type, item_ids in ids_by_type.items():
+        conditions.append("(item_type = ? AND item_id IN (SELECT value FROM json_each(?)))")
+        params += [item_type, json.dumps(item_ids)]
+    try:
+        cursor = db.execute(
+            f"SELECT id, user_id, item_id, item_type, created_at FROM user_favorites WHERE user_id = ? AND ({' OR '.join(conditions)})",
+            params
+        )
+        return {(row['item_type'], row['item_id']): row for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        print(f"DB_FAVORITES: Error fetching favorite statuses for user {user_id}: {e}")
+        return {}
+
 def get_user_favorites(db, user_id, page, per_page, item_type_filter=None):
     """Retrieves a paginated list of a user's favorited items with details."""
     offset = (page - 1) * per_page
@@ -379,10 +1099,193 @@ def add_default_watch_preferences(db, user_id: int):
     # print(f"DB_WATCH_PREFS: Added {added_count} default watch preferences for user {user_id}.")
     return added_count
 
+# --- VMS Compatibility Projection ---
+
+# Item type -> (table, compatibility table, its item column, SQL for the item's software id).
+VMS_COMPATIBILITY_TABLES = {
+    'patch': ('patches', 'patch_vms_compatibility', 'patch_id',
+              "(SELECT v.software_id FROM versions v WHERE v.id = patches.version_id)"),
+    'link': ('links', 'link_vms_compatibility', 'link_id', "links.software_id"),
+}
+
+def _vms_compatibility_update_sql(item_type, where_sql):
+    table, compat_table, item_column, software_id_sql = VMS_COMPATIBILITY_TABLES[item_type]
+    return f"""
+        UPDATE {table} SET compatible_vms_versions = CASE
+            WHEN (SELECT s.name FROM software s WHERE s.id = {software_id_sql}) IN ('VMS', 'VA') THEN (
+                SELECT GROUP_CONCAT(DISTINCT vms_v.version_number)
+                FROM {compat_table} c JOIN versions vms_v ON c.vms_version_id = vms_v.id
+                WHERE c.{item_column} = {table}.id)
+            ELSE NULL
+        END
+        WHERE {where_sql}"""
+
+def refresh_vms_compatibility(db, item_type, item_ids):
+    """
+    Recomputes the denormalized compatible_vms_versions column (migration 0007) of the given
+    patches or links from their compatibility rows, and logs them for /api/sync. Runs in the
+    caller's transaction: call it after changing an item's compatibility rows or its
+    version/software, before committing.
+    """
+    item_ids = [int(item_id) for item_id in item_ids if item_id is not None]
+    if item_ids:
+        db.execute(
+            _vms_compatibility_update_sql(item_type, "id IN (SELECT value FROM json_each(?))"),
+            (json.dumps(item_ids),)
+        )
+        record_item_changes(db, item_type, item_ids)
+
+def refresh_vms_compatibility_for_version(db, version_id):
+    """refresh_vms_compatibility() for every patch and link a changed or deleted version affects."""
+    affected = {
+        'patch': ("id IN (SELECT patch_id FROM patch_vms_compatibility WHERE vms_version_id = ?) OR version_id = ?",
+                  (version_id, version_id)),
+        'link': ("id IN (SELECT link_id FROM link_vms_compatibility WHERE vms_version_id = ?)", (version_id,)),
+    }
+    for item_type, (where_sql, params) in affected.items():
+        db.execute(_vms_compatibility_update_sql(item_type, where_sql), params)
+        db.execute(
+            f"INSERT INTO item_changes (item_type, item_id, change_type) "
+            f"SELECT ?, id, 'upsert' FROM {VMS_COMPATIBILITY_TABLES[item_type][0]} WHERE {where_sql}",
+            (item_type, *params)
+        )
+
+# --- Facet Counts ---
+
+# Item type -> (table, columns whose values are counted in facet_counts (migration 0008)).
+# Patches are counted per version; /api/facets rolls those up to software through the catalog,
+# so moving a version to another software doesn't touch the counts.
+FACET_DIMENSIONS = {
+    'document': ('documents', ('software_id', 'doc_type')),
+    'patch': ('patches', ('version_id',)),
+    'link': ('links', ('software_id', 'version_id')),
+    'misc_file': ('misc_files', ('misc_category_id',)),
+}
+FACET_ITEM_TYPES = {table: item_type for item_type, (table, _) in FACET_DIMENSIONS.items()}
+
+def _facet_group_sql(item_type, dimension):
+    # Values are stored as text ('' for NULL) so one table holds ids and doc types alike.
+    table = FACET_DIMENSIONS[item_type][0]
+    return (
+        f"SELECT COALESCE(CAST({dimension} AS TEXT), '') AS facet_value, COUNT(*) AS item_count "
+        f"FROM {table} WHERE id IN (SELECT value FROM json_each(?)) GROUP BY 1"
+    )
+
+def adjust_facet_counts(db, item_type, item_ids, delta):
+    """
+    Adds delta to the facet_counts of the given items' current values. Runs in the caller's
+    transaction: call it with 1 after inserting items, with -1 before deleting them, and
+    with -1 before / 1 after changing one of their counted columns.
+    """
+    item_ids = [int(item_id) for item_id in item_ids if item_id is not None]
+    if item_type not in FACET_DIMENSIONS or not item_ids:
+        return
+    ids_json = json.dumps(item_ids)
+    for dimension in FACET_DIMENSIONS[item_type][1]:
+        db.execute(
+            f"""
+            INSERT INTO facet_counts (item_type, dimension, facet_value, item_count)
+            SELECT ?, ?, g.facet_value, g.item_count * ? FROM ({_facet_group_sql(item_type, dimension)}) g
+            WHERE g.item_count > 0
+            ON CONFLICT (item_type, dimension, facet_value)
+            DO UPDATE SET item_count = facet_counts.item_count + excluded.item_count
+            """,
+            (item_type, dimension, delta, ids_json)
+        )
+
+def get_facet_counts(db) -> dict:
+    """{item_type: {dimension: {facet_value: count}}} for every non-zero facet_counts row."""
+    counts = {item_type: {dimension: {} for dimension in dimensions} for item_type, (_, dimensions) in FACET_DIMENSIONS.items()}
+    for row in db.execute("SELECT item_type, dimension, facet_value, item_count FROM facet_counts WHERE item_count > 0"):
+        dimensions = counts.get(row[0])
+        if dimensions is not None and row[1] in dimensions:
+            dimensions[row[1]][row[2]] = row[3]
+    return counts
+
+def count_facets_for_ids(db, item_type, ids_json) -> dict:
+    """{dimension: {facet_value: count}} over the items in ids_json (a JSON array of ids)."""
+    return {
+        dimension: {row[0]: row[1] for row in db.execute(_facet_group_sql(item_type, dimension), (ids_json,))}
+        for dimension in FACET_DIMENSIONS[item_type][1]
+    }
+
+# --- Item Change Log ---
+
+# Item type -> table, for the items /api/sync reports (migration 0009).
+ITEM_CHANGE_TABLES = {item_type: table for item_type, (table, _) in FACET_DIMENSIONS.items()}
+
+def record_item_changes(db, item_type, item_ids, change_type='upsert'):
+    """
+    Appends the given items to item_changes as 'upsert' (inserted, or any column /api/sync
+    returns changed) or 'delete'. Runs in the caller's transaction, so a change and its log
+    entry are committed together and the log id order is the commit order.
+    """
+    item_ids = [int(item_id) for item_id in item_ids if item_id is not None]
+    if item_type not in ITEM_CHANGE_TABLES or not item_ids:
+        return
+    db.executemany(
+        "INSERT INTO item_changes (item_type, item_id, change_type) VALUES (?, ?, ?)",
+        [(item_type, item_id, change_type) for item_id in item_ids]
+    )
+
+def item_change_id_range(db):
+    """(oldest, latest) item_changes id, (0, 0) while the log is empty."""
+    row = db.execute("SELECT MIN(id), MAX(id) FROM item_changes").fetchone()
+    return row[0] or 0, row[1] or 0
+
+def get_item_changes_since(db, since_id, limit):
+    """
+    Up to `limit` item_changes after since_id, collapsed to the latest change per item:
+    (last change id read, {item_type: {item_id: change_type}}, whether more remain).
+    """
+    rows = db.execute(
+        "SELECT id, item_type, item_id, change_type FROM item_changes WHERE id > ? ORDER BY id LIMIT ?",
+        (since_id, limit + 1)
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = {item_type: {} for item_type in ITEM_CHANGE_TABLES}
+    for row in rows:
+        if row[1] in changes:
+            changes[row[1]][row[2]] = row[3] # Later rows win
+    return (rows[-1][0] if rows else since_id), changes, has_more
+
+def prune_item_changes(db, retention_days: int) -> int:
+    """
+    Deletes item_changes older than retention_days. The newest entry is always kept: its id is
+    the current sync token, which must not fall back to 0.
+    """
+    # changed_at is IST text; the cutoff is computed here so the statement also runs on PostgreSQL.
+    cutoff = (datetime.now(IST) - timedelta(days=int(retention_days))).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = db.execute(
+        "DELETE FROM item_changes WHERE changed_at < ? AND id < (SELECT MAX(id) FROM item_changes)",
+        (cutoff,)
+    )
+    return cursor.rowcount
+
 # --- Comment Management Functions ---
 
+# Item types whose table has a denormalized top_level_comment_count (migration 0005).
+COMMENT_COUNT_TABLES = {
+    'document': 'documents',
+    'patch': 'patches',
+    'link': 'links',
+    'misc_file': 'misc_files',
+}
+
+def _adjust_top_level_comment_count(db, item_type, item_id, delta):
+    table = COMMENT_COUNT_TABLES.get(item_type)
+    if table is not None:
+        db.execute(
+            # CASE rather than SQLite's two-argument MAX(), which PostgreSQL doesn't have.
+            f"UPDATE {table} SET top_level_comment_count = CASE WHEN top_level_comment_count + ? < 0 THEN 0 "
+            f"ELSE top_level_comment_count + ? END WHERE id = ?",
+            (delta, delta, item_id)
+        )
+        record_item_changes(db, item_type, [item_id])
+
 def add_comment(db, user_id, item_id, item_type, content, parent_comment_id=None):
-    """Inserts a new comment into the comments table."""
+    """Inserts a new comment into the comments table (and counts it on the item if top-level)."""
     try:
         cursor = db.execute(
             """
@@ -391,9 +1294,12 @@ def add_comment(db, user_id, item_id, item_type, content, parent_comment_id=None
             """,
             (user_id, item_id, item_type, content, parent_comment_id)
         )
+        if parent_comment_id is None:
+            _adjust_top_level_comment_count(db, item_type, item_id, 1)
         db.commit()
         return cursor.lastrowid
     except sqlite3.Error as e:
+        db.rollback()
         print(f"DB_COMMENTS: Error adding comment for item {item_id} ({item_type}) by user {user_id}: {e}")
         return None
 
@@ -553,7 +1459,7 @@ def delete_comment_by_id(db, comment_id, user_id, role):
     """
     try:
         # Verify ownership or admin role
-        comment_owner_cursor = db.execute("SELECT user_id FROM comments WHERE id = ?", (comment_id,))
+        comment_owner_cursor = db.execute("SELECT user_id, item_id, item_type, parent_comment_id FROM comments WHERE id = ?", (comment_id,))
         comment_owner_row = comment_owner_cursor.fetchone()
 
         if not comment_owner_row:
@@ -569,9 +1475,12 @@ def delete_comment_by_id(db, comment_id, user_id, role):
         
         # Proceed with deletion
         cursor = db.execute("DELETE FROM comments WHERE id = ?", (comment_id,))
+        if cursor.rowcount > 0 and comment_owner_row['parent_comment_id'] is None:
+            _adjust_top_level_comment_count(db, comment_owner_row['item_type'], comment_owner_row['item_id'], -1)
         db.commit()
         return cursor.rowcount > 0 # True if a row (and its replies) were deleted
     except sqlite3.Error as e:
+        db.rollback()
         print(f"DB_COMMENTS: Error deleting comment ID {comment_id} by user {user_id} (role: {role}): {e}")
         return False
 
@@ -604,17 +1513,21 @@ def get_watching_users(db, content_type: str, category: str = None) -> list['sql
         return []
 
 def create_notification(db, user_id: int, type: str, message: str, item_id: int = None, item_type: str = None, content_type: str = None, category: str = None):
-    """Inserts a new notification into the notifications table."""
+    """
+    Inserts a new notification into the notifications table.
+    The insert is queued on the DatabaseWriter, so the new id is only returned when the
+    write had to run inline (see execute_write); otherwise None is returned.
+    """
     try:
-        cursor = db.execute(
+        result = execute_write(
+            db,
             """
             INSERT INTO notifications (user_id, type, message, item_id, item_type, content_type, category)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (user_id, type, message, item_id, item_type, content_type, category)
         )
-        db.commit()
-        return cursor.lastrowid
+        return result.lastrowid if result else None
     except sqlite3.Error as e:
         print(f"DB_NOTIFICATIONS: Error creating notification for user {user_id}: {e}")
         return None
@@ -646,6 +1559,15 @@ def get_unread_notifications(db, user_id, limit=None):
         print(f"DB_NOTIFICATIONS: Error fetching unread notifications for user {user_id}: {e}")
         return []
 
+def count_unread_notifications(db, user_id) -> int:
+    """len(get_unread_notifications()) without fetching and enriching every notification."""
+    try:
+        row = db.execute("SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = FALSE", (user_id,)).fetchone()
+        return row[0]
+    except sqlite3.Error as e:
+        print(f"DB_NOTIFICATIONS: Error counting unread notifications for user {user_id}: {e}")
+        return 0
+
 def _get_original_item_name(db, item_type, item_id):
     """Helper to get a display name for an item for notification enrichment."""
     name = None # Default to None if not found or type is unknown
@@ -904,13 +1826,16 @@ def send_message(db, conversation_id: int, sender_id: int, recipient_id: int, co
 
         # print(f"DB_MESSAGES: Final db_file_name_to_store: '{db_file_name_to_store}'")
 
-        cursor = db.execute(
+        # Goes through the DatabaseWriter; wait=True because we need the new id (and the
+        # future only resolves once the batch is committed, so the read below sees the row).
+        result = execute_write(
+            db,
             """INSERT INTO messages (conversation_id, sender_id, recipient_id, content, file_name, file_url, file_type)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (conversation_id, sender_id, recipient_id, encrypted_content, db_file_name_to_store, file_url, file_type)
+            (conversation_id, sender_id, recipient_id, encrypted_content, db_file_name_to_store, file_url, file_type),
+            wait=True
         )
-        db.commit()
-        new_message_id = cursor.lastrowid
+        new_message_id = result.lastrowid
         # Fetch the newly created message
         return get_message_by_id(db, new_message_id)
     except sqlite3.Error as e:
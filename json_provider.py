@@ -0,0 +1,55 @@
+# json_provider.py
+"""
+Flask JSON provider backed by orjson, used for every jsonify() response.
+
+Output matches Flask's DefaultJSONProvider: keys are sorted, datetimes are formatted as
+HTTP dates, and date/Decimal/UUID/dataclass values go through the same default()
+fallback. The only difference on the wire is that non-ASCII text is sent as UTF-8
+instead of \\uXXXX escapes. Anything orjson rejects (e.g. integers wider than 64 bits)
+is serialized with the stdlib encoder instead.
+
+If orjson is not installed, this behaves exactly like DefaultJSONProvider.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError: # Optional dependency; falls back to the stdlib json module
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+
+    def _stdlib_dumps_bytes(self, obj, indent: bool) -> bytes:
+        if indent:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps_bytes(self, obj, indent: bool = False) -> bytes:
+        """Serializes obj to UTF-8 JSON bytes (2-space indented if `indent`)."""
+        if orjson is None:
+            return self._stdlib_dumps_bytes(obj, indent)
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME # datetimes go through default(), as in Flask
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=options)
+        except orjson.JSONEncodeError:
+            return self._stdlib_dumps_bytes(obj, indent)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s) # orjson.JSONDecodeError subclasses json.JSONDecodeError
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Same pretty-printing rule as DefaultJSONProvider.response().
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent=indent) + b'\n', mimetype=self.mimetype)
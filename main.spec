@@ -11,7 +11,8 @@ a = Analysis(['app.py'],
              datas=[
                  ('frontend/dist', 'frontend/dist'),
                  ('instance/default_profile_pictures', 'default_profile_pictures_bundle_location'),
-                 ('schema.sql', '.')
+                 ('schema.sql', '.'),
+                 ('migrations', 'migrations')
              ],
              hiddenimports=[
                  # Core dependencies
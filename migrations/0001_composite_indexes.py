@@ -0,0 +1,30 @@
+"""
+Composite indexes for the hot listing, notification and chat queries.
+
+- comments(item_id, item_type, parent_comment_id): every listing's comment_count
+  subquery becomes a covering index search.
+- notifications(user_id, is_read, created_at) / (user_id, created_at): unread and
+  paginated notification lists no longer sort in a temp b-tree.
+- messages(conversation_id, created_at): chat history pages come back in index order.
+- messages(recipient_id, conversation_id) WHERE is_read = FALSE: unread counters only
+  touch unread rows.
+
+The indexes these extend as a prefix are dropped afterwards. file_permissions and
+user_favorites are already served by their UNIQUE (user_id, ..., ...) indexes, and the
+popular-downloads GROUP BY by idx_download_log_file_id_file_type.
+"""
+from schema_migrations import CreateIndex, SQL
+
+STEPS = [
+    CreateIndex('idx_comments_item_top_level', 'comments', ['item_id', 'item_type', 'parent_comment_id']),
+    CreateIndex('idx_notifications_user_unread', 'notifications', ['user_id', 'is_read', 'created_at']),
+    CreateIndex('idx_notifications_user_created', 'notifications', ['user_id', 'created_at']),
+    CreateIndex('idx_messages_conversation_created', 'messages', ['conversation_id', 'created_at']),
+    CreateIndex('idx_messages_recipient_unread', 'messages', ['recipient_id', 'conversation_id'], where='is_read = FALSE'),
+    SQL(
+        "DROP INDEX IF EXISTS idx_comments_item_id_item_type",
+        "DROP INDEX IF EXISTS idx_notifications_user_id",
+        "DROP INDEX IF EXISTS idx_messages_recipient_id",
+    ),
+    SQL("ANALYZE"),
+]
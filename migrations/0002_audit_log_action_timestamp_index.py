@@ -0,0 +1,12 @@
+"""
+audit_logs(action_type, timestamp) for the dashboard's per-day/per-week activity counts,
+which filter on action_type and a half-open timestamp range. Replaces the single-column
+action_type index, which it extends as a prefix.
+"""
+from schema_migrations import CreateIndex, SQL
+
+STEPS = [
+    CreateIndex('idx_audit_logs_action_type_timestamp', 'audit_logs', ['action_type', 'timestamp']),
+    SQL("DROP INDEX IF EXISTS idx_audit_logs_action_type"),
+    SQL("ANALYZE audit_logs"),
+]
@@ -0,0 +1,23 @@
+"""
+Drops the AFTER UPDATE triggers that re-set updated_at. Each of them issued a second
+UPDATE for every updated row; the application's UPDATE statements set updated_at
+themselves, so the triggers only doubled page writes and WAL volume.
+"""
+from schema_migrations import SQL
+
+UPDATED_AT_TRIGGERS = [
+    'update_comments_updated_at',
+    'update_versions_updated_at',
+    'update_documents_updated_at',
+    'update_patches_updated_at',
+    'update_links_updated_at',
+    'update_misc_categories_updated_at',
+    'update_misc_files_updated_at',
+    'update_file_permissions_updated_at',
+    'trigger_system_settings_updated_at',
+    'update_notifications_updated_at',
+]
+
+STEPS = [
+    SQL(*[f"DROP TRIGGER IF EXISTS {name}" for name in UPDATED_AT_TRIGGERS]),
+]
@@ -0,0 +1,29 @@
+"""
+Indexes on the sortable columns of the documents, patches, links and misc_files listings, so
+keyset (cursor) pages start with an index seek on (column, id) instead of a sort. The rowid
+is implicitly the last column of every index, which provides the id tie-breaker. Sorts on
+joined columns (software, version, category, uploader) and on the aggregated
+compatible_vms_versions still sort the filtered rows.
+"""
+from schema_migrations import CreateIndex, SQL
+
+STEPS = [
+    CreateIndex('idx_documents_doc_name', 'documents', ['doc_name']),
+    CreateIndex('idx_documents_doc_type', 'documents', ['doc_type']),
+    CreateIndex('idx_documents_created_at', 'documents', ['created_at']),
+    CreateIndex('idx_documents_updated_at', 'documents', ['updated_at']),
+    CreateIndex('idx_patches_patch_name', 'patches', ['patch_name']),
+    CreateIndex('idx_patches_release_date', 'patches', ['release_date']),
+    CreateIndex('idx_patches_patch_by_developer', 'patches', ['patch_by_developer']),
+    CreateIndex('idx_patches_created_at', 'patches', ['created_at']),
+    CreateIndex('idx_patches_updated_at', 'patches', ['updated_at']),
+    CreateIndex('idx_links_title', 'links', ['title']),
+    CreateIndex('idx_links_created_at', 'links', ['created_at']),
+    CreateIndex('idx_links_updated_at', 'links', ['updated_at']),
+    CreateIndex('idx_misc_files_user_provided_title', 'misc_files', ['user_provided_title']),
+    CreateIndex('idx_misc_files_original_filename', 'misc_files', ['original_filename']),
+    CreateIndex('idx_misc_files_file_size', 'misc_files', ['file_size']),
+    CreateIndex('idx_misc_files_created_at', 'misc_files', ['created_at']),
+    CreateIndex('idx_misc_files_updated_at', 'misc_files', ['updated_at']),
+    SQL("ANALYZE documents", "ANALYZE patches", "ANALYZE links", "ANALYZE misc_files"),
+]
@@ -0,0 +1,26 @@
+"""
+Denormalized top_level_comment_count on documents, patches, links and misc_files, so the
+listings and search read a column instead of counting each row's comments with a
+correlated subquery. database.add_comment() and delete_comment_by_id() keep it current;
+this migration backfills it from the existing comments.
+"""
+from schema_migrations import AddColumn, Backfill
+
+COMMENT_COUNT_TABLES = [
+    ('documents', 'document'),
+    ('patches', 'patch'),
+    ('links', 'link'),
+    ('misc_files', 'misc_file'),
+]
+
+STEPS = [
+    AddColumn(table, 'top_level_comment_count', 'INTEGER NOT NULL DEFAULT 0')
+    for table, _ in COMMENT_COUNT_TABLES
+] + [
+    Backfill(
+        table,
+        f"top_level_comment_count = (SELECT COUNT(*) FROM comments c WHERE c.item_id = {table}.id "
+        f"AND c.item_type = '{item_type}' AND c.parent_comment_id IS NULL)"
+    )
+    for table, item_type in COMMENT_COUNT_TABLES
+]
@@ -0,0 +1,54 @@
+"""
+Group- and role-level file permission rules, so restricting a file for many users is one
+rule row instead of one file_permissions row per user. A user's effective permissions are
+their own file_permissions rows, falling back to the most restrictive rule among their
+groups and their role (resolved and cached by get_file_denies() in app.py).
+"""
+from schema_migrations import SQL
+
+STEPS = [
+    SQL("""
+        CREATE TABLE IF NOT EXISTS permission_groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT,
+            created_by_user_id INTEGER,
+            created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            FOREIGN KEY (created_by_user_id) REFERENCES users (id) ON DELETE SET NULL
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS permission_group_members (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (group_id, user_id),
+            FOREIGN KEY (group_id) REFERENCES permission_groups (id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_permission_group_members_user_id ON permission_group_members (user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS group_file_permissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            file_type TEXT NOT NULL,
+            can_view BOOLEAN NOT NULL DEFAULT TRUE,
+            can_download BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            FOREIGN KEY (group_id) REFERENCES permission_groups (id) ON DELETE CASCADE,
+            UNIQUE (group_id, file_id, file_type)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS role_file_permissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            file_id INTEGER NOT NULL,
+            file_type TEXT NOT NULL,
+            can_view BOOLEAN NOT NULL DEFAULT TRUE,
+            can_download BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+            UNIQUE (role, file_id, file_type)
+        )"""),
+]
@@ -0,0 +1,37 @@
+"""
+Denormalized compatible_vms_versions on patches and links: the comma-separated version
+numbers of an item's compatible VMS versions (NULL unless its software is VMS or VA), so the
+listings read and sort on a column instead of GROUP_CONCATing the compatibility rows under a
+GROUP BY on every page. database.refresh_vms_compatibility() keeps it current wherever
+compatibility rows or an item's version/software change; this migration backfills it.
+
+Also indexes the compatibility tables by VMS version, so the listings' "compatible with VMS
+version X" filter is an index seek.
+"""
+from schema_migrations import AddColumn, Backfill, CreateIndex
+
+VMS_COMPATIBILITY_TABLES = [
+    ('patches', 'patch_vms_compatibility', 'patch_id',
+     "(SELECT v.software_id FROM versions v WHERE v.id = patches.version_id)"),
+    ('links', 'link_vms_compatibility', 'link_id', "links.software_id"),
+]
+
+STEPS = [
+    AddColumn(table, 'compatible_vms_versions', 'TEXT')
+    for table, _, _, _ in VMS_COMPATIBILITY_TABLES
+] + [
+    Backfill(
+        table,
+        f"compatible_vms_versions = CASE "
+        f"WHEN (SELECT s.name FROM software s WHERE s.id = {software_id_sql}) IN ('VMS', 'VA') THEN ("
+        f"SELECT GROUP_CONCAT(DISTINCT vms_v.version_number) FROM {compat_table} c "
+        f"JOIN versions vms_v ON c.vms_version_id = vms_v.id WHERE c.{item_column} = {table}.id) "
+        f"ELSE NULL END"
+    )
+    for table, compat_table, item_column, software_id_sql in VMS_COMPATIBILITY_TABLES
+] + [
+    CreateIndex('idx_patch_vms_compatibility_vms_version', 'patch_vms_compatibility', ['vms_version_id', 'patch_id']),
+    CreateIndex('idx_link_vms_compatibility_vms_version', 'link_vms_compatibility', ['vms_version_id', 'link_id']),
+    CreateIndex('idx_patches_compatible_vms_versions', 'patches', ['compatible_vms_versions']),
+    CreateIndex('idx_links_compatible_vms_versions', 'links', ['compatible_vms_versions']),
+]
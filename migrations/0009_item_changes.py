@@ -0,0 +1,22 @@
+"""
+item_changes: an append-only log of inserted, updated and deleted documents, patches, links
+and misc files, so /api/sync can hand a client only what changed since its last token (the
+id of the last change it saw) instead of the full listings. database.record_item_changes()
+writes it in the same transaction as the change; existing rows have no history, so clients
+start from the listings.
+"""
+from schema_migrations import CreateIndex, SQL
+
+STEPS = [
+    SQL(
+        """
+        CREATE TABLE IF NOT EXISTS item_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            change_type TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
+        )""",
+    ),
+    CreateIndex('idx_item_changes_changed_at', 'item_changes', ['changed_at']), # Pruning by age
+]
@@ -0,0 +1,400 @@
+# postgres_backend.py
+"""
+Experimental PostgreSQL backend for get_db().
+
+The application is written against sqlite3: '?' placeholders, sqlite3.Row-style rows,
+cursor.lastrowid, `except sqlite3.Error` around every query, TEXT timestamps produced by
+strftime(..., 'now', '+05:30'), and 0/1 booleans. PostgresConnection exposes that same
+surface on top of psycopg 3 so get_db() can hand one out instead of a SQLite connection:
+
+- SQL is rewritten by translate_sql(): placeholders, the IST/UTC "now" expressions,
+  TRUE/FALSE literals (booleans are INTEGER 0/1 columns, as in SQLite), INSERT OR IGNORE,
+  `SELECT value FROM json_each(?)` id lists, `GROUP_CONCAT(DISTINCT column)`, and PRAGMA
+  statements (skipped).
+- INSERTs get RETURNING id so cursor.lastrowid works.
+- psycopg errors are re-raised as the matching sqlite3 exception classes.
+
+translate_schema() turns schema.sql into PostgreSQL DDL with the same column semantics.
+
+The migration runner (schema_migrations.py) is SQLite-only. On PostgreSQL the schema comes
+from schema.sql, which already contains every migration's tables, columns and indexes;
+init_db() records them all in schema_version. A migration added later shows up as pending:
+get_pool() warns about it and 'flask migrate' refuses to run until it is applied by hand.
+
+Still SQLite-only (these paths raise on PostgreSQL): queries using date()/strftime() with
+modifiers other than 'now' (dashboard trend counts), other GROUP_CONCAT forms, INSERT OR REPLACE,
+sqlite_master lookups, and backup/restore/reset of the database file.
+
+Enable by setting the DATABASE_URL environment variable to a postgresql:// URL; requires
+`pip install "psycopg[binary]"`. tests/test_postgres_backend.py runs against the server in
+TEST_DATABASE_URL; docker-compose.test.yml starts one.
+"""
+import os
+import queue
+import re
+import sqlite3
+import sys
+
+try:
+    import psycopg
+except ImportError: # Optional dependency, only needed when DATABASE_URL points at PostgreSQL
+    psycopg = None
+
+IST_NOW_SQL = "to_char(now() AT TIME ZONE 'Asia/Kolkata', 'YYYY-MM-DD HH24:MI:SS')"
+UTC_NOW_SQL = "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+
+_QUOTED_OR_TOKEN_RE = re.compile(r"('(?:[^']|'')*')|(\?)|:([A-Za-z_]\w*)|%")
+_IST_NOW_RE = re.compile(r"strftime\('%Y-%m-%d %H:%M:%S',\s*'now',\s*'\+05:30'\)", re.IGNORECASE)
+_INSERT_RE = re.compile(r"^\s*INSERT\s+(OR\s+IGNORE\s+)?INTO\s+(\w+)", re.IGNORECASE)
+_BOOL_LITERAL_RE = re.compile(r"('(?:[^']|'')*')|\b(TRUE|FALSE)\b", re.IGNORECASE)
+# Id lists passed as one JSON array parameter (e.g. a user's denied file ids).
+_JSON_EACH_IDS_RE = re.compile(r"SELECT\s+value\s+FROM\s+json_each\(\?\)", re.IGNORECASE)
+_GROUP_CONCAT_DISTINCT_RE = re.compile(r"GROUP_CONCAT\(DISTINCT\s+([\w.]+)\)", re.IGNORECASE)
+_CREATE_TABLE_RE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+_REFERENCES_RE = re.compile(r"REFERENCES\s+(\w+)", re.IGNORECASE)
+_QUOTED_OR_COMMENT_RE = re.compile(r"('(?:[^']|'')*')|--[^\n]*")
+_ID_COLUMN_RE = re.compile(r"[(,]\s*id\s+\w", re.IGNORECASE)
+
+def is_postgres_url(url: str) -> bool:
+    return bool(url) and url.startswith(('postgres://', 'postgresql://'))
+
+def _replace_bool_literals(sql: str) -> str:
+    def repl(match):
+        if match.group(1):
+            return match.group(1)
+        return '1' if match.group(2).upper() == 'TRUE' else '0'
+    return _BOOL_LITERAL_RE.sub(repl, sql)
+
+def translate_sql(sql: str) -> str:
+    """Rewrites one SQLite statement for PostgreSQL (see module docstring for what is covered)."""
+    sql = _IST_NOW_RE.sub(IST_NOW_SQL, sql)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\b", UTC_NOW_SQL, sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bdate\('now'\)", "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD')", sql, flags=re.IGNORECASE)
+    sql = _replace_bool_literals(sql)
+    sql = _JSON_EACH_IDS_RE.sub("SELECT CAST(jsonb_array_elements_text(CAST(? AS jsonb)) AS bigint)", sql)
+    sql = _GROUP_CONCAT_DISTINCT_RE.sub(r"string_agg(DISTINCT CAST(\1 AS TEXT), ',')", sql)
+
+    def placeholders(match):
+        if match.group(1):
+            # Inside a string literal; psycopg still needs a literal % doubled.
+            return match.group(1).replace('%', '%%')
+        if match.group(2):
+            return '%s'
+        if match.group(3):
+            return f"%({match.group(3)})s"
+        return '%%'
+    sql = _QUOTED_OR_TOKEN_RE.sub(placeholders, sql)
+
+    insert = _INSERT_RE.match(sql)
+    if insert:
+        if insert.group(1):
+            sql = _INSERT_RE.sub(lambda m: f"INSERT INTO {m.group(2)}", sql, count=1).rstrip().rstrip(';')
+            if 'ON CONFLICT' not in sql.upper():
+                sql += " ON CONFLICT DO NOTHING"
+        if insert.group(2).lower() not in TABLES_WITHOUT_ID and 'RETURNING' not in sql.upper():
+            sql = sql.rstrip().rstrip(';') + " RETURNING id"
+    return sql
+
+def _split_statements(script: str) -> list:
+    statements, buffer = [], ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ''
+    return statements
+
+def default_schema_path() -> str:
+    base_dir = sys._MEIPASS if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, 'schema.sql')
+
+def tables_without_id(schema_sql: str) -> set:
+    """The tables created in schema_sql without an `id` column (e.g. composite primary keys)."""
+    sql = _QUOTED_OR_COMMENT_RE.sub(lambda m: m.group(1) or '', schema_sql)
+    tables = set()
+    for statement in _split_statements(sql):
+        create = _CREATE_TABLE_RE.match(statement)
+        if create and not _ID_COLUMN_RE.search(statement):
+            tables.add(create.group(1).lower())
+    return tables
+
+# INSERTs into these can't RETURNING id. schema_version is created by schema_migrations.
+with open(default_schema_path(), 'r') as f:
+    TABLES_WITHOUT_ID = tables_without_id(f.read()) | {'schema_version'}
+
+def _order_schema_statements(script: str) -> str:
+    """
+    SQLite accepts a REFERENCES to a table created further down; PostgreSQL doesn't. Emits
+    the DROPs first, then the CREATE TABLEs with every referenced table ahead of its
+    referrers, then the rest (indexes, seed rows) in their original order.
+    """
+    drops, tables, rest = [], {}, []
+    for statement in _split_statements(script):
+        create = _CREATE_TABLE_RE.match(statement)
+        if create:
+            tables[create.group(1).lower()] = statement
+        elif re.match(r"DROP\s", statement, re.IGNORECASE):
+            drops.append(statement)
+        else:
+            rest.append(statement)
+    ordered, placed = [], set()
+    def place(name, visiting=()):
+        if name in placed or name not in tables or name in visiting:
+            return
+        for referenced in _REFERENCES_RE.findall(tables[name]):
+            place(referenced.lower(), visiting + (name,))
+        placed.add(name)
+        ordered.append(tables[name])
+    for name in tables:
+        place(name)
+    return "\n\n".join(drops + ordered + rest) + "\n"
+
+def translate_schema(schema_sql: str) -> str:
+    """Turns schema.sql (SQLite DDL) into equivalent PostgreSQL DDL."""
+    # Comments go first: an apostrophe in one (e.g. "a user's own row") would otherwise read
+    # as the start of a string literal to the rewrites below.
+    sql = _QUOTED_OR_COMMENT_RE.sub(lambda m: m.group(1) or '', schema_sql)
+    sql = _order_schema_statements(sql)
+    sql = re.sub(r"INTEGER PRIMARY KEY AUTOINCREMENT", "BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bBOOLEAN\b", "INTEGER", sql)
+    # Timestamps and dates stay TEXT so rows read back exactly as they do from SQLite.
+    sql = re.sub(r"\bTIMESTAMP\b(?= DEFAULT| NOT NULL|,|\n)", "TEXT", sql)
+    sql = re.sub(r"\bDATE\b(?=,|\n| NOT NULL)", "TEXT", sql)
+    sql = re.sub(r"DROP TABLE IF EXISTS (\w+);", r"DROP TABLE IF EXISTS \1 CASCADE;", sql)
+    sql = re.sub(r"CREATE TABLE (?!IF NOT EXISTS)", "CREATE TABLE IF NOT EXISTS ", sql)
+    sql = _IST_NOW_RE.sub(IST_NOW_SQL, sql)
+    sql = re.sub(r"DEFAULT CURRENT_TIMESTAMP\b", f"DEFAULT ({UTC_NOW_SQL})", sql)
+    return _replace_bool_literals(sql)
+
+def _as_sqlite_error(e):
+    if isinstance(e, psycopg.IntegrityError):
+        return sqlite3.IntegrityError(str(e))
+    if isinstance(e, psycopg.OperationalError):
+        return sqlite3.OperationalError(str(e))
+    return sqlite3.DatabaseError(str(e))
+
+def _adapt_params(parameters):
+    # Booleans are stored as INTEGER 0/1 (as SQLite does), so send Python bools as ints.
+    if isinstance(parameters, dict):
+        return {k: int(v) if isinstance(v, bool) else v for k, v in parameters.items()}
+    return [int(v) if isinstance(v, bool) else v for v in parameters or ()]
+
+class PostgresRow(tuple):
+    """Row supporting row[0], row['name'], row.keys() and dict(row), like sqlite3.Row."""
+
+    def __new__(cls, keys, values):
+        row = super().__new__(cls, values)
+        row._keys = keys
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return super().__getitem__(self._keys.index(key))
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self._keys)
+
+class PostgresCursor:
+    """The part of sqlite3.Cursor the application uses."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self.row_factory = connection.row_factory # Per-cursor, like sqlite3.Cursor.row_factory
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, sql, parameters=()):
+        translated = translate_sql(sql)
+        self.lastrowid = None
+        if translated.lstrip().upper().startswith('PRAGMA'):
+            return self
+        try:
+            self._cursor.execute(translated, _adapt_params(parameters))
+        except psycopg.Error as e:
+            raise _as_sqlite_error(e) from e
+        self.rowcount = self._cursor.rowcount
+        if translated.rstrip().endswith('RETURNING id') and self._cursor.description:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        translated = translate_sql(sql)
+        try:
+            self._cursor.executemany(translated, [_adapt_params(p) for p in seq_of_parameters])
+        except psycopg.Error as e:
+            raise _as_sqlite_error(e) from e
+        self.rowcount = self._cursor.rowcount
+        return self
+
+    def _wrap(self, values):
+        if values is None or self.row_factory is None:
+            return values
+        keys = [column.name for column in self._cursor.description]
+        return PostgresRow(keys, values)
+
+    def fetchone(self):
+        if self._cursor.description is None:
+            return None
+        return self._wrap(self._cursor.fetchone())
+
+    def fetchall(self):
+        if self._cursor.description is None:
+            return []
+        return [self._wrap(values) for values in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        if self._cursor.description is None:
+            return []
+        return [self._wrap(values) for values in self._cursor.fetchmany(size)]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+class PostgresConnection:
+    """The part of sqlite3.Connection the application uses, on top of a psycopg connection."""
+
+    db_path = None # No single file: execute_write() writes inline instead of via the writer
+    pool = None
+    pool_generation = 0
+    query_stats = None
+
+    def __init__(self, url: str):
+        if psycopg is None:
+            raise RuntimeError('DATABASE_URL points at PostgreSQL but psycopg is not installed (pip install "psycopg[binary]").')
+        self.raw = psycopg.connect(url)
+        self.row_factory = None
+
+    def cursor(self):
+        return PostgresCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        try:
+            self.raw.execute(script)
+        except psycopg.Error as e:
+            raise _as_sqlite_error(e) from e
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != psycopg.pq.TransactionStatus.IDLE
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+class PostgresPool:
+    """Same acquire/release/dispose interface as database.ConnectionPool."""
+
+    def __init__(self, url: str, max_idle: int = 8):
+        self.url = url
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = PostgresConnection(self.url)
+            conn.pool = self
+            return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            conn.query_stats = None
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        except Exception as e:
+            print(f"DB_POOL: Discarding PostgreSQL connection after error on release: {e}")
+            conn.close()
+
+    def dispose(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+
+def get_pool(url: str, max_idle: int = 8) -> PostgresPool:
+    pool = _pools.get(url)
+    if pool is None:
+        pool = _pools[url] = PostgresPool(url, max_idle=max_idle)
+        try:
+            check_schema(url)
+        except Exception as e:
+            print(f"DB_HELPER: Could not check the PostgreSQL schema version: {e}")
+    return pool
+
+def pending_migrations(conn) -> list:
+    """
+    Migrations in migrations/ that are not recorded in this database's schema_version. The
+    migration runner is SQLite-only; on PostgreSQL the schema comes from schema.sql, so any
+    entry here is a migration whose changes this database does not have.
+    """
+    import schema_migrations # Imports database; only needed for the check
+    try:
+        applied = {row[0] for row in conn.execute("SELECT version FROM schema_version").fetchall()}
+    except sqlite3.Error:
+        conn.rollback()
+        applied = set()
+    return [m for m in schema_migrations.load_migrations() if m.version not in applied]
+
+def check_schema(url: str):
+    """Warns (once per pool) when the PostgreSQL schema predates migrations/ (see pending_migrations)."""
+    conn = PostgresConnection(url)
+    try:
+        pending = pending_migrations(conn)
+    finally:
+        conn.close()
+    if pending:
+        names = ", ".join(f"{m.version:04d}_{m.name}" for m in pending)
+        print(f"DB_HELPER: WARNING - PostgreSQL schema is missing migrations {names}. The migration "
+              f"runner is SQLite-only; apply their changes by hand or re-create the schema with 'flask init-db'.")
+    return pending
+
+def init_db(url: str, schema_path: str = None):
+    """
+    Creates the schema on PostgreSQL from schema.sql (drops existing tables, like
+    database.init_db), adds the same seed rows, and records every migration in migrations/ as
+    applied: schema.sql already contains their tables, columns and indexes.
+    """
+    import database # Seed rows; imported here so this module loads without Flask
+    import schema_migrations
+    with open(schema_path or default_schema_path(), 'r') as f:
+        ddl = translate_schema(f.read() + "\n" + schema_migrations.SCHEMA_VERSION_TABLE_SQL + ";\n")
+    conn = PostgresConnection(url)
+    try:
+        conn.executescript(ddl)
+        conn.executemany("INSERT INTO software (name) VALUES (?)", [(name,) for name in database.DEFAULT_SOFTWARE])
+        conn.executemany("INSERT INTO security_questions (question_text) VALUES (?)",
+                         [(question,) for question in database.DEFAULT_SECURITY_QUESTIONS])
+        conn.executemany("INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                         [(m.version, m.name) for m in schema_migrations.load_migrations()])
+        conn.commit()
+        print("DB_HELPER: PostgreSQL schema initialized successfully.")
+    finally:
+        conn.close()
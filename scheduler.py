@@ -4,6 +4,8 @@ import os
 from datetime import datetime, timedelta
 from flask import current_app # To access app.config for DB path and retention period
 import logging # For logging within scheduler tasks
+import database
+import postgres_backend
 
 # Initialize scheduler
 scheduler = APScheduler()
@@ -29,6 +31,12 @@ def init_scheduler(app):
     else:
         logger.info("'Cleanup Old Temporary Files' job already scheduled.")
 
+    if not scheduler.get_job('Prune Item Change Log'):
+        scheduler.add_job(id='Prune Item Change Log', func=prune_item_changes_task, trigger='interval', days=1)
+        logger.info("Scheduled 'Prune Item Change Log' job to run daily.")
+    else:
+        logger.info("'Prune Item Change Log' job already scheduled.")
+
 def cleanup_old_temporary_files_task():
     logger.info("Running cleanup_old_temporary_files_task...")
     try:
@@ -119,3 +127,33 @@ def delete_old_messages_task():
         if 'conn' in locals() and conn:
             conn.close()
         logger.info("delete_old_messages_task finished.") # Changed print to logger.info
+
+def prune_item_changes_task():
+    logger.info("Running prune_item_changes_task...")
+    try:
+        # A pooled connection like get_db()'s, so the delete bumps the item_changes table
+        # version (the cached /api/sync responses) like any other write.
+        pool_size = current_app.config['DATABASE_POOL_SIZE']
+        if postgres_backend.is_postgres_url(current_app.config.get('DATABASE_URL')):
+            pool = postgres_backend.get_pool(current_app.config['DATABASE_URL'], max_idle=pool_size)
+        else:
+            db_path = current_app.config['DATABASE_PATH']
+            if not os.path.isabs(db_path):
+                db_path = os.path.join(current_app.root_path, db_path)
+            pool = database.get_pool(db_path, max_idle=pool_size)
+
+        conn = pool.acquire()
+        try:
+            retention_days = current_app.config.get('ITEM_CHANGE_RETENTION_DAYS', 30)
+            deleted_count = database.prune_item_changes(conn, retention_days)
+            conn.commit()
+        finally:
+            pool.release(conn)
+        logger.info(f"Pruned {deleted_count} item_changes entries older than {retention_days} days.")
+
+    except sqlite3.Error as e:
+        logger.error(f"Database error in prune_item_changes_task: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in prune_item_changes_task: {e}", exc_info=True)
+    finally:
+        logger.info("prune_item_changes_task finished.")
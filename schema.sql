@@ -14,12 +14,23 @@ DROP TABLE IF EXISTS site_settings;
 DROP TABLE IF EXISTS user_security_answers;
 DROP TABLE IF EXISTS security_questions;
 DROP TABLE IF EXISTS password_reset_requests;
+DROP TABLE IF EXISTS role_file_permissions;
+DROP TABLE IF EXISTS group_file_permissions;
+DROP TABLE IF EXISTS permission_group_members;
+DROP TABLE IF EXISTS permission_groups;
+DROP TABLE IF EXISTS facet_counts;
+DROP TABLE IF EXISTS item_changes;
 DROP TABLE IF EXISTS file_permissions;
 DROP TABLE IF EXISTS system_settings;
 DROP TABLE IF EXISTS notifications;
 DROP TABLE IF EXISTS user_watch_preferences;
 DROP TABLE IF EXISTS messages;
 DROP TABLE IF EXISTS conversations;
+DROP TABLE IF EXISTS schema_version; -- Migration bookkeeping (schema_migrations.py) starts over with the fresh schema
+DROP TABLE IF EXISTS schema_migration_progress;
+
+-- updated_at columns are set explicitly by each UPDATE statement. There are deliberately no
+-- AFTER UPDATE triggers for them: a trigger would write every updated row a second time.
 
 CREATE TABLE IF NOT EXISTS user_watch_preferences (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -46,13 +57,8 @@ CREATE TABLE IF NOT EXISTS comments (
     FOREIGN KEY (parent_comment_id) REFERENCES comments (id) ON DELETE CASCADE
 );
 CREATE INDEX IF NOT EXISTS idx_comments_user_id ON comments (user_id);
-CREATE INDEX IF NOT EXISTS idx_comments_item_id_item_type ON comments (item_id, item_type);
+CREATE INDEX IF NOT EXISTS idx_comments_item_top_level ON comments (item_id, item_type, parent_comment_id);
 CREATE INDEX IF NOT EXISTS idx_comments_parent_comment_id ON comments (parent_comment_id);
-CREATE TRIGGER IF NOT EXISTS update_comments_updated_at
-AFTER UPDATE ON comments FOR EACH ROW BEGIN
-    UPDATE comments SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT NOT NULL UNIQUE,
@@ -94,11 +100,6 @@ CREATE TABLE IF NOT EXISTS versions (
     FOREIGN KEY (updated_by_user_id) REFERENCES users (id)
 );
 CREATE INDEX IF NOT EXISTS idx_versions_software_id ON versions (software_id);
-CREATE TRIGGER IF NOT EXISTS update_versions_updated_at
-AFTER UPDATE ON versions FOR EACH ROW BEGIN
-    UPDATE versions SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
 CREATE TABLE IF NOT EXISTS documents (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     software_id INTEGER NOT NULL,
@@ -115,6 +116,7 @@ CREATE TABLE IF NOT EXISTS documents (
     created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
     updated_by_user_id INTEGER,
     updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    top_level_comment_count INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (software_id) REFERENCES software (id),
     FOREIGN KEY (created_by_user_id) REFERENCES users (id),
     FOREIGN KEY (updated_by_user_id) REFERENCES users (id),
@@ -122,11 +124,10 @@ CREATE TABLE IF NOT EXISTS documents (
 );
 CREATE INDEX IF NOT EXISTS idx_documents_software_id ON documents (software_id);
 CREATE INDEX IF NOT EXISTS idx_documents_stored_filename ON documents (stored_filename);
-CREATE TRIGGER IF NOT EXISTS update_documents_updated_at
-AFTER UPDATE ON documents FOR EACH ROW BEGIN
-    UPDATE documents SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
+CREATE INDEX IF NOT EXISTS idx_documents_doc_name ON documents (doc_name);
+CREATE INDEX IF NOT EXISTS idx_documents_doc_type ON documents (doc_type);
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_updated_at ON documents (updated_at);
 CREATE TABLE IF NOT EXISTS patches (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     version_id INTEGER NOT NULL,
@@ -144,6 +145,8 @@ CREATE TABLE IF NOT EXISTS patches (
     created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
     updated_by_user_id INTEGER,
     updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    top_level_comment_count INTEGER NOT NULL DEFAULT 0,
+    compatible_vms_versions TEXT,
     FOREIGN KEY (version_id) REFERENCES versions (id),
     FOREIGN KEY (created_by_user_id) REFERENCES users (id),
     FOREIGN KEY (updated_by_user_id) REFERENCES users (id),
@@ -151,11 +154,12 @@ CREATE TABLE IF NOT EXISTS patches (
 );
 CREATE INDEX IF NOT EXISTS idx_patches_version_id ON patches (version_id);
 CREATE INDEX IF NOT EXISTS idx_patches_stored_filename ON patches (stored_filename);
-CREATE TRIGGER IF NOT EXISTS update_patches_updated_at
-AFTER UPDATE ON patches FOR EACH ROW BEGIN
-    UPDATE patches SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
+CREATE INDEX IF NOT EXISTS idx_patches_patch_name ON patches (patch_name);
+CREATE INDEX IF NOT EXISTS idx_patches_release_date ON patches (release_date);
+CREATE INDEX IF NOT EXISTS idx_patches_patch_by_developer ON patches (patch_by_developer);
+CREATE INDEX IF NOT EXISTS idx_patches_created_at ON patches (created_at);
+CREATE INDEX IF NOT EXISTS idx_patches_updated_at ON patches (updated_at);
+CREATE INDEX IF NOT EXISTS idx_patches_compatible_vms_versions ON patches (compatible_vms_versions);
 CREATE TABLE IF NOT EXISTS patch_vms_compatibility (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     patch_id INTEGER NOT NULL,
@@ -164,6 +168,7 @@ CREATE TABLE IF NOT EXISTS patch_vms_compatibility (
     FOREIGN KEY (vms_version_id) REFERENCES versions (id),
     UNIQUE (patch_id, vms_version_id)
 );
+CREATE INDEX IF NOT EXISTS idx_patch_vms_compatibility_vms_version ON patch_vms_compatibility (vms_version_id, patch_id);
 
 CREATE TABLE IF NOT EXISTS links (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -181,6 +186,8 @@ CREATE TABLE IF NOT EXISTS links (
     created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
     updated_by_user_id INTEGER,
     updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    top_level_comment_count INTEGER NOT NULL DEFAULT 0,
+    compatible_vms_versions TEXT,
     FOREIGN KEY (software_id) REFERENCES software (id),
     FOREIGN KEY (version_id) REFERENCES versions (id),
     FOREIGN KEY (created_by_user_id) REFERENCES users (id),
@@ -189,11 +196,10 @@ CREATE TABLE IF NOT EXISTS links (
 CREATE INDEX IF NOT EXISTS idx_links_software_id ON links (software_id);
 CREATE INDEX IF NOT EXISTS idx_links_version_id ON links (version_id);
 CREATE INDEX IF NOT EXISTS idx_links_stored_filename ON links (stored_filename);
-CREATE TRIGGER IF NOT EXISTS update_links_updated_at
-AFTER UPDATE ON links FOR EACH ROW BEGIN
-    UPDATE links SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
+CREATE INDEX IF NOT EXISTS idx_links_title ON links (title);
+CREATE INDEX IF NOT EXISTS idx_links_created_at ON links (created_at);
+CREATE INDEX IF NOT EXISTS idx_links_updated_at ON links (updated_at);
+CREATE INDEX IF NOT EXISTS idx_links_compatible_vms_versions ON links (compatible_vms_versions);
 CREATE TABLE IF NOT EXISTS link_vms_compatibility (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     link_id INTEGER NOT NULL,
@@ -202,6 +208,7 @@ CREATE TABLE IF NOT EXISTS link_vms_compatibility (
     FOREIGN KEY (vms_version_id) REFERENCES versions (id),
     UNIQUE (link_id, vms_version_id)
 );
+CREATE INDEX IF NOT EXISTS idx_link_vms_compatibility_vms_version ON link_vms_compatibility (vms_version_id, link_id);
 
 CREATE TABLE IF NOT EXISTS misc_categories (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -214,11 +221,6 @@ CREATE TABLE IF NOT EXISTS misc_categories (
     FOREIGN KEY (created_by_user_id) REFERENCES users (id),
     FOREIGN KEY (updated_by_user_id) REFERENCES users (id)
 );
-CREATE TRIGGER IF NOT EXISTS update_misc_categories_updated_at
-AFTER UPDATE ON misc_categories FOR EACH ROW BEGIN
-    UPDATE misc_categories SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
 CREATE TABLE IF NOT EXISTS misc_files (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     misc_category_id INTEGER NOT NULL,
@@ -234,6 +236,7 @@ CREATE TABLE IF NOT EXISTS misc_files (
     created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
     updated_by_user_id INTEGER,
     updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    top_level_comment_count INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (misc_category_id) REFERENCES misc_categories (id),
     FOREIGN KEY (user_id) REFERENCES users (id),
     FOREIGN KEY (created_by_user_id) REFERENCES users (id),
@@ -243,11 +246,11 @@ CREATE TABLE IF NOT EXISTS misc_files (
 );
 CREATE INDEX IF NOT EXISTS idx_misc_files_category_id ON misc_files (misc_category_id);
 CREATE INDEX IF NOT EXISTS idx_misc_files_user_id ON misc_files (user_id);
-CREATE TRIGGER IF NOT EXISTS update_misc_files_updated_at
-AFTER UPDATE ON misc_files FOR EACH ROW BEGIN
-    UPDATE misc_files SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
+CREATE INDEX IF NOT EXISTS idx_misc_files_user_provided_title ON misc_files (user_provided_title);
+CREATE INDEX IF NOT EXISTS idx_misc_files_original_filename ON misc_files (original_filename);
+CREATE INDEX IF NOT EXISTS idx_misc_files_file_size ON misc_files (file_size);
+CREATE INDEX IF NOT EXISTS idx_misc_files_created_at ON misc_files (created_at);
+CREATE INDEX IF NOT EXISTS idx_misc_files_updated_at ON misc_files (updated_at);
 CREATE TABLE IF NOT EXISTS user_favorites (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
@@ -286,7 +289,7 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     FOREIGN KEY (user_id) REFERENCES users (id)
 );
 CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs (user_id);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_action_type ON audit_logs (action_type);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_action_type_timestamp ON audit_logs (action_type, timestamp);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_target_table ON audit_logs (target_table);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs (timestamp);
 
@@ -333,11 +336,70 @@ CREATE TABLE IF NOT EXISTS file_permissions (
 );
 CREATE INDEX IF NOT EXISTS idx_file_permissions_user_id ON file_permissions (user_id);
 CREATE INDEX IF NOT EXISTS idx_file_permissions_file_id_file_type ON file_permissions (file_id, file_type);
-CREATE TRIGGER IF NOT EXISTS update_file_permissions_updated_at
-AFTER UPDATE ON file_permissions FOR EACH ROW BEGIN
-    UPDATE file_permissions SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
 
+-- Group- and role-level rules (see migrations/0006_permission_groups.py). A user's own
+-- file_permissions row wins; otherwise the most restrictive group/role rule applies.
+CREATE TABLE IF NOT EXISTS permission_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    created_by_user_id INTEGER,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    FOREIGN KEY (created_by_user_id) REFERENCES users (id) ON DELETE SET NULL
+);
+CREATE TABLE IF NOT EXISTS permission_group_members (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (group_id, user_id),
+    FOREIGN KEY (group_id) REFERENCES permission_groups (id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_permission_group_members_user_id ON permission_group_members (user_id);
+CREATE TABLE IF NOT EXISTS group_file_permissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    file_type TEXT NOT NULL,
+    can_view BOOLEAN NOT NULL DEFAULT TRUE,
+    can_download BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    FOREIGN KEY (group_id) REFERENCES permission_groups (id) ON DELETE CASCADE,
+    UNIQUE (group_id, file_id, file_type)
+);
+CREATE TABLE IF NOT EXISTS role_file_permissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    role TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    file_type TEXT NOT NULL,
+    can_view BOOLEAN NOT NULL DEFAULT TRUE,
+    can_download BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+    UNIQUE (role, file_id, file_type)
+);
+
+-- Item counts per software / version / doc type / misc category for /api/facets (see
+-- migrations/0008_facet_counts.py), kept current by database.adjust_facet_counts().
+CREATE TABLE IF NOT EXISTS facet_counts (
+    item_type TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    facet_value TEXT NOT NULL,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (item_type, dimension, facet_value)
+);
+
+-- Inserted/updated/deleted documents, patches, links and misc files for /api/sync (see
+-- migrations/0009_item_changes.py), written by database.record_item_changes().
+CREATE TABLE IF NOT EXISTS item_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_type TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    change_type TEXT NOT NULL, -- 'upsert' or 'delete'
+    changed_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
+);
+CREATE INDEX IF NOT EXISTS idx_item_changes_changed_at ON item_changes (changed_at);
 -- System Settings Table
 -- Stores global system-wide settings like maintenance mode.
 CREATE TABLE IF NOT EXISTS system_settings (
@@ -347,14 +409,6 @@ CREATE TABLE IF NOT EXISTS system_settings (
     updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
 );
 
--- Trigger to update 'updated_at' timestamp on row update.
-CREATE TRIGGER IF NOT EXISTS trigger_system_settings_updated_at
-AFTER UPDATE ON system_settings
-FOR EACH ROW
-BEGIN
-    UPDATE system_settings SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
 -- Initialize the maintenance_mode setting.
 INSERT INTO system_settings (setting_name, is_enabled) VALUES ('maintenance_mode', FALSE)
 ON CONFLICT(setting_name) DO NOTHING;
@@ -413,13 +467,9 @@ CREATE TABLE IF NOT EXISTS messages (
     FOREIGN KEY (recipient_id) REFERENCES users (id) ON DELETE CASCADE
 );
 
-CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications (user_id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications (user_id, is_read, created_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications (user_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_notifications_item_id_item_type ON notifications (item_id, item_type);
-CREATE TRIGGER IF NOT EXISTS update_notifications_updated_at
-AFTER UPDATE ON notifications FOR EACH ROW BEGIN
-    UPDATE notifications SET updated_at = (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')) WHERE id = OLD.id;
-END;
-
 -- User Feedback Table
 CREATE TABLE IF NOT EXISTS user_feedback (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -438,4 +488,5 @@ CREATE INDEX IF NOT EXISTS idx_conversations_user1_id ON conversations (user1_id
 CREATE INDEX IF NOT EXISTS idx_conversations_user2_id ON conversations (user2_id);
 CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id);
 CREATE INDEX IF NOT EXISTS idx_messages_sender_id ON messages (sender_id);
-CREATE INDEX IF NOT EXISTS idx_messages_recipient_id ON messages (recipient_id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages (conversation_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_unread ON messages (recipient_id, conversation_id) WHERE is_read = FALSE;
@@ -0,0 +1,276 @@
+# schema_migrations.py
+"""
+Versioned schema migrations applied on top of schema.sql.
+
+Migration files live in migrations/ and are named NNNN_short_name.py (e.g.
+0001_composite_indexes.py). Each one defines a STEPS list built from the step classes
+below; the module docstring is used as its description. Applied versions are recorded in
+the schema_version table.
+
+Every step runs in its own short transaction and records its progress in
+schema_migration_progress, so an interrupted run resumes where it stopped instead of
+starting over. Backfill steps walk the table in rowid windows of `batch_size` rows and
+commit after each window, so the write lock is only held for one batch at a time; readers
+are never blocked under WAL.
+"""
+import importlib.util
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import database
+
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def get_migrations_dir() -> str:
+    if getattr(sys, 'frozen', False):
+        # Running as a PyInstaller bundle; main.spec ships migrations/ as data.
+        return os.path.join(sys._MEIPASS, 'migrations')
+    return os.path.join(BASE_DIR, 'migrations')
+
+# Also created by postgres_backend.init_db(), which records the migrations schema.sql covers.
+SCHEMA_VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30'))
+)"""
+
+# --- Steps ---
+
+class SQL:
+    """Runs one or more statements in a single transaction."""
+
+    def __init__(self, *statements: str):
+        self.statements = statements
+
+    def run(self, runner, conn, version, step_index):
+        with runner.transaction(conn):
+            for statement in self.statements:
+                conn.execute(statement)
+            runner.save_progress(conn, version, step_index + 1, 0)
+
+    def describe(self):
+        return self.statements[0].strip().splitlines()[0]
+
+class CreateIndex:
+    """
+    CREATE INDEX IF NOT EXISTS in its own transaction. SQLite builds an index in one pass,
+    so this holds the write lock for the duration of the build, but readers keep working.
+    """
+
+    def __init__(self, name: str, table: str, columns: list, where: str = None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+
+    def run(self, runner, conn, version, step_index):
+        sql = f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)})"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        with runner.transaction(conn):
+            conn.execute(sql)
+            runner.save_progress(conn, version, step_index + 1, 0)
+
+    def describe(self):
+        return f"create index {self.name} on {self.table}"
+
+class AddColumn:
+    """ALTER TABLE ... ADD COLUMN, skipped if the column already exists."""
+
+    def __init__(self, table: str, column: str, definition: str):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def run(self, runner, conn, version, step_index):
+        with runner.transaction(conn):
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({self.table})")}
+            if self.column not in existing:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}")
+            runner.save_progress(conn, version, step_index + 1, 0)
+
+    def describe(self):
+        return f"add column {self.table}.{self.column}"
+
+class Backfill:
+    """
+    UPDATE table SET <set_sql> [WHERE <where>] in batches of rowid ranges.
+
+    The last rowid handled is saved in the same transaction as each batch, so a crash or
+    Ctrl+C loses at most the batch in flight. `set_sql` may use correlated subqueries that
+    refer to the table by name.
+    """
+
+    def __init__(self, table: str, set_sql: str, where: str = None, batch_size: int = None):
+        self.table = table
+        self.set_sql = set_sql
+        self.where = where
+        self.batch_size = batch_size
+
+    def run(self, runner, conn, version, step_index):
+        batch_size = self.batch_size or runner.batch_size
+        max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {self.table}").fetchone()[0] or 0
+        extra = f" AND ({self.where})" if self.where else ""
+        sql = f"UPDATE {self.table} SET {self.set_sql} WHERE rowid > ? AND rowid <= ?{extra}"
+        while True:
+            with runner.transaction(conn):
+                cursor = runner.load_progress(conn, version)[1]
+                if cursor >= max_rowid:
+                    runner.save_progress(conn, version, step_index + 1, 0)
+                    return
+                upper = min(cursor + batch_size, max_rowid)
+                conn.execute(sql, (cursor, upper))
+                runner.save_progress(conn, version, step_index, upper)
+            runner.log(f"MIGRATE:   {self.table}: backfilled rowid {cursor + 1}-{upper} of {max_rowid}")
+            if runner.pause:
+                time.sleep(runner.pause) # Let queued writers in between batches
+
+    def describe(self):
+        return f"backfill {self.table}"
+
+class Python:
+    """Calls fn(conn) inside one transaction. fn must not commit itself."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def run(self, runner, conn, version, step_index):
+        with runner.transaction(conn):
+            self.fn(conn)
+            runner.save_progress(conn, version, step_index + 1, 0)
+
+    def describe(self):
+        return self.fn.__name__
+
+# --- Runner ---
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: list, description: str = ''):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.description = description
+
+def load_migrations(migrations_dir: str = None) -> list:
+    """Loads NNNN_name.py files from migrations_dir, ordered by version."""
+    migrations_dir = migrations_dir or get_migrations_dir()
+    migrations = []
+    if not os.path.isdir(migrations_dir):
+        return migrations
+    for filename in sorted(os.listdir(migrations_dir)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        version, name = int(match.group(1)), match.group(2)
+        spec = importlib.util.spec_from_file_location(f"migration_{version:04d}_{name}", os.path.join(migrations_dir, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if any(m.version == version for m in migrations):
+            raise ValueError(f"Duplicate migration version {version:04d} ({filename})")
+        migrations.append(Migration(version, name, list(module.STEPS), (module.__doc__ or '').strip()))
+    return migrations
+
+class MigrationRunner:
+    def __init__(self, db_path: str, batch_size: int = 5000, pause: float = 0.05, log=print):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pause = pause
+        self.log = log
+
+    def connect(self):
+        conn = database.get_db_connection(self.db_path)
+        conn.isolation_level = None # Transactions are managed explicitly per step/batch
+        return conn
+
+    @contextmanager
+    def transaction(self, conn):
+        # IMMEDIATE takes the write lock up front (waiting up to busy_timeout) instead of
+        # failing with SQLITE_BUSY halfway through a batch.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def ensure_tables(self, conn):
+        conn.execute(SCHEMA_VERSION_TABLE_SQL)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migration_progress (
+                version INTEGER PRIMARY KEY,
+                step INTEGER NOT NULL DEFAULT 0,
+                cursor INTEGER NOT NULL DEFAULT 0
+            )""")
+
+    def applied_versions(self, conn) -> set:
+        return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+    def load_progress(self, conn, version: int) -> tuple:
+        row = conn.execute("SELECT step, cursor FROM schema_migration_progress WHERE version = ?", (version,)).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def save_progress(self, conn, version: int, step: int, cursor: int):
+        conn.execute(
+            "INSERT OR REPLACE INTO schema_migration_progress (version, step, cursor) VALUES (?, ?, ?)",
+            (version, step, cursor)
+        )
+
+    def status(self, migrations: list = None) -> list:
+        """Returns (migration, state) pairs; state is 'applied', 'in progress' or 'pending'."""
+        migrations = load_migrations() if migrations is None else migrations
+        conn = self.connect()
+        try:
+            self.ensure_tables(conn)
+            applied = self.applied_versions(conn)
+            in_progress = {row[0] for row in conn.execute("SELECT version FROM schema_migration_progress")}
+        finally:
+            conn.close()
+        return [
+            (m, 'applied' if m.version in applied else 'in progress' if m.version in in_progress else 'pending')
+            for m in migrations
+        ]
+
+    def run(self, migrations: list = None, target: int = None) -> int:
+        """Applies pending migrations (up to and including `target`). Returns how many were applied."""
+        migrations = load_migrations() if migrations is None else migrations
+        conn = self.connect()
+        applied_count = 0
+        try:
+            self.ensure_tables(conn)
+            applied = self.applied_versions(conn)
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+                self.log(f"MIGRATE: Applying {migration.version:04d}_{migration.name}...")
+                step_index, _ = self.load_progress(conn, migration.version)
+                while step_index < len(migration.steps):
+                    step = migration.steps[step_index]
+                    self.log(f"MIGRATE:  step {step_index + 1}/{len(migration.steps)}: {step.describe()}")
+                    step.run(self, conn, migration.version, step_index)
+                    step_index, _ = self.load_progress(conn, migration.version)
+                with self.transaction(conn):
+                    conn.execute("INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)", (migration.version, migration.name))
+                    conn.execute("DELETE FROM schema_migration_progress WHERE version = ?", (migration.version,))
+                applied_count += 1
+                self.log(f"MIGRATE: Applied {migration.version:04d}_{migration.name}.")
+        finally:
+            conn.close()
+        return applied_count
+
+def run_migrations(db_path: str, **kwargs) -> int:
+    """Applies all pending migrations to db_path. Errors are logged and re-raised."""
+    try:
+        return MigrationRunner(db_path, **kwargs).run()
+    except sqlite3.Error as e:
+        print(f"MIGRATE: Database error while applying migrations to {db_path}: {e}")
+        raise
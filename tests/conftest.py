@@ -0,0 +1,137 @@
+# tests/conftest.py
+from contextlib import contextmanager
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module # Imported first: it monkey patches eventlet before anything else loads
+from flask import g, request_finished
+from flask_jwt_extended import create_access_token
+import pytest
+
+import database
+import postgres_backend
+import schema_migrations
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database built from schema.sql with every migration applied."""
+    path = str(tmp_path / 'software_dashboard.db')
+    database.init_db(path)
+    schema_migrations.run_migrations(path, log=lambda message: None)
+    yield path
+    database.dispose_pool(path)
+
+@pytest.fixture
+def app(db_path, monkeypatch):
+    """The Flask app pointed at db_path, with its table-versioned caches invalidated."""
+    monkeypatch.setitem(app_module.app.config, 'DATABASE', db_path)
+    monkeypatch.setitem(app_module.app.config, 'DATABASE_PATH', db_path)
+    monkeypatch.setitem(app_module.app.config, 'TESTING', True)
+    database.table_versions.bump_all() # Table versions are process-wide; start over for the new file
+    yield app_module.app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def pg_url():
+    """
+    TEST_DATABASE_URL with a freshly created schema (postgres_backend.init_db drops and
+    re-creates every table). Skips when it is not set; docker-compose.test.yml starts a server.
+    """
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set (see docker-compose.test.yml)")
+    if postgres_backend.psycopg is None:
+        pytest.skip('psycopg is not installed (pip install "psycopg[binary]")')
+    postgres_backend.get_pool(url).dispose() # Idle connections from the previous test
+    postgres_backend.init_db(url)
+    return url
+
+@pytest.fixture
+def pg_client(app, pg_url, monkeypatch):
+    """A test client whose get_db() connections come from the PostgreSQL backend."""
+    monkeypatch.setitem(app.config, 'DATABASE_URL', pg_url)
+    return app.test_client()
+
+@pytest.fixture
+def seed_catalog(db_path):
+    """
+    Returns seed(documents=, patches=, links=): inserts one uploader, the schema's seeded
+    software with a version each, and that many rows per listing, spread over the software.
+    Patches get release dates one day apart starting 2024-01-01.
+    """
+    def seed(documents=0, patches=0, links=0):
+        conn = database.get_db_connection(db_path)
+        try:
+            user_id = conn.execute(
+                "INSERT INTO users (username, password_hash, role) VALUES ('uploader', 'x', 'admin')"
+            ).lastrowid
+            software_ids = [row[0] for row in conn.execute("SELECT id FROM software ORDER BY id")]
+            version_ids = [
+                conn.execute("INSERT INTO versions (software_id, version_number) VALUES (?, '1.0')", (software_id,)).lastrowid
+                for software_id in software_ids
+            ]
+            conn.executemany(
+                "INSERT INTO documents (software_id, doc_name, download_link, created_by_user_id) VALUES (?, ?, ?, ?)",
+                [(software_ids[i % len(software_ids)], f"Document {i}", f"https://example.com/d/{i}", user_id) for i in range(documents)]
+            )
+            conn.executemany(
+                "INSERT INTO patches (version_id, patch_name, download_link, release_date, created_by_user_id) VALUES (?, ?, ?, date('2024-01-01', ?), ?)",
+                [(version_ids[i % len(version_ids)], f"Patch {i}", f"https://example.com/p/{i}", f"+{i} days", user_id) for i in range(patches)]
+            )
+            conn.executemany(
+                "INSERT INTO links (software_id, version_id, title, url, created_by_user_id) VALUES (?, ?, ?, ?, ?)",
+                [(software_ids[i % len(software_ids)], version_ids[i % len(version_ids)], f"Link {i}", f"https://example.com/l/{i}", user_id) for i in range(links)]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        database.table_versions.bump_all()
+        return user_id
+    return seed
+
+@pytest.fixture
+def auth_headers(app):
+    """Returns headers(user_id): an Authorization header with a fresh access token for that user."""
+    def headers(user_id):
+        with app.app_context():
+            return {'Authorization': f"Bearer {create_access_token(identity=str(user_id))}"}
+    return headers
+
+@pytest.fixture
+def query_budget(app):
+    """
+    Context manager asserting the per-request SQL recorded in g.query_stats (the numbers behind
+    the Server-Timing header) stays within budget for every request made inside it:
+
+        with query_budget(max_queries=6) as requests:
+            client.get('/api/documents')
+
+    It also fails if any statement repeats `max_repeats` times in one request (default
+    SQL_REPEATED_QUERY_THRESHOLD), which is how a new N+1 loop shows up. Yields the list of
+    QueryStats, one per request, for further checks.
+    """
+    @contextmanager
+    def budget(max_queries: int, max_repeats: int = None):
+        max_repeats = max_repeats or app.config['SQL_REPEATED_QUERY_THRESHOLD']
+        recorded = []
+
+        def on_request_finished(sender, response, **extra):
+            stats = g.get('query_stats')
+            if stats is not None:
+                recorded.append(stats)
+
+        with request_finished.connected_to(on_request_finished, app):
+            yield recorded
+        assert recorded, "no request recorded any SQL (is SQL_INSTRUMENTATION on?)"
+        for stats in recorded:
+            statements = "\n  ".join(sql[:160] for sql in stats.statement_counts)
+            assert stats.count <= max_queries, (
+                f"{stats.label} ran {stats.count} queries, budget is {max_queries}:\n  {statements}")
+            repeated = stats.repeated_statements(max_repeats)
+            assert not repeated, f"{stats.label} repeats statements (N+1?): {repeated}"
+    return budget
@@ -0,0 +1,33 @@
+# tests/test_comment_counts.py
+"""The maintained top_level_comment_count column, on SQLite and (with TEST_DATABASE_URL) PostgreSQL."""
+import postgres_backend
+
+def _comment_count(client, headers):
+    return client.get('/api/documents', headers=headers).get_json()['documents'][0]['comment_count']
+
+def _add_and_delete_comments(client, headers):
+    url = '/api/items/document/1/comments'
+    first = client.post(url, json={'content': 'first'}, headers=headers)
+    assert first.status_code == 201, first.get_data(as_text=True)
+    second = client.post(url, json={'content': 'second'}, headers=headers)
+    reply = client.post(url, json={'content': 'reply', 'parent_comment_id': first.get_json()['id']}, headers=headers)
+    assert second.status_code == reply.status_code == 201
+    assert _comment_count(client, headers) == 2 # Replies are not counted
+
+    assert client.delete(f"/api/comments/{second.get_json()['id']}", headers=headers).status_code == 200
+    assert client.delete(f"/api/comments/{first.get_json()['id']}", headers=headers).status_code == 200
+    assert _comment_count(client, headers) == 0
+
+def test_comment_count_follows_adds_and_deletes(client, seed_catalog, auth_headers):
+    user_id = seed_catalog(documents=1)
+    _add_and_delete_comments(client, auth_headers(user_id))
+
+def test_comment_count_on_postgres(pg_client, pg_url, auth_headers):
+    conn = postgres_backend.PostgresConnection(pg_url)
+    try:
+        user_id = conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('commenter', 'x', 'admin')").lastrowid
+        conn.execute("INSERT INTO documents (software_id, doc_name, download_link, created_by_user_id) VALUES (1, 'Doc', 'https://example.com', ?)", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    _add_and_delete_comments(pg_client, auth_headers(user_id))
@@ -0,0 +1,60 @@
+# tests/test_cursor_pagination.py
+"""
+Keyset pagination (?cursor=) on sort columns with duplicates and NULLs: walking every
+page must give the same rows, in the same order, as one unpaged OFFSET listing.
+"""
+import pytest
+
+import database
+
+ROWS = 30
+PAGE_SIZE = 7
+
+@pytest.fixture
+def admin(seed_catalog, db_path, auth_headers):
+    """
+    Headers of the seeded admin uploader. Every software has documents named "Document 0",
+    "Document 1", ...; doc_type and release_date repeat, and a third of them are NULL.
+    """
+    user_id = seed_catalog(documents=ROWS, patches=ROWS)
+    conn = database.get_db_connection(db_path)
+    try:
+        software_count = conn.execute("SELECT COUNT(*) FROM software").fetchone()[0]
+        conn.executemany( # (software_id, doc_name) is unique, so names repeat across software
+            "UPDATE documents SET doc_name = ?, doc_type = ? WHERE id = ?",
+            [(f"Document {(i - 1) // software_count}", None if i % 3 == 0 else ('Manual', 'Guide')[i % 2], i) for i in range(1, ROWS + 1)]
+        )
+        conn.executemany(
+            "UPDATE patches SET release_date = ? WHERE id = ?",
+            [(None if i % 3 == 0 else f"2024-01-0{1 + i % 4}", i) for i in range(1, ROWS + 1)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    database.table_versions.bump_all()
+    return auth_headers(user_id)
+
+def _walk(client, headers, name, sort_by, sort_order):
+    ids, cursor, pages = [], '', 0
+    while cursor is not None:
+        response = client.get(f"/api/{name}?per_page={PAGE_SIZE}&sort_by={sort_by}&sort_order={sort_order}&cursor={cursor}",
+                              headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+        assert len(body[name]) <= PAGE_SIZE
+        ids += [item['id'] for item in body[name]]
+        cursor, pages = body['next_cursor'], pages + 1
+        assert pages <= ROWS, "cursor pagination did not terminate"
+    return ids
+
+@pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+@pytest.mark.parametrize('name, sort_by', [
+    ('documents', 'doc_type'),
+    ('documents', 'doc_name'),
+    ('patches', 'release_date'),
+])
+def test_cursor_pages_match_the_unpaged_order(client, admin, name, sort_by, sort_order):
+    unpaged = client.get(f"/api/{name}?per_page=100&sort_by={sort_by}&sort_order={sort_order}", headers=admin).get_json()
+    expected = [item['id'] for item in unpaged[name]]
+    assert len(expected) == ROWS
+    assert _walk(client, admin, name, sort_by, sort_order) == expected
@@ -0,0 +1,27 @@
+# tests/test_date_filters.py
+"""Day filters are half-open ranges on the bare column, so their indexes stay usable."""
+import database
+
+def _patch_names(response):
+    assert response.status_code == 200, response.get_json()
+    return sorted(p['patch_name'] for p in response.get_json()['patches'])
+
+def test_patch_release_range_is_inclusive_of_both_days(client, seed_catalog):
+    seed_catalog(patches=10) # release dates 2024-01-01 .. 2024-01-10
+    response = client.get('/api/patches?release_from=2024-01-03&release_to=2024-01-05&per_page=50')
+    assert _patch_names(response) == ['Patch 2', 'Patch 3', 'Patch 4']
+
+def test_patch_release_range_rejects_invalid_dates(client, seed_catalog):
+    seed_catalog(patches=1)
+    assert client.get('/api/patches?release_from=2024-13-01').status_code == 400
+    assert client.get('/api/patches?release_to=yesterday').status_code == 400
+
+def test_patch_release_filter_uses_release_date_index(db_path):
+    conn = database.get_db_connection(db_path)
+    try:
+        details = [row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM patches p WHERE p.release_date >= ? AND p.release_date < ?",
+            ('2024-01-03', '2024-01-06'))]
+    finally:
+        conn.close()
+    assert any('idx_patches_release_date' in d for d in details), details
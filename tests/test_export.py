@@ -0,0 +1,81 @@
+# tests/test_export.py
+"""/api/admin/export/<name>: admin-only, streamed in EXPORT_BATCH_SIZE batches, filtered like the listings."""
+import csv
+import io
+import json
+
+import pytest
+
+import database
+
+ROWS = 23
+BATCH_SIZE = 5
+
+@pytest.fixture
+def admin(app, seed_catalog, db_path, auth_headers, monkeypatch):
+    """Headers of the seeded admin uploader, who can't view document 3 or download document 4."""
+    monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', BATCH_SIZE)
+    user_id = seed_catalog(documents=ROWS, patches=ROWS, links=ROWS)
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.executemany(
+            "INSERT INTO file_permissions (user_id, file_type, file_id, can_view, can_download) VALUES (?, 'document', ?, ?, ?)",
+            [(user_id, 3, 0, 0), (user_id, 4, 1, 0)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return auth_headers(user_id)
+
+def _export(client, headers, name, export_format):
+    response = client.get(f"/api/admin/export/{name}?format={export_format}", headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'] == f'attachment; filename="{name}.{export_format}"'
+    assert response.headers['Cache-Control'] == 'no-store'
+    return response
+
+def test_non_admins_are_rejected(client, admin, db_path, auth_headers):
+    conn = database.get_db_connection(db_path)
+    try:
+        viewer_id = conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('viewer', 'x', 'user')").lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+    assert client.get('/api/admin/export/documents', headers=auth_headers(viewer_id)).status_code == 403
+    assert client.get('/api/admin/export/documents').status_code == 401
+
+@pytest.mark.parametrize('name', ['documents', 'patches', 'links'])
+def test_ndjson_streams_every_row(client, admin, name):
+    response = _export(client, admin, name, 'ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    chunks = [chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.response]
+    records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    expected = ROWS - 1 if name == 'documents' else ROWS
+    assert len(records) == expected
+    assert len([chunk for chunk in chunks if chunk]) == -(-expected // BATCH_SIZE) # One chunk per batch
+    assert [r['id'] for r in records] == sorted(r['id'] for r in records)
+
+@pytest.mark.parametrize('name', ['documents', 'patches', 'links'])
+def test_csv_streams_every_row(client, admin, name):
+    response = _export(client, admin, name, 'csv')
+    assert response.mimetype == 'text/csv'
+    text = response.get_data(as_text=True)
+    rows = list(csv.DictReader(io.StringIO(text)))
+    expected = ROWS - 1 if name == 'documents' else ROWS
+    assert len(rows) == expected
+    assert len(text.splitlines()) == expected + 1 # Header plus one line per record
+    assert 'is_downloadable' in rows[0]
+
+@pytest.mark.parametrize('name', ['documents', 'patches', 'links'])
+def test_export_matches_the_listing(client, admin, name):
+    records = [json.loads(line) for line in _export(client, admin, name, 'ndjson').get_data(as_text=True).splitlines()]
+    listing = client.get(f"/api/{name}?per_page=100&sort_by=id&sort_order=asc", headers=admin).get_json()[name]
+    assert [(r['id'], r['is_downloadable']) for r in records] == [(item['id'], item['is_downloadable']) for item in listing]
+    if name == 'documents':
+        downloadable = {r['id']: r['is_downloadable'] for r in records}
+        assert 3 not in downloadable and downloadable[4] == 0 and downloadable[5] == 1
+
+def test_unknown_export_and_format(client, admin):
+    assert client.get('/api/admin/export/users', headers=admin).status_code == 400
+    assert client.get('/api/admin/export/documents?format=xml', headers=admin).status_code == 400
@@ -0,0 +1,97 @@
+# tests/test_facet_counts.py
+"""
+The incrementally maintained facet_counts (migration 0008): after every kind of write,
+/api/facets must equal a fresh count over all items (database.count_facets_for_ids).
+"""
+import json
+
+import pytest
+
+import app as app_module
+import database
+
+@pytest.fixture
+def admin(seed_catalog, db_path, auth_headers):
+    """Headers for the seeded admin uploader of 6 documents and 6 patches, counted in facet_counts."""
+    user_id = seed_catalog(documents=6, patches=6)
+    conn = database.get_db_connection(db_path)
+    try:
+        database.adjust_facet_counts(conn, 'document', range(1, 7), 1)
+        database.adjust_facet_counts(conn, 'patch', range(1, 7), 1)
+        conn.commit()
+    finally:
+        conn.close()
+    return auth_headers(user_id)
+
+def _expected_facets(db_path):
+    conn = database.get_db_connection(db_path)
+    try:
+        facets = {}
+        for item_type, (response_key, dimension_names) in app_module.FACET_RESPONSE_KEYS.items():
+            table = database.FACET_DIMENSIONS[item_type][0]
+            ids_json = json.dumps([row[0] for row in conn.execute(f"SELECT id FROM {table}")])
+            counts = database.count_facets_for_ids(conn, item_type, ids_json)
+            if item_type == 'patch': # Counted per version, reported per software as well
+                software_of = {str(row[0]): str(row[1]) for row in conn.execute("SELECT id, software_id FROM versions")}
+                counts['software_id'] = {}
+                for version_id, count in counts['version_id'].items():
+                    software_id = software_of[version_id]
+                    counts['software_id'][software_id] = counts['software_id'].get(software_id, 0) + count
+            total = sum(counts[database.FACET_DIMENSIONS[item_type][1][0]].values())
+            facets[response_key] = {'total': total, **{name: counts[dimension] for dimension, name in dimension_names.items()}}
+        return facets
+    finally:
+        conn.close()
+
+def _assert_facets_current(client, db_path):
+    assert client.get('/api/facets').get_json() == _expected_facets(db_path)
+
+def _software_of_documents(db_path):
+    conn = database.get_db_connection(db_path)
+    try:
+        return dict(conn.execute("SELECT id, software_id FROM documents").fetchall())
+    finally:
+        conn.close()
+
+def test_facets_follow_insert_edit_and_delete(client, db_path, admin):
+    _assert_facets_current(client, db_path)
+    created = client.post('/api/admin/documents/add_with_url', headers=admin, json={
+        'software_id': 3, 'doc_name': 'New manual', 'doc_type': 'Guide', 'download_link': 'https://example.com/new'})
+    assert created.status_code == 201, created.get_data(as_text=True)
+    _assert_facets_current(client, db_path)
+
+    edited = client.put(f"/api/admin/documents/{created.get_json()['id']}/edit_url", headers=admin,
+                        json={'software_id': 1, 'doc_type': 'Manual'})
+    assert edited.status_code == 200, edited.get_data(as_text=True)
+    _assert_facets_current(client, db_path)
+
+    assert client.delete('/api/admin/documents/1/delete', headers=admin).status_code == 200
+    _assert_facets_current(client, db_path)
+
+def test_facets_follow_bulk_moves(client, db_path, admin):
+    moved = client.post('/api/bulk/move', headers=admin, json={
+        'item_type': 'document', 'item_ids': [1, 2, 3], 'target_metadata': {'target_software_id': 4}})
+    assert moved.status_code == 200, moved.get_data(as_text=True)
+    _assert_facets_current(client, db_path)
+
+    # Partially successful: the unknown id is skipped, the other move is committed.
+    partial = client.post('/api/bulk/move', headers=admin, json={
+        'item_type': 'document', 'item_ids': [4, 9999], 'target_metadata': {'target_software_id': 5}})
+    assert partial.status_code == 207, partial.get_data(as_text=True)
+    assert partial.get_json()['moved_count'] == 1
+    _assert_facets_current(client, db_path)
+
+def test_failed_bulk_move_leaves_facets_unchanged(client, db_path, admin):
+    conn = database.get_db_connection(db_path)
+    try:
+        # The third UPDATE affects no row, so the whole move is rolled back.
+        conn.execute("CREATE TRIGGER skip_document_6 BEFORE UPDATE ON documents WHEN OLD.id = 6 BEGIN SELECT RAISE(IGNORE); END")
+        conn.commit()
+    finally:
+        conn.close()
+    before = _software_of_documents(db_path)
+    failed = client.post('/api/bulk/move', headers=admin, json={
+        'item_type': 'document', 'item_ids': [4, 5, 6], 'target_metadata': {'target_software_id': 2}})
+    assert failed.get_json()['moved_count'] == 0, failed.get_data(as_text=True)
+    assert _software_of_documents(db_path) == before
+    _assert_facets_current(client, db_path)
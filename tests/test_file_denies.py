@@ -0,0 +1,55 @@
+# tests/test_file_denies.py
+"""
+Listings for a user with thousands of file_permissions deny rows. The deny set is read once
+(EFFECTIVE_PERMISSIONS_SQL, then cached) and passed to the listing queries as JSON id
+arrays, so no listing statement may join file_permissions however large the set gets.
+"""
+import pytest
+
+import app as app_module
+import database
+
+DOCUMENTS = 3000
+HIDDEN = range(1, 2001) # can_view = 0
+NOT_DOWNLOADABLE = range(2001, 2501) # can_view = 1, can_download = 0
+
+@pytest.fixture
+def denied_user(seed_catalog, db_path):
+    """The uploader of DOCUMENTS documents, denied HIDDEN and NOT_DOWNLOADABLE of them."""
+    user_id = seed_catalog(documents=DOCUMENTS)
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.executemany(
+            "INSERT INTO file_permissions (user_id, file_type, file_id, can_view, can_download) VALUES (?, 'document', ?, ?, ?)",
+            [(user_id, file_id, 0, 0) for file_id in HIDDEN] + [(user_id, file_id, 1, 0) for file_id in NOT_DOWNLOADABLE]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    database.table_versions.bump_all()
+    return user_id
+
+def _listing_statements(stats):
+    normalized_deny_sql = " ".join(app_module.EFFECTIVE_PERMISSIONS_SQL.split())
+    return [sql for sql in stats.statement_counts if sql != normalized_deny_sql]
+
+def test_large_deny_set_is_not_joined(client, denied_user, query_budget, auth_headers):
+    headers = auth_headers(denied_user)
+    with query_budget(max_queries=9) as requests:
+        first = client.get('/api/documents?per_page=100&sort_by=id&sort_order=asc', headers=headers).get_json()
+    statements = _listing_statements(requests[0])
+    assert not [sql for sql in statements if 'file_permissions' in sql], statements
+    assert first['total_documents'] == DOCUMENTS - len(HIDDEN)
+    assert [d['id'] for d in first['documents']] == list(range(2001, 2101))
+    assert all(d['is_downloadable'] == 0 for d in first['documents'])
+
+    last = client.get(f"/api/documents?per_page=100&page={first['total_pages']}&sort_by=id&sort_order=asc", headers=headers).get_json()
+    assert [d['id'] for d in last['documents']] == list(range(2901, 3001))
+    assert all(d['is_downloadable'] == 1 for d in last['documents'])
+
+def test_large_deny_set_is_read_once(client, denied_user, query_budget, auth_headers):
+    headers = auth_headers(denied_user)
+    assert client.get('/api/documents', headers=headers).status_code == 200
+    with query_budget(max_queries=9) as requests:
+        assert client.get('/api/documents?page=2', headers=headers).status_code == 200
+    assert not [sql for sql in requests[0].statement_counts if 'file_permissions' in sql]
@@ -0,0 +1,40 @@
+# tests/test_item_change_pruning.py
+"""The daily item_changes prune, on SQLite and (with TEST_DATABASE_URL) PostgreSQL."""
+import database
+import postgres_backend
+import scheduler
+
+# Old, recent, and old again: the last one is the newest entry (the sync token) and stays.
+CHANGES_SQL = """
+    INSERT INTO item_changes (item_type, item_id, change_type, changed_at) VALUES
+        ('document', 1, 'upsert', '2000-01-01 00:00:00'),
+        ('document', 2, 'upsert', strftime('%Y-%m-%d %H:%M:%S', 'now', '+05:30')),
+        ('document', 3, 'delete', '2000-01-02 00:00:00')
+"""
+
+def _remaining(conn):
+    return [row[0] for row in conn.execute("SELECT item_id FROM item_changes ORDER BY id").fetchall()]
+
+def test_prune_bumps_the_item_changes_version(app, db_path):
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.execute(CHANGES_SQL)
+        conn.commit()
+        versions = database.table_versions.snapshot(['item_changes'])
+        with app.app_context():
+            scheduler.prune_item_changes_task()
+        assert _remaining(conn) == [2, 3]
+    finally:
+        conn.close()
+    assert database.table_versions.snapshot(['item_changes']) != versions
+
+def test_prune_on_postgres(app, pg_client, pg_url):
+    conn = postgres_backend.PostgresConnection(pg_url)
+    try:
+        conn.execute(CHANGES_SQL)
+        conn.commit()
+        with app.app_context():
+            scheduler.prune_item_changes_task()
+        assert _remaining(conn) == [2, 3]
+    finally:
+        conn.close()
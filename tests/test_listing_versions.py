@@ -0,0 +1,56 @@
+# tests/test_listing_versions.py
+"""
+Listings read only users.username, so their ETags, cached responses and totals must survive
+writes to the rest of the users row (logins and socket connects set is_online and
+last_seen) and be invalidated by a username change.
+"""
+import pytest
+
+import app as app_module
+import database
+
+LISTINGS = ['/api/documents', '/api/patches', '/api/links', '/api/misc_files']
+
+@pytest.fixture
+def uploader(seed_catalog, db_path):
+    """The seeded uploader, with the password 'secret'."""
+    user_id = seed_catalog(documents=5, patches=5, links=5)
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?",
+                     (app_module.bcrypt.generate_password_hash('secret').decode('utf-8'), user_id))
+        conn.commit()
+    finally:
+        conn.close()
+    database.table_versions.bump_all()
+    return user_id
+
+def _set_online(db_path, user_id):
+    # What the socket connect handler runs
+    conn = database.get_pool(db_path).acquire()
+    try:
+        database.execute_write(conn, "UPDATE users SET is_online = TRUE, last_seen = CURRENT_TIMESTAMP WHERE id = ?",
+                               (user_id,), wait=True)
+    finally:
+        database.get_pool(db_path).release(conn)
+
+@pytest.mark.parametrize('url', LISTINGS)
+def test_presence_updates_keep_cached_listings(client, uploader, db_path, query_budget, url):
+    etag = client.get(url).headers['ETag']
+    users_version = database.table_versions.snapshot(['users'])
+    assert client.post('/api/auth/login', json={'username': 'uploader', 'password': 'secret'}).status_code == 200
+    _set_online(db_path, uploader)
+    assert database.table_versions.snapshot(['users']) != users_version
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    with query_budget(max_queries=0):
+        assert client.get(url).headers['ETag'] == etag
+
+def test_username_change_invalidates_listings(client, uploader, auth_headers):
+    first = client.get('/api/documents')
+    assert {d['uploaded_by_username'] for d in first.get_json()['documents']} == {'uploader'}
+    response = client.put('/api/user/profile/update-username', headers=auth_headers(uploader),
+                          json={'new_username': 'renamed', 'current_password': 'secret'})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    second = client.get('/api/documents', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert {d['uploaded_by_username'] for d in second.get_json()['documents']} == {'renamed'}
@@ -0,0 +1,140 @@
+# tests/test_postgres_backend.py
+"""
+The PostgreSQL backend. The translate_* tests always run; the rest need a server in
+TEST_DATABASE_URL (docker-compose.test.yml) and are skipped without one.
+"""
+import sqlite3
+
+import pytest
+
+import app as app_module
+import database
+import postgres_backend
+from postgres_backend import translate_schema, translate_sql
+
+# --- SQL translation ---
+
+def test_translate_sql_placeholders_and_literals():
+    sql = translate_sql("SELECT * FROM t WHERE a = ? AND b LIKE '%x?%' AND c = :name AND d = TRUE")
+    assert sql == "SELECT * FROM t WHERE a = %s AND b LIKE '%%x?%%' AND c = %(name)s AND d = 1"
+
+def test_translate_sql_inserts_return_id_and_ignore_conflicts():
+    assert translate_sql("INSERT INTO documents (doc_name) VALUES (?)").endswith("VALUES (%s) RETURNING id")
+    assert translate_sql("INSERT OR IGNORE INTO user_favorites (user_id) VALUES (?)") == \
+        "INSERT INTO user_favorites (user_id) VALUES (%s) ON CONFLICT DO NOTHING RETURNING id"
+
+def test_translate_schema_orders_referenced_tables_first():
+    ddl = translate_schema("""
+        -- a user's comments reference users, which is created further down
+        CREATE TABLE comments (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, is_read BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (user_id) REFERENCES users (id));
+        CREATE INDEX idx_comments_user_id ON comments (user_id);
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, is_active BOOLEAN DEFAULT TRUE);
+    """)
+    assert ddl.index("TABLE IF NOT EXISTS users") < ddl.index("TABLE IF NOT EXISTS comments") < ddl.index("CREATE INDEX")
+    assert "user's" not in ddl
+    assert "DEFAULT 0" in ddl and "DEFAULT 1" in ddl
+
+def test_tables_without_id_come_from_the_schema():
+    assert postgres_backend.tables_without_id("""
+        CREATE TABLE a (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER);
+        CREATE TABLE members (group_id INTEGER NOT NULL, user_id INTEGER NOT NULL, -- not an id
+            PRIMARY KEY (group_id, user_id));
+    """) == {'members'}
+    assert {'permission_group_members', 'site_settings', 'schema_version'} <= postgres_backend.TABLES_WITHOUT_ID
+    assert translate_sql("INSERT INTO permission_group_members (group_id, user_id) SELECT ?, u.id FROM users u").endswith("FROM users u")
+
+# --- Against a server ---
+
+def _pg_schema(url):
+    conn = postgres_backend.PostgresConnection(url)
+    try:
+        columns = {}
+        for table, column in conn.execute(
+                "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public'").fetchall():
+            columns.setdefault(table, set()).add(column)
+        indexes = {row[0] for row in conn.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'").fetchall()}
+    finally:
+        conn.close()
+    return columns, {name for name in indexes if name.startswith('idx_')}
+
+def _sqlite_schema(path):
+    conn = database.get_db_connection(path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        columns = {table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")} for table in tables}
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+    finally:
+        conn.close()
+    columns.pop('schema_migration_progress', None) # Resumable-migration bookkeeping, SQLite only
+    return columns, indexes
+
+def test_schema_matches_a_migrated_sqlite_database(pg_url, db_path):
+    assert _pg_schema(pg_url) == _sqlite_schema(db_path)
+
+def test_init_db_records_every_migration(pg_url):
+    conn = postgres_backend.PostgresConnection(pg_url)
+    try:
+        assert postgres_backend.pending_migrations(conn) == []
+        assert conn.execute("SELECT COUNT(*) FROM software").fetchone()[0] == len(database.DEFAULT_SOFTWARE)
+    finally:
+        conn.close()
+
+def test_rows_lastrowid_and_errors(pg_url):
+    conn = postgres_backend.PostgresConnection(pg_url)
+    conn.row_factory = sqlite3.Row
+    try:
+        user_id = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ('pg_user', 'x')).lastrowid
+        row = conn.execute("SELECT id, username, is_active FROM users WHERE id = ?", (user_id,)).fetchone()
+        assert dict(zip(row.keys(), row)) == {'id': user_id, 'username': 'pg_user', 'is_active': 1}
+        assert row['username'] == 'pg_user'
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ('pg_user', 'x'))
+    finally:
+        conn.close()
+
+@pytest.fixture
+def pg_admin(pg_url, auth_headers):
+    conn = postgres_backend.PostgresConnection(pg_url)
+    try:
+        user_id = conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('pg_admin', 'x', 'super_admin')").lastrowid
+        conn.execute("INSERT INTO versions (software_id, version_number) VALUES (2, '1.0')")
+        conn.commit()
+    finally:
+        conn.close()
+    return auth_headers(user_id)
+
+@pytest.mark.parametrize('url', ['/api/documents', '/api/patches', '/api/links', '/api/misc_files', '/api/search?q=vms',
+                                 '/api/software', '/api/versions_for_software?software_id=2', '/api/facets', '/api/sync',
+                                 '/api/notifications', '/api/favorites', '/api/bootstrap'])
+def test_read_endpoints(pg_client, pg_admin, url):
+    response = pg_client.get(url, headers=pg_admin)
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+def test_created_document_is_listed(pg_client, pg_admin):
+    response = pg_client.post('/api/admin/documents/add_with_url', headers=pg_admin,
+                              json={'software_id': 2, 'doc_name': 'PG manual', 'download_link': 'https://example.com/pg'})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    listed = pg_client.get('/api/documents', headers=pg_admin).get_json()['documents']
+    assert [d['doc_name'] for d in listed] == ['PG manual']
+    assert listed[0]['id'] == response.get_json()['id']
+
+def test_permission_group_members(pg_client, pg_admin):
+    group = pg_client.post('/api/superadmin/permission-groups', headers=pg_admin, json={'name': 'PG group'}).get_json()
+    admin_id = group['created_by_user_id']
+    response = pg_client.put(f"/api/superadmin/permission-groups/{group['id']}/members", headers=pg_admin,
+                             json={'user_ids': [admin_id, 999]})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert [member['id'] for member in response.get_json()['members']] == [admin_id]
+
+def test_site_setting_is_inserted_then_updated(pg_client, pg_admin, pg_url):
+    for password in ('First-Passw0rd!', 'Second-Passw0rd!'):
+        response = pg_client.put('/api/superadmin/settings/global-password', headers=pg_admin, json={'new_password': password})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    conn = postgres_backend.PostgresConnection(pg_url)
+    try:
+        rows = conn.execute("SELECT setting_value FROM site_settings WHERE setting_key = 'global_password_hash'").fetchall()
+    finally:
+        conn.close()
+    assert len(rows) == 1
+    assert app_module.bcrypt.check_password_hash(rows[0][0], 'Second-Passw0rd!')
@@ -0,0 +1,58 @@
+# tests/test_query_budgets.py
+"""
+Per-endpoint SQL budgets, measured on a cold request (every test starts with empty caches).
+A new N+1 loop or an extra per-row lookup pushes an endpoint over its budget and fails here.
+"""
+import pytest
+
+import database
+
+LISTINGS = ['/api/documents', '/api/patches', '/api/links', '/api/misc_files']
+
+@pytest.fixture
+def catalog_user(seed_catalog, db_path):
+    """A seeded catalog and its uploader, who has a deny row and a favorite."""
+    user_id = seed_catalog(documents=40, patches=40, links=40)
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.execute("INSERT INTO file_permissions (user_id, file_type, file_id, can_view, can_download) VALUES (?, 'document', 3, 0, 0)", (user_id,))
+        conn.execute("INSERT INTO user_favorites (user_id, item_type, item_id) VALUES (?, 'patch', 2)", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    database.table_versions.bump_all()
+    return user_id
+
+@pytest.mark.parametrize('url', LISTINGS + ['/api/search?q=Patch'])
+def test_anonymous_listing_budget(client, catalog_user, query_budget, url):
+    with query_budget(max_queries=6):
+        assert client.get(f"{url}{'&' if '?' in url else '?'}per_page=40").status_code == 200
+
+@pytest.mark.parametrize('url', LISTINGS + ['/api/search?q=Patch'])
+def test_logged_in_listing_budget(client, catalog_user, query_budget, auth_headers, url):
+    # Includes the user lookup, the deny set and the favorites fingerprint.
+    with query_budget(max_queries=9):
+        assert client.get(url, headers=auth_headers(catalog_user)).status_code == 200
+
+def test_cursor_pages_skip_the_count(client, catalog_user, query_budget):
+    first = client.get('/api/patches?cursor=&per_page=10').get_json()
+    with query_budget(max_queries=1) as requests:
+        assert client.get(f"/api/patches?cursor={first['next_cursor']}&per_page=10").status_code == 200
+    assert not any('COUNT(' in sql for sql in requests[0].statement_counts)
+
+def test_cached_listing_runs_no_view_queries(client, catalog_user, query_budget):
+    client.get('/api/documents')
+    with query_budget(max_queries=0):
+        response = client.get('/api/documents')
+    # versioned_response still opens the connection, so g.query_stats exists but is empty.
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('url, budget', [
+    ('/api/notifications', 4),
+    ('/api/favorites', 4),
+    ('/api/bootstrap', 8),
+    ('/api/admin/dashboard-stats', 40),
+])
+def test_user_endpoint_budget(client, catalog_user, query_budget, auth_headers, url, budget):
+    with query_budget(max_queries=budget):
+        assert client.get(url, headers=auth_headers(catalog_user)).status_code == 200
@@ -0,0 +1,29 @@
+# tests/test_schema_migrations.py
+"""
+schema.sql must describe the fully migrated schema: a fresh install (and every PostgreSQL
+database, which never runs migrations/) is built from it alone.
+"""
+import sqlite3
+
+import database
+import schema_migrations
+
+def _objects(path):
+    conn = sqlite3.connect(path)
+    try:
+        objects = {(row[0], row[1]) for row in conn.execute(
+            "SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' AND name NOT LIKE 'schema_%'")}
+        columns = {name: [row[1] for row in conn.execute(f"PRAGMA table_info({name})")] for kind, name in objects if kind == 'table'}
+    finally:
+        conn.close()
+    return objects, columns
+
+def test_schema_sql_includes_every_migration(tmp_path):
+    fresh, migrated = str(tmp_path / 'fresh.db'), str(tmp_path / 'migrated.db')
+    database.init_db(fresh)
+    database.init_db(migrated)
+    assert schema_migrations.run_migrations(migrated, log=lambda message: None) == len(schema_migrations.load_migrations())
+    fresh_objects, fresh_columns = _objects(fresh)
+    migrated_objects, migrated_columns = _objects(migrated)
+    assert fresh_objects == migrated_objects
+    assert {t: sorted(c) for t, c in fresh_columns.items()} == {t: sorted(c) for t, c in migrated_columns.items()}
@@ -0,0 +1,97 @@
+# tests/test_sync.py
+"""/api/sync: change tokens, upserts and deletes, resets and paging over item_changes (migration 0009)."""
+import pytest
+
+import database
+
+@pytest.fixture
+def admin(seed_catalog, auth_headers):
+    """(user_id, headers) of the seeded admin uploader of 3 documents."""
+    user_id = seed_catalog(documents=3)
+    return user_id, auth_headers(user_id)
+
+def _sync(client, headers, since=None):
+    response = client.get('/api/sync' + (f"?since={since}" if since is not None else ''), headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+def _add_document(client, headers, name):
+    response = client.post('/api/admin/documents/add_with_url', headers=headers,
+                           json={'software_id': 1, 'doc_name': name, 'download_link': f"https://example.com/{name}"})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()['id']
+
+def test_first_call_resets_with_a_token(client, admin):
+    _, headers = admin
+    first = _sync(client, headers)
+    assert first['reset'] is True and first['has_more'] is False
+    assert first['token'].startswith('0.')
+    assert all(changes == {'upserted': [], 'deleted': []} for changes in first['changes'].values())
+    # Nothing changed since: an empty delta with the same token
+    again = _sync(client, headers, first['token'])
+    assert again['reset'] is False and again['token'] == first['token']
+
+def test_inserts_updates_and_deletes(client, admin):
+    _, headers = admin
+    token = _sync(client, headers)['token']
+    new_id = _add_document(client, headers, 'Added')
+    delta = _sync(client, headers, token)
+    assert [d['id'] for d in delta['changes']['documents']['upserted']] == [new_id]
+    assert delta['changes']['documents']['upserted'][0]['doc_name'] == 'Added'
+
+    token = delta['token']
+    assert client.put(f"/api/admin/documents/{new_id}/edit_url", headers=headers, json={'doc_name': 'Renamed'}).status_code == 200
+    assert client.delete('/api/admin/documents/2/delete', headers=headers).status_code == 200
+    delta = _sync(client, headers, token)
+    assert [d['doc_name'] for d in delta['changes']['documents']['upserted']] == ['Renamed']
+    assert delta['changes']['documents']['deleted'] == [2]
+    assert delta['changes']['patches'] == {'upserted': [], 'deleted': []}
+
+def test_new_deny_forces_a_reset(client, admin, db_path):
+    user_id, headers = admin
+    _add_document(client, headers, 'Visible')
+    token = _sync(client, headers)['token']
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.execute("INSERT INTO file_permissions (user_id, file_type, file_id, can_view, can_download) VALUES (?, 'document', 1, 0, 0)", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    delta = _sync(client, headers, token)
+    assert delta['reset'] is True
+    assert delta['token'].split('.')[1] != token.split('.')[1]
+
+def test_token_older_than_the_pruned_log_resets(client, admin, db_path):
+    _, headers = admin
+    token = _sync(client, headers)['token']
+    for name in ('one', 'two', 'three'):
+        _add_document(client, headers, name)
+    conn = database.get_db_connection(db_path)
+    try:
+        conn.execute("DELETE FROM item_changes WHERE id < (SELECT MAX(id) FROM item_changes)")
+        conn.commit()
+    finally:
+        conn.close()
+    delta = _sync(client, headers, token)
+    assert delta['reset'] is True
+    assert _sync(client, headers, delta['token'])['reset'] is False
+
+def test_has_more_pages_through_the_log(client, app, admin, monkeypatch):
+    _, headers = admin
+    monkeypatch.setitem(app.config, 'SYNC_MAX_CHANGES', 2)
+    token = _sync(client, headers)['token']
+    added = [_add_document(client, headers, f"Paged {i}") for i in range(5)]
+    seen, pages = [], 0
+    while True:
+        delta = _sync(client, headers, token)
+        assert delta['reset'] is False
+        seen += [d['id'] for d in delta['changes']['documents']['upserted']]
+        token, pages = delta['token'], pages + 1
+        if not delta['has_more']:
+            break
+    assert seen == added and pages == 3
+
+@pytest.mark.parametrize('since', ['abc', '-1', '-5.abcdef', '1x.abc'])
+def test_malformed_tokens_are_rejected(client, admin, since):
+    _, headers = admin
+    assert client.get(f"/api/sync?since={since}", headers=headers).status_code == 400